@@ -0,0 +1,208 @@
+"""
+    Local index of artists we have already seen on setlist.fm
+"""
+import os
+import json
+import time
+import bisect
+import threading
+
+
+def normalize_name(name):
+    """
+    Returns the form of an artist name used for lookups
+    """
+    return " ".join(name.casefold().split())
+
+
+class ArtistIndex:
+    """
+    A sorted, persistent index of artists, filled from artist searches and
+    setlist payloads, so repeat lookups skip the setlist.fm API
+
+    Artists and picks expire ttl seconds after we last saw or made them, so a
+    name is searched again now and then and new artists sharing it turn up.
+
+    Attributes
+    ----------
+    path: str
+        the JSON file the index is saved to, or None to keep it in memory
+    ttl: float
+        how many seconds artists and picks are trusted for
+    artists: dict
+        maps each mbid to the artist's name, disambiguation, mbid and the time
+        we last saw it
+    keys: list
+        sorted (normalized name, mbid) pairs for exact and prefix lookups
+    choices: dict
+        maps a normalized search name to the mbid the user picked for it and
+        when
+    """
+    ttl = 30 * 24 * 60 * 60
+
+    def __init__(self, path=None, ttl=None):
+        self.path = path
+        if ttl is not None:
+            self.ttl = ttl
+        self.artists = {}
+        self.keys = []
+        self.choices = {}
+        self.lock = threading.Lock()
+
+        if path and os.path.exists(path):
+            with open(path, "r") as index_file:
+                data = json.load(index_file)
+            for artist in data.get("artists", []):
+                self.add(artist, artist.get("seen", 0))
+            # Picks saved before they were timed are treated as expired
+            self.choices = {name: choice for name, choice in data.get("choices", {}).items()
+                            if isinstance(choice, dict)}
+
+    def is_fresh(self, stamp):
+        """
+        Returns whether something stamped at the given time has not expired
+        """
+        return time.time() - stamp < self.ttl
+
+    def add(self, artist, seen=None):
+        """
+        Adds, updates or refreshes an artist. Returns True if the index
+        changed.
+
+        Params
+        ------
+        artist: dict
+            An artist as returned by setlist.fm, with name, mbid and optionally
+            disambiguation
+        seen: float
+            When the artist was seen, now by default
+        """
+        mbid = artist.get("mbid")
+        if not mbid or not artist.get("name"):
+            return False
+        entry = {
+            "name": artist["name"],
+            "disambiguation": artist.get("disambiguation", ""),
+            "mbid": mbid,
+            "seen": time.time() if seen is None else seen
+        }
+
+        with self.lock:
+            old = self.artists.get(mbid)
+            if old and old["name"] == entry["name"]:
+                # Setlist payloads may lack a disambiguation a search gave us
+                if not entry["disambiguation"]:
+                    entry["disambiguation"] = old["disambiguation"]
+                # Only refresh the time once it is half way to expiring, so
+                # every setlist page does not rewrite the file
+                if entry["disambiguation"] == old["disambiguation"] and \
+                   entry["seen"] - old["seen"] < self.ttl / 2:
+                    return False
+                self.artists[mbid] = entry
+                return True
+            if old:
+                self.keys.remove((normalize_name(old["name"]), mbid))
+            self.artists[mbid] = entry
+            bisect.insort(self.keys, (normalize_name(entry["name"]), mbid))
+        return True
+
+    def add_all(self, artists):
+        """
+        Adds several artists. Returns True if the index changed.
+        """
+        changed = False
+        for artist in artists:
+            changed = self.add(artist) or changed
+        return changed
+
+    def add_from_setlists(self, setlists):
+        """
+        Adds the artist of every setlist. Returns True if the index changed.
+        """
+        return self.add_all(setlist["artist"] for setlist in setlists)
+
+    def exact(self, name):
+        """
+        Returns every artist whose name matches exactly, ignoring case,
+        expired or not
+        """
+        key = normalize_name(name)
+        with self.lock:
+            start = bisect.bisect_left(self.keys, (key, ""))
+            matches = []
+            for entry_key, mbid in self.keys[start:]:
+                if entry_key != key:
+                    break
+                matches.append(self.artists[mbid])
+        return matches
+
+    def prefix(self, text, limit=10):
+        """
+        Returns up to limit artists whose name starts with the given text
+        """
+        key = normalize_name(text)
+        with self.lock:
+            start = bisect.bisect_left(self.keys, (key, ""))
+            matches = []
+            for entry_key, mbid in self.keys[start:]:
+                if not entry_key.startswith(key) or len(matches) >= limit:
+                    break
+                matches.append(self.artists[mbid])
+        return matches
+
+    def lookup(self, name):
+        """
+        Returns the candidates for a searched name, or None if the name is
+        unknown or any of its artists expired and we need to ask the API. A
+        name the user recently picked an artist for returns just that artist.
+        """
+        chosen = self.chosen(name)
+        if chosen is not None:
+            return [chosen]
+        matches = self.exact(name)
+        if not matches or not all(self.is_fresh(artist["seen"]) for artist in matches):
+            return None
+        return matches
+
+    def chosen(self, name):
+        """
+        Returns the artist the user recently picked for a searched name, or
+        None
+        """
+        choice = self.choices.get(normalize_name(name))
+        if choice is None or not self.is_fresh(choice["at"]):
+            return None
+        return self.artists.get(choice["mbid"])
+
+    def remember_choice(self, name, mbid):
+        """
+        Records which artist the user meant when searching for a name
+        """
+        with self.lock:
+            self.choices[normalize_name(name)] = {"mbid": mbid, "at": time.time()}
+
+    def forget_choice(self, name):
+        """
+        Drops the artist picked for a searched name, so it is asked again
+        """
+        with self.lock:
+            self.choices.pop(normalize_name(name), None)
+
+    def save(self):
+        """
+        Writes the index to its file
+        """
+        if not self.path:
+            return
+        with self.lock:
+            data = {
+                "artists": list(self.artists.values()),
+                "choices": dict(self.choices)
+            }
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{self.path}.{os.getpid()}-{threading.get_ident()}.tmp"
+        with open(temp_path, "w") as index_file:
+            json.dump(data, index_file)
+        os.replace(temp_path, self.path)
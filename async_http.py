@@ -0,0 +1,335 @@
+"""
+    A small asyncio HTTP/1.1 client for the async wrappers
+"""
+import ssl
+import time
+import zlib
+import asyncio
+import datetime
+from urllib.parse import urlsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import default_headers, get_encoding_from_headers
+from requests.exceptions import (RequestException, ConnectionError, ConnectTimeout,
+                                 ReadTimeout, ContentDecodingError, SSLError)
+
+# Methods that are safe to send again when a kept-alive connection turns out
+# to have been closed by the server
+IDEMPOTENT = ("GET", "HEAD", "PUT", "DELETE", "OPTIONS")
+
+
+class StaleConnection(Exception):
+    """
+    Raised when a reused connection closes before the response starts
+    """
+
+
+class Connection:
+    """
+    One open connection to a host
+
+    Attributes
+    ----------
+    reader: asyncio.StreamReader
+        reads from the connection
+    writer: asyncio.StreamWriter
+        writes to the connection
+    reused: bool
+        whether the connection already carried a request
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.reused = False
+
+    def usable(self):
+        """
+        Returns whether the connection can carry another request
+        """
+        return not self.writer.is_closing() and not self.reader.at_eof()
+
+    def close(self):
+        """
+        Closes the connection without waiting for it
+        """
+        self.writer.close()
+
+
+class AsyncSession:
+    """
+    Sends requests from an event loop, keeping connections to each host open
+    between requests
+
+    Requests are prepared by requests itself, so urls, params, form bodies
+    and headers are encoded exactly as a requests.Session would, and answers
+    come back as requests.Response objects. A session belongs to the event
+    loop it is first used on.
+
+    Attributes
+    ----------
+    pool_size: int
+        the most idle connections kept open per host
+    idle: dict
+        the idle connections by (scheme, host, port)
+    ssl_context: ssl.SSLContext
+        the context used for https connections
+    """
+    # Read responses in blocks of this many bytes when they have no length
+    read_size = 65536
+
+    def __init__(self, pool_size=8, ssl_context=None):
+        self.pool_size = pool_size
+        self.idle = {}
+        self.ssl_context = ssl_context or ssl.create_default_context()
+        self.headers = default_headers()
+        # Only offer the encodings decode can undo
+        self.headers["Accept-Encoding"] = "gzip, deflate"
+
+    def prepare(self, method, url, params=None, data=None, headers=None):
+        """
+        Returns the prepared request, with our default headers added
+        """
+        merged = CaseInsensitiveDict(self.headers)
+        merged.update(headers or {})
+        return requests.Request(method, url, params=params, data=data,
+                                headers=merged).prepare()
+
+    async def request(self, method, url, params=None, data=None, headers=None,
+                      timeout=None):
+        """
+        Sends a request and returns the response with its body read
+
+        Params
+        ------
+        method: str
+            The HTTP method
+        url: str
+            The request url
+        params: dict
+            Query parameters to add to the url
+        data: dict or str
+            The request body; a dict is form encoded
+        headers: dict
+            The request headers
+        timeout: float
+            The most seconds to wait for the whole exchange
+        """
+        prepared = self.prepare(method, url, params, data, headers)
+        parts = urlsplit(prepared.url)
+        https = parts.scheme == "https"
+        key = (parts.scheme, parts.hostname, parts.port or (443 if https else 80))
+
+        start = time.monotonic()
+        while True:
+            connection = await self.connect(key, timeout)
+            remaining = None if timeout is None else \
+                max(timeout - (time.monotonic() - start), 0.0)
+            try:
+                status, reason, response_headers, body, keep = await asyncio.wait_for(
+                    self.exchange(connection, prepared, parts), remaining)
+            except StaleConnection:
+                connection.close()
+                if prepared.method in IDEMPOTENT:
+                    continue
+                raise ConnectionError("Connection closed before the response",
+                                      request=prepared)
+            except RequestException:
+                connection.close()
+                raise
+            except asyncio.TimeoutError:
+                connection.close()
+                raise ReadTimeout(f"No response from {parts.hostname} in {timeout}s",
+                                  request=prepared)
+            except ssl.SSLError as err:
+                connection.close()
+                raise SSLError(err, request=prepared)
+            except (OSError, asyncio.IncompleteReadError, ValueError) as err:
+                connection.close()
+                raise ConnectionError(err, request=prepared)
+            except BaseException:
+                # Cancelled mid-exchange, e.g. a hedge we no longer need
+                connection.close()
+                raise
+            break
+
+        if keep:
+            self.release(key, connection)
+        else:
+            connection.close()
+
+        response = requests.Response()
+        response.status_code = status
+        response.reason = reason
+        response.headers = response_headers
+        response.url = prepared.url
+        response.request = prepared
+        response.encoding = get_encoding_from_headers(response_headers)
+        response.elapsed = datetime.timedelta(seconds=time.monotonic() - start)
+        response._content = self.decode(body, response_headers, prepared)
+        response._content_consumed = True
+        return response
+
+    async def connect(self, key, timeout):
+        """
+        Returns an idle connection to a host, or opens a new one
+        """
+        pool = self.idle.get(key, [])
+        while pool:
+            connection = pool.pop()
+            if connection.usable():
+                connection.reused = True
+                return connection
+            connection.close()
+
+        scheme, host, port = key
+        context = self.ssl_context if scheme == "https" else None
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(host, port, ssl=context,
+                                        server_hostname=host if context else None),
+                timeout)
+        except asyncio.TimeoutError:
+            raise ConnectTimeout(f"Could not connect to {host} in {timeout}s")
+        except ssl.SSLError as err:
+            raise SSLError(err)
+        except OSError as err:
+            raise ConnectionError(err)
+        return Connection(reader, writer)
+
+    def release(self, key, connection):
+        """
+        Keeps a connection for the next request to its host
+        """
+        pool = self.idle.setdefault(key, [])
+        if len(pool) < self.pool_size and connection.usable():
+            pool.append(connection)
+        else:
+            connection.close()
+
+    async def exchange(self, connection, prepared, parts):
+        """
+        Writes a request and reads the response. Returns the status, reason,
+        headers, raw body and whether the connection may be reused.
+        """
+        body = prepared.body or b""
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        target = parts.path or "/"
+        if parts.query:
+            target = f"{target}?{parts.query}"
+
+        lines = [f"{prepared.method} {target} HTTP/1.1", f"Host: {parts.netloc}"]
+        lines.extend(f"{name}: {value}" for name, value in prepared.headers.items()
+                     if name.lower() not in ("host", "content-length"))
+        if body or prepared.method in ("POST", "PUT", "PATCH"):
+            lines.append(f"Content-Length: {len(body)}")
+        connection.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await connection.writer.drain()
+
+        reader = connection.reader
+        status_line = await reader.readline()
+        if not status_line:
+            if connection.reused:
+                raise StaleConnection()
+            raise ConnectionError("Connection closed before the response")
+        version, status, reason = self.parse_status(status_line)
+        headers = await self.read_headers(reader)
+        # Interim responses such as 100 Continue come before the real one
+        while 100 <= status < 200:
+            version, status, reason = self.parse_status(await reader.readline())
+            headers = await self.read_headers(reader)
+
+        keep = "close" not in headers.get("Connection", "").lower() and \
+            (version == "HTTP/1.1" or "keep-alive" in headers.get("Connection", "").lower())
+        if prepared.method == "HEAD" or status in (204, 304):
+            raw = b""
+        elif "chunked" in headers.get("Transfer-Encoding", "").lower():
+            raw = await self.read_chunked(reader)
+        elif "Content-Length" in headers:
+            raw = await reader.readexactly(int(headers["Content-Length"]))
+        else:
+            # The body runs until the server closes the connection
+            blocks = []
+            block = await reader.read(self.read_size)
+            while block:
+                blocks.append(block)
+                block = await reader.read(self.read_size)
+            raw = b"".join(blocks)
+            keep = False
+        return status, reason, headers, raw, keep
+
+    def parse_status(self, status_line):
+        """
+        Returns the version, status code and reason of a status line
+        """
+        parts = status_line.decode("latin-1").rstrip("\r\n").split(" ", 2)
+        if len(parts) < 2 or not parts[0].startswith("HTTP/"):
+            raise ValueError(f"Bad status line {status_line!r}")
+        return parts[0], int(parts[1]), parts[2] if len(parts) > 2 else ""
+
+    async def read_headers(self, reader):
+        """
+        Reads header lines up to the blank line ending them
+        """
+        headers = CaseInsensitiveDict()
+        while True:
+            line = await reader.readline()
+            if not line:
+                raise asyncio.IncompleteReadError(b"", None)
+            line = line.decode("latin-1").rstrip("\r\n")
+            if not line:
+                return headers
+            name, _, value = line.partition(":")
+            value = value.strip()
+            if name in headers:
+                value = f"{headers[name]}, {value}"
+            headers[name] = value
+
+    async def read_chunked(self, reader):
+        """
+        Reads a body sent with chunked transfer encoding
+        """
+        blocks = []
+        while True:
+            size_line = await reader.readline()
+            if not size_line:
+                raise asyncio.IncompleteReadError(b"", None)
+            size = int(size_line.split(b";", 1)[0].strip(), 16)
+            if size == 0:
+                break
+            blocks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+        # Skip any trailers
+        while (await reader.readline()).strip():
+            pass
+        return b"".join(blocks)
+
+    def decode(self, raw, headers, prepared):
+        """
+        Undoes the response's content encoding
+        """
+        encoding = headers.get("Content-Encoding", "").lower().strip()
+        if not raw or encoding in ("", "identity"):
+            return raw
+        try:
+            if encoding == "gzip":
+                return zlib.decompress(raw, 16 + zlib.MAX_WBITS)
+            if encoding == "deflate":
+                try:
+                    return zlib.decompress(raw)
+                except zlib.error:
+                    return zlib.decompress(raw, -zlib.MAX_WBITS)
+        except zlib.error as err:
+            raise ContentDecodingError(err, request=prepared)
+        return raw
+
+    async def close(self):
+        """
+        Closes every idle connection
+        """
+        for pool in self.idle.values():
+            for connection in pool:
+                connection.close()
+        self.idle = {}
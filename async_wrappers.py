@@ -0,0 +1,513 @@
+"""
+    asyncio clients for setlist.fm and Spotify
+"""
+import json
+import asyncio
+
+from requests.exceptions import HTTPError, RequestException
+
+from async_http import AsyncSession
+from request_guard import get_guard
+from setlist_fm_wrapper import SetlistFmWrapper, SetlistSearch, parse_event_date
+from spotify_wrapper import SpotifyWrapper, SongResolution, TrackRanker
+
+
+class AsyncClient:
+    """
+    Sends the requests of a wrapper from an event loop
+
+    The wrapper keeps our state and builds every request (headers, urls,
+    caches and the shared rate limiter), while the requests themselves go
+    out over one AsyncSession, which keeps connections to each host open.
+    At most concurrency requests are in flight at once, the rest wait on a
+    semaphore. Requests still pass through the guard for their host, so a
+    slow GET may be hedged by a duplicate and a failing host is cut off as
+    with the blocking wrappers.
+
+    A client belongs to the event loop it is first used on.
+
+    Attributes
+    ----------
+    client: SetlistFmWrapper or SpotifyWrapper
+        the wrapper holding our state
+    concurrency: int
+        the highest number of requests in flight at once, hedges aside
+    session: AsyncSession
+        keeps connections to the APIs open between requests
+    semaphore: asyncio.Semaphore
+        bounds the requests in flight
+    """
+
+    def __init__(self, client, concurrency):
+        self.client = client
+        self.concurrency = concurrency
+        self.session = AsyncSession(pool_size=concurrency)
+        self.semaphore = asyncio.Semaphore(concurrency)
+
+    async def send_request(self, method, url, **kwargs):
+        """
+        Sends a request through the guard for its host, see
+        SetlistFmWrapper.send_request
+        """
+        kwargs.setdefault("timeout", self.client.request_timeout)
+        guard = get_guard(url)
+        for _ in range(self.client.max_retries + 1):
+            # Waiting for a slot is not the host being slow, so it is kept
+            # out of the guard's latencies
+            async with self.semaphore:
+                response = await guard.send_async(
+                    method, url, lambda: self.send_once(method, url, **kwargs),
+                    kwargs, self.client.limiter, self.client.hedge_requests)
+            if response.status_code != 429:
+                break
+        return response
+
+    async def send_once(self, method, url, **kwargs):
+        """
+        Sends a request and reports its outcome to the shared rate limiter.
+        The caller must already have taken a token.
+        """
+        with self.client.count_lock:
+            self.client.request_count = self.client.request_count + 1
+        response = await self.session.request(method, url, **kwargs)
+        self.client.limiter.report(response.status_code,
+                                   response.headers.get("Retry-After"))
+        return response
+
+    async def close(self):
+        """
+        Closes the pooled connections
+        """
+        await self.session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+class AsyncSetlistFmWrapper(AsyncClient):
+    """
+    An asyncio client for setlist.fm with the same searches as
+    SetlistFmWrapper
+    """
+
+    def __init__(self, api_key, concurrency=8, limiter=None, artist_index=None,
+                 setlist_store=None):
+        super().__init__(SetlistFmWrapper(api_key, limiter, artist_index,
+                                          setlist_store),
+                         concurrency)
+
+    async def search_artists(self, name):
+        """
+        Returns the artists matching a name, or None if the request failed
+        """
+        client = self.client
+        try:
+            response = await self.send_request("GET", f"{client.get_artist_endpoint()}" +
+                                               "?" + f"{client.get_params_artist_name(name)}",
+                                               headers=client.get_header())
+            response.raise_for_status()
+            resp = response.json()
+        except HTTPError as http_err:
+            print(f"HTTP Error occurred: {http_err}")
+            return None
+        except (RequestException, ValueError) as err:
+            print(f"Request failed: {err}")
+            return None
+        return client.read_artists(resp)
+
+    async def fetch_setlist_page(self, artist_name, artist_id, city, state_name,
+                                 state_abbr, tour_name, venue_name, year, page_num):
+        """
+        Returns one parsed page of setlists, or None if the request failed
+        """
+        client = self.client
+        url = client.get_setlist_page_url(artist_name, artist_id, city, state_name,
+                                          state_abbr, tour_name, venue_name, year,
+                                          page_num)
+        headers = client.get_header()
+        try:
+            response = await self.send_request("GET", url, headers=headers)
+            response.raise_for_status()
+            page = client.read_setlist_page(url, headers, response)
+        except HTTPError as err:
+            print(f"HTTP Error occurred: {err}")
+            return None
+        except (RequestException, ValueError) as err:
+            print(f"Request failed: {err}")
+            return None
+
+        if client.artist_index is not None and \
+           client.artist_index.add_from_setlists(page["setlist"]):
+            client.artist_index.save()
+        return page
+
+    async def search_setlists(self, artist_name, artist_id, city, state_name,
+                              state_abbr, tour_name, venue_name, year):
+        """
+        Requests every page of setlists matching the given filters. Once the
+        first page tells us the total, the rest are requested concurrently.
+        """
+        filters = (artist_name, artist_id, city, state_name, state_abbr,
+                   tour_name, venue_name, year)
+        result = SetlistSearch()
+        first = await self.fetch_setlist_page(*filters, 1)
+        if first is None:
+            return result
+        result.total = first["total"]
+        result.setlists.extend(first["setlist"])
+
+        per_page = first.get("itemsPerPage", 20) or 20
+        last_page = -(-result.total // per_page)
+        pages = await asyncio.gather(*[self.fetch_setlist_page(*filters, page_num)
+                                       for page_num in range(2, last_page + 1)])
+        for page in pages:
+            if page is not None:
+                result.setlists.extend(page["setlist"])
+        result.pages = max(last_page, 1)
+        return result
+
+    async def search_setlists_by_date(self, artist_name, artist_id, city, state_name,
+                                      state_abbr, tour_name, venue_name, show_date):
+        """
+        Finds the sets played on a given date by bisecting over the pages, see
+        SetlistFmWrapper.search_setlists_by_date
+        """
+        if isinstance(show_date, str):
+            show_date = parse_event_date(show_date)
+
+        store = self.client.setlist_store
+        if store is not None and artist_id and \
+           not (city or state_name or state_abbr or tour_name or venue_name):
+            stored = store.on_date(artist_id, show_date)
+            if stored is not None:
+                return SetlistSearch(len(stored), stored, 0)
+
+        result = SetlistSearch()
+        pages = {}
+
+        async def fetch(page_num):
+            if page_num not in pages:
+                pages[page_num] = await self.fetch_setlist_page(
+                    artist_name, artist_id, city, state_name, state_abbr,
+                    tour_name, venue_name, show_date.year, page_num)
+                result.pages = len(pages)
+            return pages[page_num]
+
+        first_page = await fetch(1)
+        if first_page is None or first_page["total"] == 0:
+            return result
+        result.total = first_page["total"]
+        per_page = first_page.get("itemsPerPage", 20) or 20
+        last_page = -(-first_page["total"] // per_page)
+        low = 1
+        high = last_page
+        found = None
+
+        while low <= high:
+            middle = (low + high) // 2
+            page = await fetch(middle)
+            if page is None or not page["first_date"]:
+                return result
+            if show_date > parse_event_date(page["first_date"]):
+                high = middle - 1       # newer shows are on earlier pages
+            elif show_date < parse_event_date(page["last_date"]):
+                low = middle + 1
+            else:
+                found = middle
+                break
+
+        if found is None:
+            return result
+
+        # Shows on the same day may spill over onto the neighbouring pages
+        page_nums = [found]
+        if found > 1 and parse_event_date(pages[found]["first_date"]) == show_date:
+            page_nums.insert(0, found - 1)
+        if found < last_page and parse_event_date(pages[found]["last_date"]) == show_date:
+            page_nums.append(found + 1)
+
+        for page in await asyncio.gather(*[fetch(page_num) for page_num in page_nums]):
+            if page is None:
+                continue
+            for setlist in page["setlist"]:
+                if parse_event_date(setlist["eventDate"]) == show_date:
+                    result.setlists.append(setlist)
+
+        return result
+
+
+class AsyncSpotifyWrapper(AsyncClient):
+    """
+    An asyncio client for Spotify with the same operations as SpotifyWrapper
+
+    The user must already be authorized (see SpotifyWrapper.authorize_user,
+    on client) before creating playlists; searches fall back to a client
+    credentials token.
+    """
+
+    def __init__(self, client_id, client_secret, concurrency=8, limiter=None,
+                 market=None, song_cache=None):
+        super().__init__(SpotifyWrapper(client_id, client_secret, limiter, market,
+                                        song_cache),
+                         concurrency)
+        self.token_lock = asyncio.Lock()
+
+    async def gen_cc_access_token(self):
+        """
+        Gets a client credentials token. Returns True on success.
+        """
+        client = self.client
+        response = await self.send_request("POST", client.token_url,
+                                           data=client.get_token_params(),
+                                           headers=client.get_token_header())
+        if response.status_code in range(200, 299):
+            client.set_token(response.json(), False)
+            return True
+        return False
+
+    async def ensure_token(self):
+        """
+        Gets a client credentials token if we have no valid token, making sure
+        concurrent callers only request one
+        """
+        async with self.token_lock:
+            if self.client.token_expired():
+                await self.gen_cc_access_token()
+
+    async def search_tracks(self, song_name, artist_name, tier, offset=0, market=None):
+        """
+        Runs one search query and returns the matching tracks, or None if the
+        request failed
+        """
+        client = self.client
+        search_url = "https://api.spotify.com/v1/search"
+        try:
+            response = await self.send_request(
+                "GET", search_url,
+                params=client.get_search_params(song_name, artist_name, tier, offset,
+                                                market),
+                headers=client.get_search_header())
+        except RequestException as err:
+            print(f"Search for {song_name} by {artist_name} failed: {err}")
+            return None
+
+        status = response.status_code
+        if status not in range(200, 299):
+            print(f"Error {status}. Search for {song_name} by {artist_name} "
+                  + "unsuccessful.")
+            return None
+
+        return response.json()
+
+    async def search_song(self, song_name, artist_name, newest=None, market=None):
+        """
+        Searches for a song and returns its uri and the tier that found it,
+        (None, None) if there is no match, or None if a request failed. See
+        SpotifyWrapper.search_song.
+        """
+        client = self.client
+        if newest is None:
+            newest = client.choose_new_version
+        try:
+            await self.ensure_token()
+        except RequestException as err:
+            print(f"Could not get a Spotify token: {err}")
+            return None
+
+        fallback = None
+        fallback_tier = None
+        res = None
+
+        for tier in client.search_tiers:
+            ranker = TrackRanker(song_name, artist_name, newest)
+            for page_num in range(client.search_pages):
+                res = await self.search_tracks(song_name, artist_name, tier,
+                                               page_num * client.search_limit, market)
+                if res is None:
+                    return None
+                ranker.add(res["tracks"]["items"])
+                if ranker.decided() or not ranker.found_artist() or \
+                   not res["tracks"].get("next"):
+                    break
+
+            if ranker.best is not None:
+                return ranker.best["uri"], tier
+
+            if ranker.loose is not None and fallback is None:
+                fallback = ranker.loose["uri"]
+                fallback_tier = f"{tier} (artist only)"
+
+        if fallback is not None:
+            return fallback, fallback_tier
+
+        client.log_json(song_name, artist_name, res)
+        print(f"Could not find {song_name} by {artist_name}. " +
+              "It may be missing from Spotify")
+        return None, None
+
+    async def try_resolve_song(self, song_name, artist_name, newest=None, market=None):
+        """
+        Like resolve_song, but returns None if a request failed
+        """
+        client = self.client
+        if newest is None:
+            newest = client.choose_new_version
+        market = market or client.market
+
+        if client.song_cache is not None:
+            cached = client.song_cache.get(artist_name, song_name, market, newest)
+            if cached is not None:
+                return cached
+
+        found = await self.search_song(song_name, artist_name, newest, market)
+        if found is None:
+            return None
+
+        if client.song_cache is not None:
+            client.song_cache.put(artist_name, song_name, market, newest, *found)
+        return found
+
+    async def resolve_song(self, song_name, artist_name, newest=None, market=None):
+        """
+        Returns the uri and matching search tier of a song, or (None, None)
+        """
+        return await self.try_resolve_song(song_name, artist_name, newest, market) or \
+            (None, None)
+
+    async def resolve_songs(self, artist_name, song_list, newest=None, market=None):
+        """
+        Searches for all given songs concurrently and returns a SongResolution
+        with the songs in setlist order
+        """
+        matches = await asyncio.gather(*[self.resolve_song(song, artist_name, newest,
+                                                           market)
+                                         for song in song_list])
+
+        result = SongResolution()
+        for song, (uri, tier) in zip(song_list, matches):
+            result.match_tiers[song] = tier
+            if uri is None:
+                result.missing = result.missing + 1
+            else:
+                result.song_ids.append(uri)
+
+        if self.client.song_cache is not None:
+            self.client.song_cache.save()
+        return result
+
+    async def get_user_id(self):
+        """
+        Returns the authorized user's id
+        """
+        response = await self.send_request("GET", "https://api.spotify.com/v1/me",
+                                           headers=self.client.get_user_headers())
+        status = response.status_code
+        if status not in range(200, 299):
+            print(f"{status} Trouble finding user. Make sure you've added an access token.")
+            return ""
+        return response.json()["id"]
+
+    async def fetch_tracks(self, song_ids):
+        """
+        Returns the track objects for the given uris, in order, or None if a
+        request failed. The batches are looked up concurrently.
+        """
+        client = self.client
+        tracks_url = "https://api.spotify.com/v1/tracks"
+        batches = [song_ids[start:start + client.tracks_batch_size]
+                   for start in range(0, len(song_ids), client.tracks_batch_size)]
+        # Every lookup finishes before we look at any failure
+        responses = await asyncio.gather(*[
+            self.send_request("GET", tracks_url, params=client.get_tracks_params(batch),
+                              headers=client.get_search_header())
+            for batch in batches], return_exceptions=True)
+
+        tracks = []
+        for response in responses:
+            if isinstance(response, RequestException):
+                print(f"Could not check songs: {response}")
+                return None
+            if isinstance(response, BaseException):
+                raise response
+            status = response.status_code
+            if status not in range(200, 299):
+                print(f"Error {status}. Could not check songs.")
+                return None
+            tracks.extend(response.json()["tracks"])
+        return tracks
+
+    async def validate_tracks(self, song_ids, song_names=None):
+        """
+        Returns the given uris with unplayable tracks swapped for playable
+        releases, see SpotifyWrapper.validate_tracks
+        """
+        tracks = await self.fetch_tracks(song_ids)
+        if tracks is None:
+            return song_ids
+        return self.client.filter_tracks(tracks, song_ids, song_names)
+
+    async def create_empty_playlist(self, name, desc):
+        """
+        Creates a new, empty playlist and returns its id and url, or None if
+        it could not be made
+        """
+        client = self.client
+        try:
+            user_id = await self.get_user_id()
+            response = await self.send_request(
+                "POST", f"https://api.spotify.com/v1/users/{user_id}/playlists",
+                data=json.dumps(client.get_creation_body(name, desc)),
+                headers=client.get_creation_header())
+        except RequestException as err:
+            print(f"Could not make playlist: {err}")
+            return None
+
+        if response.status_code not in range(200, 299):
+            print("Could not make playlist")
+            return None
+
+        res = response.json()
+        return res["id"], res['external_urls']['spotify']
+
+    async def add_playlist_tracks(self, playlist_id, song_ids):
+        """
+        Adds up to playlist_chunk_size songs to a playlist. Returns True on
+        success.
+        """
+        update_url = f"https://api.spotify.com/v1/playlists/{playlist_id}/tracks"
+        try:
+            response = await self.send_request(
+                "POST", update_url, data=json.dumps(song_ids),
+                headers=self.client.get_populate_header(playlist_id))
+        except RequestException as err:
+            print(f"Could not add songs to the playlist: {err}")
+            return False
+        return response.status_code in range(200, 299)
+
+    async def create_playlist(self, name, desc, song_ids, song_names=None):
+        """
+        Creates a playlist holding the playable songs of song_ids. Returns
+        True on success.
+        """
+        if song_ids:
+            song_ids = await self.validate_tracks(song_ids, song_names)
+        if len(song_ids) < 1:
+            print("Setlist is empty.")
+            return False
+
+        created = await self.create_empty_playlist(name, desc)
+        if created is None:
+            return False
+        playlist_id, playlist_url = created
+
+        # Chunks are added in order so the playlist keeps the setlist order
+        for chunk in self.client.chunk_songs(song_ids):
+            if not await self.add_playlist_tracks(playlist_id, chunk):
+                print("Could not add every song to the playlist")
+                break
+
+        print(f"Playlist created! Available at: {playlist_url}")
+        return True
@@ -0,0 +1,181 @@
+"""
+    Cache warming for followed artists
+"""
+import sys
+import json
+import time
+import datetime
+
+import spotify_wrapper
+import setlist_fm_wrapper
+from setlist_fm_wrapper import parse_event_date, setlist_songs
+from caches import SongCache, SetlistStore
+
+
+class CacheWarmer:
+    """
+    Pulls new setlists for a watchlist of artists into the setlist store and
+    resolves their songs into the song cache, so playlists for recent shows
+    can be made without waiting on either API
+
+    Attributes
+    ----------
+    setlist: SetlistFmWrapper
+        the wrapper used to fetch setlists, with the store attached
+    spotify: SpotifyWrapper
+        the wrapper used to resolve songs, with the song cache attached
+    watchlist: list
+        the MusicBrainz ids of the artists to keep warm
+    budget: int
+        the most requests a single warming run may send to both APIs
+    first_sync_pages: int
+        how many pages of history to pull for an artist we have not synced
+    lookback_days: int
+        how far before the last sync to look again for setlists that were
+        filled in late
+    newest: bool
+        whether to resolve songs to their newest releases
+    """
+
+    def __init__(self, setlist, spotify, watchlist, budget=300,
+                 first_sync_pages=3, lookback_days=7, newest=False):
+        self.setlist = setlist
+        self.spotify = spotify
+        self.watchlist = watchlist
+        self.budget = budget
+        self.first_sync_pages = first_sync_pages
+        self.lookback_days = lookback_days
+        self.newest = newest
+        self.start_count = 0
+
+    def spent(self):
+        """
+        Returns the number of requests sent during the current run
+        """
+        return self.setlist.request_count + self.spotify.request_count - self.start_count
+
+    def remaining(self):
+        """
+        Returns the number of requests left in the current run's budget
+        """
+        return self.budget - self.spent()
+
+    def sync_artist(self, mbid):
+        """
+        Fetches an artist's setlists newer than the last sync (less the
+        lookback) and returns the ones we did not have before
+        """
+        store = self.setlist.setlist_store
+        data = store.load(mbid) or {"setlists": {}, "covered_since": "", "synced_on": ""}
+        stop_before = None
+        if data["synced_on"]:
+            stop_before = parse_event_date(data["synced_on"]) - \
+                          datetime.timedelta(days=self.lookback_days)
+
+        new = []
+        complete = False
+        oldest = ""
+        page_num = 1
+        while self.remaining() > 0:
+            page = self.setlist.fetch_setlist_page("", mbid, "", "", "", "", "", "",
+                                                   page_num)
+            if page is None:
+                break
+            for setlist in page["setlist"]:
+                if data["setlists"].get(setlist["id"]) != setlist:
+                    new.append(setlist)
+                data["setlists"][setlist["id"]] = setlist
+            oldest = page["last_date"] or oldest
+
+            per_page = page.get("itemsPerPage", 20) or 20
+            if not page["last_date"] or page_num * per_page >= page["total"]:
+                complete = True
+            elif stop_before is not None:
+                complete = parse_event_date(page["last_date"]) < stop_before
+            else:
+                complete = page_num >= self.first_sync_pages
+            if complete:
+                break
+            page_num = page_num + 1
+
+        # Only vouch for dates we know we have every setlist for
+        if complete:
+            if not data["covered_since"] and oldest:
+                # The oldest date may continue on the next page
+                next_day = parse_event_date(oldest) + datetime.timedelta(days=1)
+                data["covered_since"] = next_day.strftime("%d-%m-%Y")
+            data["synced_on"] = datetime.date.today().strftime("%d-%m-%Y")
+        store.save(mbid, data)
+        return new
+
+    def warm_songs(self, setlists):
+        """
+        Resolves every song of the given setlists into the song cache while the
+        budget allows. Returns the number of songs resolved.
+        """
+        resolved = 0
+        for setlist in setlists:
+            artist_name = setlist["artist"]["name"]
+            for song in setlist_songs(setlist):
+                # A song may take a few pages of searches per tier
+                if self.remaining() < len(self.spotify.search_tiers) * \
+                                      self.spotify.search_pages:
+                    return resolved
+                self.spotify.resolve_song(song, artist_name, self.newest)
+                resolved = resolved + 1
+        return resolved
+
+    def run_once(self):
+        """
+        Warms every artist on the watchlist within one budget
+        """
+        self.start_count = self.setlist.request_count + self.spotify.request_count
+        new = []
+        for mbid in self.watchlist:
+            if self.remaining() <= 0:
+                print("Request budget used up, stopping early")
+                break
+            artist_new = self.sync_artist(mbid)
+            print(f"{mbid}: {len(artist_new)} new or updated setlists")
+            new.extend(artist_new)
+
+        resolved = self.warm_songs(new)
+        if self.spotify.song_cache is not None:
+            self.spotify.song_cache.save()
+        print(f"Resolved {resolved} songs using {self.spent()} requests")
+
+    def run_forever(self, interval):
+        """
+        Warms the caches every interval seconds
+        """
+        while True:
+            self.run_once()
+            time.sleep(interval)
+
+
+def main():
+    """
+    Runs the warmer with the settings in config.json. Pass --once to warm a
+    single time, e.g. from cron.
+    """
+    with open("config.json", mode="r") as conf:
+        data = json.load(conf)
+
+    warming = data.get("warming", {})
+    setlist = setlist_fm_wrapper.SetlistFmWrapper(
+        data["setlist"]["api_key"], setlist_store=SetlistStore("cache/setlists"))
+    spotify = spotify_wrapper.SpotifyWrapper(
+        data["spotify"]["client_id"], data["spotify"]["client_secret"],
+        market=data["spotify"].get("market"), song_cache=SongCache("cache/songs.json"))
+
+    warmer = CacheWarmer(setlist, spotify, warming.get("watchlist", []),
+                         budget=warming.get("budget", 300),
+                         newest=warming.get("newest_versions", False))
+    if "--once" in sys.argv:
+        warmer.run_once()
+    else:
+        warmer.run_forever(warming.get("interval_minutes", 60) * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+    Persistent caches for resolved songs and recent setlists
+"""
+import os
+import json
+import time
+import threading
+
+from setlist_fm_wrapper import parse_event_date
+from setlist_corpus import write_corpus, SetlistCorpus
+
+
+def write_json(path, data):
+    """
+    Atomically replaces a JSON file
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    with open(temp_path, "w") as json_file:
+        json.dump(data, json_file)
+    os.replace(temp_path, path)
+
+
+class SongCache:
+    """
+    Remembers which Spotify track each setlist song resolved to
+
+    Attributes
+    ----------
+    path: str
+        the JSON file the cache is saved to, or None to keep it in memory
+    entries: dict
+        maps a song key to its uri, match tier and when it was resolved
+    miss_ttl: float
+        the number of seconds before we search again for a song we could not
+        find
+    """
+    miss_ttl = 7 * 24 * 3600
+
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {}
+        self.lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, "r") as cache_file:
+                self.entries = json.load(cache_file)
+
+    def key(self, artist_name, song_name, market, newest):
+        """
+        Returns the key a song is cached under
+        """
+        return "|".join([artist_name.casefold(), song_name.casefold(),
+                         market or "", "new" if newest else "orig"])
+
+    def get(self, artist_name, song_name, market, newest):
+        """
+        Returns the cached (uri, tier) for a song, or None if we need to search
+        """
+        with self.lock:
+            entry = self.entries.get(self.key(artist_name, song_name, market, newest))
+        if entry is None:
+            return None
+        if entry["uri"] is None and time.time() - entry["time"] > self.miss_ttl:
+            return None
+        return entry["uri"], entry["tier"]
+
+    def put(self, artist_name, song_name, market, newest, uri, tier):
+        """
+        Caches the result of resolving a song, found or not
+        """
+        with self.lock:
+            self.entries[self.key(artist_name, song_name, market, newest)] = {
+                "uri": uri,
+                "tier": tier,
+                "time": time.time()
+            }
+
+    def save(self):
+        """
+        Writes the cache to its file
+        """
+        if not self.path:
+            return
+        with self.lock:
+            data = dict(self.entries)
+        write_json(self.path, data)
+
+
+class SetlistStore:
+    """
+    Keeps the recent setlists of followed artists on disk, one file per artist
+
+    Each artist's file records the setlists we have and covered_since, the
+    date from which we are sure to have every non-empty setlist up to the
+    last sync. Saving also writes the setlists to a corpus beside it, which
+    lookups by date read without parsing the JSON.
+
+    Attributes
+    ----------
+    directory: str
+        the directory holding a JSON file and a corpus per artist mbid
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+
+    def path(self, mbid):
+        """
+        Returns the file for an artist
+        """
+        return os.path.join(self.directory, f"{mbid}.json")
+
+    def corpus_path(self, mbid):
+        """
+        Returns the corpus file for an artist
+        """
+        return os.path.join(self.directory, f"{mbid}.corpus")
+
+    def load(self, mbid):
+        """
+        Returns an artist's stored data, or None if we have never synced them
+        """
+        path = self.path(mbid)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r") as store_file:
+            return json.load(store_file)
+
+    def save(self, mbid, data):
+        """
+        Writes an artist's data
+        """
+        with self.lock:
+            write_json(self.path(mbid), data)
+            write_corpus(self.corpus_path(mbid), data["setlists"].values(),
+                         data.get("covered_since") or None)
+
+    def on_date(self, mbid, show_date):
+        """
+        Returns the stored setlists played on a date, or None if the store
+        does not cover that date or has nothing for it, so the caller should
+        ask the API
+
+        Params
+        ------
+        mbid: str
+            The artist's MusicBrainz id
+        show_date: date
+            The date of the show
+        """
+        path = self.corpus_path(mbid)
+        if not os.path.exists(path):
+            # Stores saved before corpora were written
+            data = self.load(mbid)
+            if data is None or not data.get("covered_since"):
+                return None
+            if show_date < parse_event_date(data["covered_since"]):
+                return None
+            matches = [setlist for setlist in data["setlists"].values()
+                       if parse_event_date(setlist["eventDate"]) == show_date]
+            return matches or None
+
+        with SetlistCorpus(path) as corpus:
+            if not corpus.covered_since or \
+               show_date < parse_event_date(corpus.covered_since):
+                return None
+            matches = list(corpus.setlists(corpus.find(date=show_date)))
+        return matches or None
@@ -0,0 +1,236 @@
+"""
+    Checkpointed playlist jobs that survive interrupted runs
+"""
+import os
+import json
+import time
+import uuid
+
+
+class PlaylistJob:
+    """
+    One playlist being made, with every stage that has finished recorded in a
+    JSON lines journal
+
+    The journal holds one event per line: the setlist that was chosen, each
+    song that was resolved, the checked list of tracks to add, the playlist
+    once it exists, each chunk of songs added to it and finally that the job
+    is done, or was abandoned by the user. Events are synced to disk as they
+    happen, so a resumed job repeats no request that completed.
+
+    Attributes
+    ----------
+    path: str
+        the journal file
+    setlist: dict
+        the chosen setlist's artist, songs, playlist name and description
+    songs: dict
+        maps a song's position in the setlist to its (uri, tier)
+    tracks: list
+        the uris to add once checked by SpotifyWrapper.validate_tracks, or
+        None
+    playlist: dict
+        the created playlist's id and url, or None
+    chunks: set
+        the positions of the chunks of songs already added to the playlist
+    done: bool
+        whether the job has finished or was abandoned
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.setlist = None
+        self.songs = {}
+        self.tracks = None
+        self.playlist = None
+        self.chunks = set()
+        self.done = False
+        if os.path.exists(path):
+            self.load()
+
+    @property
+    def job_id(self):
+        """
+        Returns the job's id, the name of its journal
+        """
+        return os.path.splitext(os.path.basename(self.path))[0]
+
+    def load(self):
+        """
+        Replays the journal into the job's state
+        """
+        with open(self.path, "r", encoding="utf-8") as journal:
+            for line in journal:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    # A crash mid-write leaves at most one torn line at the end
+                    break
+                self.apply(event)
+
+    def apply(self, event):
+        """
+        Updates the job's state with one event
+        """
+        stage = event["stage"]
+        if stage == "setlist":
+            self.setlist = event
+        elif stage == "song":
+            self.songs[event["index"]] = (event["uri"], event["tier"])
+        elif stage == "tracks":
+            self.tracks = event["uris"]
+        elif stage == "playlist":
+            self.playlist = event
+        elif stage == "chunk":
+            self.chunks.add(event["index"])
+        elif stage in ("done", "abandoned"):
+            self.done = True
+
+    def record(self, stage, **fields):
+        """
+        Appends an event to the journal and waits for it to reach the disk
+        """
+        event = dict(fields, stage=stage)
+        with open(self.path, "a", encoding="utf-8") as journal:
+            journal.write(json.dumps(event) + "\n")
+            journal.flush()
+            os.fsync(journal.fileno())
+        self.apply(event)
+
+    def describe(self):
+        """
+        Returns a one line summary of the job and how far it got
+        """
+        if self.setlist is None:
+            return f"{self.job_id}: not started"
+        if self.playlist is not None:
+            progress = f"{len(self.chunks)} chunks added"
+        else:
+            progress = f"{len(self.songs)} of {len(self.setlist['songs'])} songs found"
+        return f"{self.setlist['name']} ({progress})"
+
+
+class JobJournal:
+    """
+    The directory of playlist job journals
+
+    Attributes
+    ----------
+    directory: str
+        where each job's journal is kept
+    """
+
+    def __init__(self, directory="jobs"):
+        self.directory = directory
+
+    def start(self, artist, songs, name, desc, newest):
+        """
+        Creates a job for a chosen setlist and returns it
+
+        Params
+        ------
+        artist: str
+            The artist's name
+        songs: list
+            The names of the songs played, in setlist order
+        name: str
+            The name for the playlist
+        desc: str
+            The description for the playlist
+        newest: bool
+            Whether to prefer the newest versions of songs
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        job_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        job = PlaylistJob(os.path.join(self.directory, f"{job_id}.jsonl"))
+        job.record("setlist", artist=artist, songs=songs, name=name,
+                   description=desc, newest=newest)
+        return job
+
+    def unfinished(self):
+        """
+        Returns the jobs that have not finished, oldest first
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        jobs = [PlaylistJob(os.path.join(self.directory, file_name))
+                for file_name in sorted(os.listdir(self.directory))
+                if file_name.endswith(".jsonl")]
+        return [job for job in jobs if job.setlist is not None and not job.done]
+
+
+def run_job(job, spotify):
+    """
+    Runs a playlist job from wherever it stopped. Returns True once the job is
+    done, or False if a request failed and the job should be resumed later.
+
+    Params
+    ------
+    job: PlaylistJob
+        The job to run
+    spotify: SpotifyWrapper
+        The wrapper used to resolve songs and make the playlist. The user is
+        asked to authorize it before the playlist is created.
+    """
+    setlist = job.setlist
+
+    # Resolve the songs we have not resolved yet
+    for index, song in enumerate(setlist["songs"]):
+        if index in job.songs:
+            continue
+        found = spotify.try_resolve_song(song, setlist["artist"], setlist["newest"])
+        if found is None:
+            print(f"Could not search for {song}. Run again to resume.")
+            if spotify.song_cache is not None:
+                spotify.song_cache.save()
+            return False
+        job.record("song", index=index, name=song, uri=found[0], tier=found[1])
+    if spotify.song_cache is not None:
+        spotify.song_cache.save()
+
+    found = [index for index in sorted(job.songs) if job.songs[index][0] is not None]
+    song_ids = [job.songs[index][0] for index in found]
+    missing = len(setlist["songs"]) - len(song_ids)
+    if missing > 0:
+        print(f"Could not find matches for {missing} songs. " +
+              "They may not be on Spotify or may be covers.")
+
+    # Avoid empty playlists
+    if not song_ids:
+        print("Setlist is empty.")
+        job.record("done")
+        return True
+
+    # Searches only need a client token, so the user is asked last
+    if not spotify.authorize_user():
+        print("Run again to resume once Spotify is authorized.")
+        return False
+
+    # The checked list fixes the chunks, so it is kept for resumed runs
+    if job.tracks is None and job.playlist is None:
+        names = [setlist["songs"][index] for index in found]
+        job.record("tracks", uris=spotify.validate_tracks(song_ids, names))
+    if job.tracks is not None:
+        song_ids = job.tracks
+    if not song_ids:
+        print("None of the songs can be played.")
+        job.record("done")
+        return True
+
+    if job.playlist is None:
+        created = spotify.create_empty_playlist(setlist["name"], setlist["description"])
+        if created is None:
+            return False
+        job.record("playlist", id=created[0], url=created[1])
+
+    for index, chunk in enumerate(spotify.chunk_songs(song_ids)):
+        if index in job.chunks:
+            continue
+        if not spotify.add_playlist_tracks(job.playlist["id"], chunk):
+            print("Could not add every song to the playlist. Run again to resume.")
+            return False
+        job.record("chunk", index=index)
+
+    job.record("done")
+    print(f"Playlist created! Available at: {job.playlist['url']}")
+    return True
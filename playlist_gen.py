@@ -2,26 +2,148 @@
     Playlist gen
 """
 import json
+from concurrent.futures import ThreadPoolExecutor
 #from time import sleep
 
-import spotify_wrapper
-import setlist_fm_wrapper
+from job_journal import JobJournal, run_job
 
 
-def prompt_choice(max_val):
+def prompt_choice(max_val, min_val=1):
     """
     Prompts a user to choose an input displayed in the terminal
     """
-    choice = 0
-    while choice not in range(1, max_val+1):
+    choice = min_val - 1
+    while choice not in range(min_val, max_val+1):
         try:
-            choice = int(input(f"Please enter candidate choice (1 - {max_val}): "))
-            if choice not in range(1, max_val+1):
+            choice = int(input(f"Please enter candidate choice ({min_val} - {max_val}): "))
+            if choice not in range(min_val, max_val+1):
                 print("Please enter a number within the range")
         except ValueError:
             print("Please enter an integer")
     return choice
 
+def find_artist(setlist, artist_name):
+    """
+    Searches for an artist and has the user settle on one. Returns False if
+    no artist was found.
+    """
+    found = setlist.get_artist_by_name(artist_name)
+
+    # An artist settled from the cache, picked before or the only one we knew
+    # by that name, can be changed
+    if found and setlist.artist_from_cache and setlist.get_artist_name() != "":
+        artist = setlist.possible_artists[0]
+        dis = f" ({artist['disambiguation']})" if artist.get("disambiguation") else ""
+        reason = "picked before" if setlist.artist_picked_before else "the only one we know"
+        again = input(f"Using {artist['name']}{dis}, {reason} for {artist_name}. " +
+                      "Press Enter to continue or c to choose again: ").strip()
+        if again == "c":
+            found = setlist.get_artist_by_name(artist_name, refresh=True)
+
+    while found and setlist.get_artist_name() == "":
+        artist_matches = setlist.get_num_candidates()
+        if artist_matches == 0:
+            found = False
+            break
+
+        # Multiple candidates
+        print(f"There are several matches for {artist_name}. " +
+              "Please choose which one is correct.")
+
+        # Prompt for choice, letting the user look past the artists we knew
+        setlist.print_candidates()
+        if setlist.artist_from_cache:
+            print("   0: None of these, search setlist.fm again")
+            artist_choice = prompt_choice(artist_matches, 0)
+        else:
+            artist_choice = prompt_choice(artist_matches)
+
+        if artist_choice == 0:
+            found = setlist.get_artist_by_name(artist_name, refresh=True)
+        else:
+            # Pick our artist
+            setlist.pick_artist(artist_choice)
+
+    if not found:
+        print("Could not find the artist. Make sure spelling is correct")
+        suggestions = setlist.suggest_artists(artist_name)
+        if suggestions:
+            print("Artists you have searched for before: " + ", ".join(suggestions))
+    return found
+
+def suggest_setlists(setlist, songs, top_k=5):
+    """
+    Prints the candidate setlists that best match a list of remembered songs,
+    numbered as in the full candidate list
+    """
+    from setlist_fm_wrapper import setlist_details
+    from setlist_similarity import SetlistSimilarityIndex
+
+    index = SetlistSimilarityIndex(setlist.possible_sets)
+    matches = index.query(songs, top_k)
+    if not matches:
+        print("None of those songs were played at these shows.")
+        return
+
+    print("Closest matches:")
+    for score, position in matches:
+        details = setlist_details(setlist.possible_sets[position])
+        print(f" {position + 1 : >3}: {details['venue']} in {details['location']} " +
+              f"on {details['date']} ({score:.0%} of your songs)")
+
+def resume_jobs(journal, clients):
+    """
+    Offers to finish the playlist jobs an earlier run left unfinished. clients
+    is the future from make_clients.
+    """
+    for job in journal.unfinished():
+        choice = input(f"Resume unfinished playlist {job.describe()}? " +
+                       "(y to resume, n to ask again next time, " +
+                       "d to discard): ").strip().lower()
+        if choice.startswith("y"):
+            run_job(job, clients.result()[1])
+        elif choice.startswith("d"):
+            job.record("abandoned")
+
+def make_clients(setlist_key, spotify_id, spotify_secret, spotify_market,
+                 transport_conf):
+    """
+    Sets up both wrappers and starts getting a Spotify token. Importing the
+    HTTP stack and loading our caches takes a moment, so main runs this while
+    the user answers the first prompts.
+    """
+    import spotify_wrapper
+    import setlist_fm_wrapper
+    from artist_index import ArtistIndex
+    from caches import SongCache, SetlistStore
+
+    # Recorded and replayed runs skip the on-disk caches so every request
+    # goes through the cassette
+    if transport_conf is None:
+        artist_index = ArtistIndex("cache/artists.json")
+        setlist_store = SetlistStore("cache/setlists")
+        song_cache = SongCache("cache/songs.json")
+    else:
+        artist_index = ArtistIndex()
+        setlist_store = None
+        song_cache = SongCache()
+
+    setlist = setlist_fm_wrapper.SetlistFmWrapper(setlist_key, artist_index=artist_index,
+                                                  setlist_store=setlist_store)
+    spotify = spotify_wrapper.SpotifyWrapper(spotify_id, spotify_secret,
+                                             market=spotify_market,
+                                             song_cache=song_cache)
+
+    if transport_conf is not None:
+        import transport
+        transport.install([setlist, spotify], transport_conf["mode"],
+                          transport_conf["cassette"], transport_conf.get("latency", 0.0))
+
+    # Searching only needs a client token, which is ready by the time we have
+    # a setlist; the user is asked to authorize us once a playlist is made
+    spotify.prefetch_token()
+    return setlist, spotify
+
 def main():
     """
         main for making playlists
@@ -34,27 +156,21 @@ def main():
     setlist_key = data["setlist"]["api_key"]
     spotify_id = data["spotify"]["client_id"]
     spotify_secret = data["spotify"]["client_secret"]
+    spotify_market = data["spotify"].get("market")
+    transport_conf = data.get("transport")
 
     conf.close()
 
-    # Initialize setlist object
-    fm_caller = setlist_fm_wrapper
-    setlist = fm_caller.SetlistFmWrapper(setlist_key)
-
-    # Initialize Spotify object
-    print("Generating access token for Spotify... ")
+    # Setting up the wrappers runs in the background so the first prompt
+    # appears right away
+    executor = ThreadPoolExecutor(max_workers=1)
+    clients = executor.submit(make_clients, setlist_key, spotify_id, spotify_secret,
+                              spotify_market, transport_conf)
+    executor.shutdown(wait=False)
 
-    spot = spotify_wrapper
-    spotify = spot.SpotifyWrapper(spotify_id, spotify_secret)
-    token_generated = spotify.gen_auth_token()
-
-    # Ensure we got a token
-    if not token_generated:
-        raise Exception("Could not get an access token for Spotify." +
-                        "Please make sure your client id and client " +
-                        "secret are correct.")
-
-    print("Done.")
+    # Pick up playlists an interrupted run did not finish
+    journal = JobJournal("jobs")
+    resume_jobs(journal, clients)
 
     make_playlist = "y"
     while make_playlist == "y":
@@ -64,27 +180,13 @@ def main():
 
         while artist_name == "":
             artist_name = input("Enter the name of the artist: ")
-
-            found = setlist.get_artist_by_name(artist_name)
+            setlist, spotify = clients.result()
 
             # No matches
-            if not found:
-                print("Could not find the artist. Make sure spelling is correct")
+            if not find_artist(setlist, artist_name):
                 artist_name = ""
-            elif setlist.get_artist_name() == "":
-                # Multiple candidates
-                print(f"There are several matches for {artist_name}. " +
-                      "Please choose which one is correct.")
-                artist_matches = setlist.get_num_candidates()
-
-                # Prompt for choice
-                setlist.print_candidates()
-                artist_choice = prompt_choice(artist_matches)
-
-                # Pick our artist
-                setlist.pick_artist(artist_choice)
             else:
-                print(f"Found setlists for {artist_name}")
+                print(f"Found setlists for {setlist.get_artist_name()}")
 
         # prompt for new song versions
         new_version_choice = ""
@@ -106,8 +208,23 @@ def main():
         year = ""
 
         while setlist_count < 1 or not choice_available:
-            # Prompt for other limiters
-            year = input("Enter the year of the show (recommended): ").strip()
+            # A known date lets us jump straight to the right page
+            show_date = input("Enter the date of the show if you know it " +
+                              "(dd-mm-yyyy, press Enter to skip): ").strip()
+            if show_date != "":
+                from setlist_fm_wrapper import parse_event_date
+                try:
+                    parse_event_date(show_date)
+                except ValueError:
+                    print("Please enter the date as dd-mm-yyyy")
+                    continue
+                year = ""
+            else:
+                # Prompt for other limiters
+                year = input("Enter the year of the show (recommended, " +
+                             "e.g. 2019 or 2016-2019): ").strip()
+            # Place filters take several values separated by commas ("\,"
+            # for a comma in a name); tour and venue names are taken whole
             city_name = input("Enter the name of the city " +
                               "(press Enter to skip): ").strip()
             state_name = input("Enter the name of the state " +
@@ -121,18 +238,33 @@ def main():
 
             # Gather setlists
             print(f"Searching for setlists for {artist_name}... ", end="")
-            setlist.get_all_setlists(artist_name, "", city_name,
-                                     state_name, state_abbr, tour_name,
-                                     venue_name, year)
+            if show_date != "":
+                setlist.find_setlists_by_date(artist_name, "", city_name,
+                                              state_name, state_abbr, tour_name,
+                                              venue_name, show_date)
+            else:
+                setlist.get_all_setlists(artist_name, "", city_name,
+                                         state_name, state_abbr, tour_name,
+                                         venue_name, year)
             print("Done")
 
             # Narrow setlist choice
             setlist_count = setlist.get_num_setlists()
-
+            if setlist_count < 1:
+                print("No matching setlists found. Try different filters.")
+                continue
 
             print("Possible sets to choose from: " + f"{setlist_count}")
             setlist.print_setlists_sparse()
 
+            # Long lists are easier to search by the songs the user remembers
+            if setlist_count > 10:
+                remembered = input("Remember some songs from the show? Enter them " +
+                                   "separated by commas to find it " +
+                                   "(press Enter to skip): ").strip()
+                if remembered != "":
+                    suggest_setlists(setlist, remembered.split(","))
+
             while not choice_available:
                 try:
                     choice = input("Is your show listed? y/n: ").strip().lower()[0]
@@ -148,17 +280,14 @@ def main():
         # print("Set found. Printing setlist...")
         setlist.print_setlist()
 
-        # Create playlist and populate it
-        song_list = setlist.get_setlist_songs()
+        # Create playlist and populate it, recording each step so an
+        # interrupted run can resume
+        job = journal.start(artist_name, setlist.get_setlist_songs(),
+                            setlist.setlist_name_to_string(),
+                            setlist.setlist_info_to_string(),
+                            spotify.choose_new_version)
         print("Finding songs...")
-        missing = spotify.find_songs(artist_name, song_list)
-
-        if missing > 0:
-            print(f"Could not find matches for {missing} songs. " +
-                  "They may not be on Spotify or may be covers.")
-
-        spotify.create_playlist(setlist.setlist_name_to_string(),
-                                setlist.setlist_info_to_string())
+        run_job(job, spotify)
 
         make_playlist = input("Would you like to make another playlist (y/n): ").strip()[0]
 
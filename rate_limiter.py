@@ -0,0 +1,218 @@
+"""
+    Host-wide API rate limiting
+"""
+import os
+import json
+import time
+import asyncio
+import hashlib
+import tempfile
+import threading
+from email.utils import parsedate_to_datetime
+
+try:
+    import fcntl
+except ImportError:     # Windows has no flock, fall back to a per-process bucket
+    fcntl = None
+
+
+def parse_retry_after(value):
+    """
+    Returns the number of seconds requested by a Retry-After header
+
+    Params
+    ------
+    value: str
+        The header value, either a number of seconds or an HTTP date
+    """
+    if not value:
+        return 0.0
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return max(retry_at.timestamp() - time.time(), 0.0)
+
+
+class SharedTokenBucket:
+    """
+    A token bucket whose state lives in a small file so every process on the
+    host using the same API key draws from the same budget
+
+    The rate adapts to what the API tells us: a 429 cuts the rate and blocks
+    all callers for the Retry-After period, while a run of successful
+    requests slowly raises it back towards max_rate.
+
+    Attributes
+    ----------
+    name: str
+        the name of the bucket, used for the state file
+    max_rate: float
+        the highest number of requests per second we will allow
+    min_rate: float
+        the lowest the rate may be cut to after repeated 429s
+    capacity: float
+        the number of requests that may be sent back to back
+    state_path: str
+        the file holding the shared bucket state
+    """
+    backoff_factor = 0.7    # multiply the rate by this on a 429
+    recovery_step = 0.05    # fraction of max_rate regained per success streak
+    recovery_streak = 20    # successes needed before raising the rate
+
+    def __init__(self, name, max_rate, capacity=1.0, min_rate=None,
+                 state_dir=None):
+        self.name = name
+        self.max_rate = float(max_rate)
+        self.min_rate = float(min_rate) if min_rate else self.max_rate / 10
+        self.capacity = float(capacity)
+        self.local_state = None
+        self.local_lock = threading.Lock()
+
+        if state_dir is None:
+            state_dir = os.path.join(tempfile.gettempdir(), "live-playlist")
+        os.makedirs(state_dir, exist_ok=True)
+        self.state_path = os.path.join(state_dir, f"{name}.bucket")
+
+    @classmethod
+    def for_key(cls, service, key, max_rate, **kwargs):
+        """
+        Returns the bucket shared by everyone using the given API key
+
+        Params
+        ------
+        service: str
+            A short name for the API, e.g. "setlistfm"
+        key: str
+            The API key or client id; only a hash of it is written to disk
+        max_rate: float
+            The documented request limit per second
+        """
+        digest = hashlib.sha1(f"{key}".encode()).hexdigest()[:12]
+        return cls(f"{service}-{digest}", max_rate, **kwargs)
+
+    def new_state(self, now):
+        """
+        Returns the state of a bucket that has never been used
+        """
+        return {
+            "tokens": self.capacity,
+            "updated": now,
+            "rate": self.max_rate,
+            "blocked_until": 0.0,
+            "streak": 0
+        }
+
+    def update_state(self, change):
+        """
+        Runs change(state, now) while holding the host-wide lock and saves the
+        result. Returns whatever change returns.
+        """
+        if fcntl is None:
+            with self.local_lock:
+                now = time.time()
+                if self.local_state is None:
+                    self.local_state = self.new_state(now)
+                return change(self.local_state, now)
+
+        with open(self.state_path, "a+") as state_file:
+            fcntl.flock(state_file, fcntl.LOCK_EX)
+            try:
+                now = time.time()
+                state_file.seek(0)
+                try:
+                    state = json.loads(state_file.read())
+                except ValueError:
+                    state = self.new_state(now)
+
+                result = change(state, now)
+
+                state_file.seek(0)
+                state_file.truncate()
+                state_file.write(json.dumps(state))
+                state_file.flush()
+            finally:
+                fcntl.flock(state_file, fcntl.LOCK_UN)
+        return result
+
+    def take_token(self, state, now):
+        """
+        Tries to take a token from the bucket. Returns 0 on success, otherwise
+        the number of seconds to wait before trying again.
+        """
+        if now < state["blocked_until"]:
+            return state["blocked_until"] - now
+
+        elapsed = max(now - state["updated"], 0.0)
+        state["tokens"] = min(self.capacity,
+                              state["tokens"] + elapsed * state["rate"])
+        state["updated"] = now
+
+        if state["tokens"] >= 1:
+            state["tokens"] = state["tokens"] - 1
+            return 0.0
+        return (1 - state["tokens"]) / state["rate"]
+
+    def acquire(self):
+        """
+        Blocks until we are allowed to send a request
+        """
+        wait = self.update_state(self.take_token)
+        while wait > 0:
+            time.sleep(wait)
+            wait = self.update_state(self.take_token)
+
+    async def acquire_async(self):
+        """
+        Waits until we are allowed to send a request without blocking the
+        event loop
+        """
+        wait = self.update_state(self.take_token)
+        while wait > 0:
+            await asyncio.sleep(wait)
+            wait = self.update_state(self.take_token)
+
+    def try_acquire(self):
+        """
+        Takes a token only if one is free right now. Returns whether we may
+        send a request.
+        """
+        return self.update_state(self.take_token) == 0
+
+    def report(self, status, retry_after=None):
+        """
+        Adjusts the shared rate based on the outcome of a request
+
+        Params
+        ------
+        status: int
+            The HTTP status code of the response
+        retry_after: str
+            The Retry-After header of the response, if any
+        """
+        def change(state, now):
+            if status == 429:
+                state["rate"] = max(self.min_rate,
+                                    state["rate"] * self.backoff_factor)
+                state["tokens"] = 0.0
+                state["streak"] = 0
+                wait = parse_retry_after(retry_after) or 1 / state["rate"]
+                state["blocked_until"] = max(state["blocked_until"], now + wait)
+            elif status in range(200, 299):
+                state["streak"] = state["streak"] + 1
+                if state["streak"] >= self.recovery_streak:
+                    state["rate"] = min(self.max_rate, state["rate"] +
+                                        self.max_rate * self.recovery_step)
+                    state["streak"] = 0
+
+        self.update_state(change)
+
+    def get_rate(self):
+        """
+        Returns the current shared request rate per second
+        """
+        return self.update_state(lambda state, now: state["rate"])
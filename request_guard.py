@@ -0,0 +1,441 @@
+"""
+    Tail-latency and outage protection for API requests
+"""
+import time
+import asyncio
+import hashlib
+import threading
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlsplit, urlencode
+
+from requests.exceptions import RequestException
+
+
+class CircuitOpenError(RequestException):
+    """
+    Raised instead of sending a request to a host that keeps failing
+    """
+
+
+class LatencyTracker:
+    """
+    Keeps the most recent request latencies for a host
+
+    Attributes
+    ----------
+    samples: deque
+        the latest latencies in seconds
+    """
+    min_samples = 20
+
+    def __init__(self, size=200):
+        self.samples = deque(maxlen=size)
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        """
+        Adds a latency sample
+        """
+        with self.lock:
+            self.samples.append(seconds)
+
+    def percentile(self, fraction):
+        """
+        Returns the given percentile of recent latencies, or None if we do not
+        have enough samples yet
+        """
+        with self.lock:
+            if len(self.samples) < self.min_samples:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class CircuitBreaker:
+    """
+    Stops requests to a host after repeated failures, letting a single trial
+    request through once reset_timeout has passed
+
+    Attributes
+    ----------
+    failure_threshold: int
+        the number of consecutive failures that opens the circuit
+    reset_timeout: float
+        the number of seconds to wait before trying the host again
+    failures: int
+        the current number of consecutive failures
+    failures_before_success: int
+        the number of consecutive failures the last success reset, restored
+        if that success is retracted
+    opened_at: float
+        when the circuit was opened, or None while it is closed
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.failures_before_success = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """
+        Returns whether a request may be sent now
+        """
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if self.trial_running or \
+               time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.trial_running = True
+            return True
+
+    def record_success(self):
+        """
+        Closes the circuit after a successful request
+        """
+        with self.lock:
+            self.failures_before_success = self.failures
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        """
+        Counts a failed request, opening the circuit past the threshold
+        """
+        with self.lock:
+            self.failures = self.failures + 1
+            if self.trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.trial_running = False
+
+    def retract_success(self):
+        """
+        Counts the last success as a failure after all, for a response whose
+        body turned out to be unusable
+        """
+        with self.lock:
+            self.failures = max(self.failures, self.failures_before_success)
+        self.record_failure()
+
+    def is_open(self):
+        """
+        Returns whether requests are currently being refused
+        """
+        with self.lock:
+            return self.opened_at is not None
+
+
+class RequestGuard:
+    """
+    Sends requests to one host with hedging, a circuit breaker, and a small
+    cache of successful GET responses to fall back on while the host is down
+
+    Attributes
+    ----------
+    host: str
+        the host this guard protects
+    latency: LatencyTracker
+        recent latencies, used to pick the hedge delay
+    breaker: CircuitBreaker
+        the circuit breaker for the host
+    cache: OrderedDict
+        the most recent successful GET responses by request key
+    hedge_percentile: float
+        the latency percentile after which a duplicate request is sent
+    default_hedge_delay: float
+        the hedge delay used until we have enough latency samples
+    pool_size: int
+        the number of threads shared by every guard to send hedged requests
+    """
+    hedge_percentile = 0.95
+    default_hedge_delay = 1.0
+    min_hedge_delay = 0.05
+    cache_size = 256
+
+    pool_size = 8
+    executor = None
+    executor_lock = threading.Lock()
+
+    def __init__(self, host, failure_threshold=5, reset_timeout=30.0):
+        self.host = host
+        self.latency = LatencyTracker()
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.cache = OrderedDict()
+        self.cache_lock = threading.Lock()
+
+    @classmethod
+    def get_executor(cls):
+        """
+        Returns the thread pool shared by every guard for hedged requests
+        """
+        with cls.executor_lock:
+            if cls.executor is None:
+                cls.executor = ThreadPoolExecutor(max_workers=cls.pool_size,
+                                                  thread_name_prefix="hedge")
+            return cls.executor
+
+    def get_hedge_delay(self):
+        """
+        Returns how long to wait on a request before sending a duplicate
+        """
+        delay = self.latency.percentile(self.hedge_percentile)
+        if delay is None:
+            return self.default_hedge_delay
+        return max(delay, self.min_hedge_delay)
+
+    def cache_key(self, url, kwargs):
+        """
+        Returns the key a GET request is cached under. The key includes a hash
+        of the Authorization header, so one caller's response (e.g. /v1/me)
+        is never handed to a caller with a different token.
+        """
+        params = kwargs.get("params") or {}
+        headers = kwargs.get("headers") or {}
+        auth = hashlib.sha256(headers.get("Authorization", "").encode()).hexdigest()[:16]
+        return f"{auth} {url}?{urlencode(sorted(params.items()))}"
+
+    def cached(self, key):
+        """
+        Returns the cached response for a key, or None
+        """
+        with self.cache_lock:
+            return self.cache.get(key)
+
+    def store(self, key, response):
+        """
+        Caches a response, dropping the oldest entries past cache_size
+        """
+        with self.cache_lock:
+            self.cache[key] = response
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def timed(self, send):
+        """
+        Sends a request and records how long it took
+        """
+        start = time.monotonic()
+        response = send()
+        self.latency.record(time.monotonic() - start)
+        return response
+
+    async def timed_async(self, send):
+        """
+        Awaits a request and records how long it took
+        """
+        start = time.monotonic()
+        response = await send()
+        self.latency.record(time.monotonic() - start)
+        return response
+
+    def hedged(self, send, limiter=None):
+        """
+        Sends a request, and a duplicate if the first is slower than our
+        hedge delay. Returns the first response to arrive.
+
+        The caller has already taken a token for the first request. The
+        duplicate is only sent if the limiter has a token free right away, so
+        hedging never pushes us past the rate limit or waits on it.
+        """
+        executor = self.get_executor()
+        started = threading.Event()
+
+        def first_send():
+            started.set()
+            return self.timed(send)
+
+        first = executor.submit(first_send)
+        # Time spent queued for a thread is not the host being slow
+        started.wait()
+        done, _ = wait([first], timeout=self.get_hedge_delay())
+        if done:
+            return first.result()
+        if limiter is not None and not limiter.try_acquire():
+            return first.result()
+
+        second = executor.submit(self.timed, send)
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                # Close the slower response once it arrives
+                for other in pending:
+                    other.add_done_callback(close_response)
+                return future.result()
+        raise error
+
+    async def hedged_async(self, send, limiter=None):
+        """
+        Like hedged, for a send that returns a coroutine. Whichever request
+        is still running when we return, or are cancelled, is cancelled.
+        """
+        tasks = [asyncio.ensure_future(self.timed_async(send))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.get_hedge_delay())
+            if done:
+                return tasks[0].result()
+            if limiter is not None and not limiter.try_acquire():
+                return await tasks[0]
+
+            tasks.append(asyncio.ensure_future(self.timed_async(send)))
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def request_key(self, method, url, kwargs):
+        """
+        Returns the cache key of a request, or None if its response must not
+        be cached or duplicated
+        """
+        # Only plain GETs are safe to duplicate or answer from the cache
+        if method == "GET" and not kwargs.get("stream"):
+            return self.cache_key(url, kwargs)
+        return None
+
+    def fallback(self, key, error):
+        """
+        Returns the cached response for a request we cannot get an answer to
+        now, or raises error if there is none
+        """
+        if key is not None and self.cached(key) is not None:
+            return self.cached(key)
+        raise error
+
+    def settle(self, key, response):
+        """
+        Records the outcome of a response and returns it, or the cached
+        response in place of a server error
+        """
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+            if key is not None and self.cached(key) is not None:
+                return self.cached(key)
+            return response
+
+        self.breaker.record_success()
+        if key is not None and response.status_code == 200:
+            self.store(key, response)
+        return response
+
+    def send(self, method, url, send, kwargs, limiter=None, hedge=True):
+        """
+        Sends a request through the guard
+
+        Params
+        ------
+        method: str
+            The HTTP method
+        url: str
+            The request url
+        send: callable
+            Sends the request once over the network and returns the response
+        kwargs: dict
+            The request's keyword arguments, used to build the cache key
+        limiter: SharedTokenBucket
+            The rate limiter to take a token from before sending. Waiting for
+            it is not counted as latency, so it never triggers a hedge.
+        hedge: bool
+            Whether a slow GET may be duplicated
+        """
+        key = self.request_key(method, url, kwargs)
+        if not self.breaker.allow():
+            return self.fallback(key, CircuitOpenError(
+                f"{self.host} is failing, not sending request"))
+
+        if limiter is not None:
+            limiter.acquire()
+
+        try:
+            if method == "GET" and hedge:
+                response = self.hedged(send, limiter)
+            else:
+                response = self.timed(send)
+        except RequestException as err:
+            self.breaker.record_failure()
+            return self.fallback(key, err)
+        return self.settle(key, response)
+
+    async def send_async(self, method, url, send, kwargs, limiter=None, hedge=True):
+        """
+        Sends a request through the guard from an event loop, as send does
+
+        Params
+        ------
+        send: callable
+            Returns a coroutine that sends the request once and returns the
+            response
+        limiter: SharedTokenBucket
+            The rate limiter, waited on with acquire_async
+        The remaining params are as in send
+        """
+        key = self.request_key(method, url, kwargs)
+        if not self.breaker.allow():
+            return self.fallback(key, CircuitOpenError(
+                f"{self.host} is failing, not sending request"))
+
+        if limiter is not None:
+            await limiter.acquire_async()
+
+        try:
+            if method == "GET" and hedge:
+                response = await self.hedged_async(send, limiter)
+            else:
+                response = await self.timed_async(send)
+        except RequestException as err:
+            self.breaker.record_failure()
+            return self.fallback(key, err)
+        return self.settle(key, response)
+
+    def reject(self, url, kwargs):
+        """
+        Counts a response whose body turned out to be unusable as a failure of
+        the host, and drops it from the cache so it is never served again.
+        The guard already took it for a success when the headers arrived.
+        """
+        self.breaker.retract_success()
+        with self.cache_lock:
+            self.cache.pop(self.cache_key(url, kwargs), None)
+
+
+def close_response(future):
+    """
+    Closes the response of a finished hedge we no longer need
+    """
+    if future.exception() is None:
+        future.result().close()
+
+
+guards = {}
+guards_lock = threading.Lock()
+
+
+def get_guard(url):
+    """
+    Returns the guard shared by every request to the host of a url
+    """
+    host = urlsplit(url).netloc
+    with guards_lock:
+        if host not in guards:
+            guards[host] = RequestGuard(host)
+        return guards[host]
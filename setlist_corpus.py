@@ -0,0 +1,395 @@
+"""
+    Compact, memory-mapped storage for setlists
+"""
+import os
+import sys
+import mmap
+import array
+import bisect
+import struct
+import threading
+
+from setlist_fm_wrapper import parse_event_date
+
+# File layout (all integers little-endian)
+#   header    magic, version, then the counts and offsets of every section
+#   names     offset table (u32 * count+1) and UTF-8 data for ids, artists,
+#             venues, cities, states, countries and tours
+#   songs     offset table and UTF-8 data for song names; a song's id is its
+#             position in this table
+#   records   one fixed-width SetlistCorpus.record_format per setlist
+#   sets      one SET_FORMAT per set of every setlist, in the order played
+#   sequence  the song ids of every setlist back to back (u32)
+MAGIC = b"LPSC"
+VERSION = 2
+HEADER_FORMAT = "<4sHH" + "I" * 6 + "Q" * 7
+# set name, encore number (0 for a main set), song count
+SET_FORMAT = "<IHH"
+NO_STRING = 0xFFFFFFFF
+
+
+class StringTable:
+    """
+    Interns strings while writing a corpus
+
+    Attributes
+    ----------
+    ids: dict
+        maps each string to its index in the table
+    strings: list
+        the strings in the order they were added
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.strings = []
+
+    def intern(self, value):
+        """
+        Returns the index of a string, adding it if we have not seen it
+        """
+        if value is None:
+            return NO_STRING
+        if value not in self.ids:
+            self.ids[value] = len(self.strings)
+            self.strings.append(value)
+        return self.ids[value]
+
+    def to_bytes(self):
+        """
+        Returns the offset table and the string data
+        """
+        offsets = array.array("I", [0])
+        data = bytearray()
+        for value in self.strings:
+            data.extend(value.encode("utf-8"))
+            offsets.append(len(data))
+        if sys.byteorder != "little":
+            offsets.byteswap()
+        return offsets.tobytes(), bytes(data)
+
+
+def date_to_int(event_date):
+    """
+    Packs a dd-mm-yyyy eventDate into a yyyymmdd integer
+    """
+    date = parse_event_date(event_date)
+    return date.year * 10000 + date.month * 100 + date.day
+
+
+def int_to_date(value):
+    """
+    Returns the dd-mm-yyyy eventDate for a yyyymmdd integer
+    """
+    return f"{value % 100:02d}-{value // 100 % 100:02d}-{value // 10000:04d}"
+
+
+def write_corpus(path, setlists, covered_since=None):
+    """
+    Writes setlists to a corpus file, skipping repeated setlist ids. The file
+    is replaced in one step, so readers never see it half written.
+
+    Params
+    ------
+    path: str
+        The file to write
+    setlists: iterable
+        Setlists in the layout returned by the setlist.fm wrapper, e.g. the
+        setlists of a SetlistSearch
+    covered_since: str
+        The dd-mm-yyyy date from which the setlists are known to be complete,
+        if any
+    """
+    names = StringTable()
+    songs = StringTable()
+    records = bytearray()
+    set_records = bytearray()
+    sequence = array.array("I")
+    seen = set()
+
+    for setlist in setlists:
+        if setlist["id"] in seen:
+            continue
+        seen.add(setlist["id"])
+
+        venue = setlist["venue"]
+        city = venue["city"]
+        song_start = len(sequence)
+        set_start = len(set_records) // SetlistCorpus.set_size
+        portions = setlist["sets"]["set"]
+        for portion in portions:
+            for song in portion["song"]:
+                sequence.append(songs.intern(song["name"]))
+            set_records.extend(struct.pack(SET_FORMAT, names.intern(portion.get("name")),
+                                           portion.get("encore", 0), len(portion["song"])))
+
+        tour = setlist["tour"]["name"] if "tour" in setlist else None
+        records.extend(struct.pack(
+            SetlistCorpus.record_format,
+            names.intern(setlist["id"]),
+            date_to_int(setlist["eventDate"]),
+            names.intern(setlist["artist"]["name"]),
+            names.intern(setlist["artist"].get("mbid", "")),
+            names.intern(venue["name"]),
+            names.intern(city["name"]),
+            names.intern(city.get("state")),
+            names.intern(city["country"]["code"]),
+            names.intern(city["country"]["name"]),
+            names.intern(tour),
+            song_start,
+            set_start,
+            len(sequence) - song_start,
+            len(portions)))
+
+    if sys.byteorder != "little":
+        sequence.byteswap()
+    name_offsets, name_data = names.to_bytes()
+    song_offsets, song_data = songs.to_bytes()
+
+    sections = [name_offsets, name_data, song_offsets, song_data,
+                bytes(records), bytes(set_records), sequence.tobytes()]
+    offsets = []
+    position = struct.calcsize(HEADER_FORMAT)
+    for section in sections:
+        # Keep every section 4-byte aligned so it can be cast in place
+        position = position + (-position % 4)
+        offsets.append(position)
+        position = position + len(section)
+
+    covered = date_to_int(covered_since) if covered_since else 0
+    temp_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    with open(temp_path, "wb") as corpus_file:
+        corpus_file.write(struct.pack(HEADER_FORMAT, MAGIC, VERSION, 0,
+                                      len(names.strings), len(songs.strings),
+                                      len(seen), len(set_records) // SetlistCorpus.set_size,
+                                      len(sequence), covered, *offsets))
+        for offset, section in zip(offsets, sections):
+            corpus_file.write(b"\0" * (offset - corpus_file.tell()))
+            corpus_file.write(section)
+    os.replace(temp_path, path)
+
+
+class SetlistCorpus:
+    """
+    Read-only access to a corpus file written by write_corpus
+
+    The file is memory-mapped and nothing is decoded until it is asked for,
+    so opening even a large corpus is nearly instant.
+
+    Attributes
+    ----------
+    path: str
+        the corpus file
+    num_names: int
+        the number of strings in the names table
+    num_songs: int
+        the number of distinct songs
+    num_setlists: int
+        the number of setlists
+    covered_since: str
+        the dd-mm-yyyy date from which the setlists are known to be complete,
+        or None
+    """
+    # setlist id, date, artist, mbid, venue, city, state, country code,
+    # country name, tour, first song, first set, song count, set count
+    record_format = "<" + "I" * 12 + "HH"
+    record_size = struct.calcsize(record_format)
+    set_size = struct.calcsize(SET_FORMAT)
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        header = struct.unpack_from(HEADER_FORMAT, self.map, 0)
+        if header[0] != MAGIC or header[1] != VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {VERSION} setlist corpus")
+
+        self.num_names, self.num_songs, self.num_setlists, self.num_sets, num_refs, \
+            covered = header[3:9]
+        self.covered_since = int_to_date(covered) if covered else None
+        (name_offsets, self.name_data, song_offsets, self.song_data,
+         self.records, self.sets, sequence) = header[9:16]
+
+        self.name_offsets = self.cast(name_offsets, self.num_names + 1)
+        self.song_offsets = self.cast(song_offsets, self.num_songs + 1)
+        self.sequence = self.cast(sequence, num_refs)
+
+    def cast(self, offset, count):
+        """
+        Returns a u32 array view of part of the file, without copying it on
+        little-endian machines
+        """
+        view = memoryview(self.map)[offset:offset + 4 * count]
+        if sys.byteorder == "little":
+            return view.cast("I")
+        values = array.array("I", view.tobytes())
+        values.byteswap()
+        return values
+
+    def close(self):
+        """
+        Releases the file
+        """
+        for name in ("name_offsets", "song_offsets", "sequence"):
+            view = getattr(self, name, None)
+            if isinstance(view, memoryview):
+                view.release()
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.num_setlists
+
+    def name(self, index):
+        """
+        Returns a string from the names table
+        """
+        if index == NO_STRING:
+            return None
+        start = self.name_data + self.name_offsets[index]
+        end = self.name_data + self.name_offsets[index + 1]
+        return self.map[start:end].decode("utf-8")
+
+    def name_id(self, value):
+        """
+        Returns the index of a string in the names table, or None if the
+        corpus does not hold it. The table is searched as bytes, so no name is
+        decoded.
+        """
+        encoded = value.encode("utf-8")
+        end = self.name_data + self.name_offsets[self.num_names]
+        position = self.map.find(encoded, self.name_data, end)
+        while position != -1:
+            start = position - self.name_data
+            index = bisect.bisect_left(self.name_offsets, start)
+            # Empty strings share their offset with the next string
+            while index < self.num_names and self.name_offsets[index] == start:
+                if self.name_offsets[index + 1] - start == len(encoded):
+                    return index
+                index = index + 1
+            position = self.map.find(encoded, position + 1, end)
+        return None
+
+    def song_name(self, song_id):
+        """
+        Returns the name of a song from its id
+        """
+        start = self.song_data + self.song_offsets[song_id]
+        end = self.song_data + self.song_offsets[song_id + 1]
+        return self.map[start:end].decode("utf-8")
+
+    def record(self, num):
+        """
+        Returns the raw fields of a setlist record as a tuple, see record_format
+        """
+        if not 0 <= num < self.num_setlists:
+            raise IndexError("setlist index out of range")
+        return struct.unpack_from(self.record_format, self.map,
+                                  self.records + num * self.record_size)
+
+    def song_ids(self, num):
+        """
+        Returns the song ids played in a setlist, in order. This is a view into
+        the file, so copy it with list() to keep it after closing the corpus.
+        """
+        record = self.record(num)
+        return self.sequence[record[10]:record[10] + record[12]]
+
+    def event_date(self, num):
+        """
+        Returns the date of a setlist as a yyyymmdd integer
+        """
+        return self.record(num)[1]
+
+    def find(self, artist=None, year=None, city=None, venue=None, tour=None,
+             date=None):
+        """
+        Returns the indices of setlists matching every given filter. Names are
+        compared exactly; year is an int and date a datetime.date.
+        """
+        # Each name is looked up once, then records are compared by index
+        wanted = []
+        for field, value in ((2, artist), (5, city), (4, venue), (9, tour)):
+            if value is None:
+                continue
+            name_id = self.name_id(value)
+            if name_id is None:
+                return []
+            wanted.append((field, name_id))
+
+        if year is not None:
+            year = int(year)
+        if date is not None:
+            date = date.year * 10000 + date.month * 100 + date.day
+
+        records = memoryview(self.map)[self.records:
+                                       self.records + self.num_setlists * self.record_size]
+        matches = []
+        try:
+            for num, record in enumerate(struct.iter_unpack(self.record_format, records)):
+                if year is not None and record[1] // 10000 != year:
+                    continue
+                if date is not None and record[1] != date:
+                    continue
+                if all(record[field] == name_id for field, name_id in wanted):
+                    matches.append(num)
+        finally:
+            records.release()
+        return matches
+
+    def setlist(self, num):
+        """
+        Returns a setlist in the same layout the setlist.fm wrapper uses, so
+        it can be printed or picked like a fetched one
+        """
+        record = self.record(num)
+        songs = [{"name": self.song_name(song_id)} for song_id in self.song_ids(num)]
+        sets = []
+        start = 0
+        for set_num in range(record[11], record[11] + record[13]):
+            name_id, encore, count = struct.unpack_from(
+                SET_FORMAT, self.map, self.sets + set_num * self.set_size)
+            portion = {"song": songs[start:start + count]}
+            if name_id != NO_STRING:
+                portion["name"] = self.name(name_id)
+            if encore:
+                portion["encore"] = encore
+            sets.append(portion)
+            start = start + count
+
+        setlist = {
+            "id": self.name(record[0]),
+            "eventDate": int_to_date(record[1]),
+            "artist": {"name": self.name(record[2]), "mbid": self.name(record[3])},
+            "venue": {
+                "name": self.name(record[4]),
+                "city": {
+                    "name": self.name(record[5]),
+                    "country": {"code": self.name(record[7]),
+                                "name": self.name(record[8])}
+                }
+            },
+            "sets": {"set": sets}
+        }
+        if record[6] != NO_STRING:
+            setlist["venue"]["city"]["state"] = self.name(record[6])
+        if record[9] != NO_STRING:
+            setlist["tour"] = {"name": self.name(record[9])}
+        return setlist
+
+    def setlists(self, nums=None):
+        """
+        Yields setlists for the given indices, or every setlist
+        """
+        if nums is None:
+            nums = range(self.num_setlists)
+        for num in nums:
+            yield self.setlist(num)
@@ -1,16 +1,202 @@
 """
     Setlist.fm API wrapper
 """
-from time import sleep
 #import json
-from requests.exceptions import HTTPError
+import re
+import datetime
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from requests.exceptions import HTTPError, RequestException
 import requests
 
+from rate_limiter import SharedTokenBucket
+from request_guard import get_guard
+
+# A comma that is not escaped as "\,"
+VALUE_SEPARATOR = re.compile(r"(?<!\\),")
+
+
+def parse_setlist_page(res):
+    """
+    Returns a decoded setlist search page with the setlists that have no
+    songs dropped. The page keeps its top level fields (total, page,
+    itemsPerPage), holds the non-empty setlists under "setlist", and the
+    eventDate of the first and last setlist on the page (empty ones included)
+    under "first_date" and "last_date".
+    """
+    setlists = res.get("setlist", [])
+    page = dict(res)
+    page.setdefault("total", 0)
+    # Avoid empty setlists so we can filter artists with no concerts
+    page["setlist"] = [setlist for setlist in setlists
+                       if setlist.get("sets", {}).get("set")]
+    page["first_date"] = setlists[0].get("eventDate", "") if setlists else ""
+    page["last_date"] = setlists[-1].get("eventDate", "") if setlists else ""
+    return page
+
+
+def parse_event_date(event_date):
+    """
+    Returns the date of a setlist.fm eventDate string (dd-mm-yyyy)
+    """
+    return datetime.date(int(event_date[6:10]), int(event_date[3:5]),
+                         int(event_date[0:2]))
+
+
+def setlist_details(setlist):
+    """
+    Returns the venue, location, date and tour of a setlist as a dict, filling
+    in placeholders for anything setlist.fm does not know
+    """
+    venue = setlist["venue"]
+    city = venue["city"]
+
+    # Account for missing venues
+    if venue["name"] != "":
+        set_venue = venue["name"]
+    else:
+        set_venue = "Unknown Venue"
+
+    # Define location based on country to avoid wordiness
+    if city["name"] != "":
+        set_loc = city["name"] + ", "
+    else:
+        set_loc = "Unknown City, "
+    if city["country"]["code"] == "US":
+        set_loc = set_loc + city.get("state", "")
+    else:
+        set_loc = set_loc + city["country"]["name"]
+
+    # See if we have a tour name
+    if "tour" in setlist:
+        tour_name = setlist["tour"]["name"]
+    else:
+        tour_name = ""
+
+    return {
+        "venue": set_venue,
+        "location": set_loc,
+        "date": setlist["eventDate"],
+        "tour": tour_name
+    }
+
+
+def setlist_songs(setlist):
+    """
+    Returns the names of every song in a setlist, encores included
+    """
+    songs = []
+    for portion in setlist["sets"]["set"]:
+        for song in portion["song"]:
+            songs.append(song["name"])
+    return songs
+
+
+def playlist_name(artist, setlist):
+    """
+    Returns a string formatted to represent a playlist title
+    """
+    return f"{artist} Live @ {setlist_details(setlist)['venue']}"
+
+
+def playlist_description(artist, setlist):
+    """
+    Returns a string that describes the setlist information
+    """
+    details = setlist_details(setlist)
+    desc = f"Setlist for {artist}"
+    if details["tour"] != "":
+        desc = desc + f" on {details['tour']}. "
+    else:
+        desc = desc + ". "
+    desc = desc + f"They played at {details['venue']} in {details['location']}. "\
+           + f"Performed on {details['date']}."
+    return desc
+
+
+def filter_values(value, split=True):
+    """
+    Returns the values a search filter may take: a list is kept as is, and a
+    string is split on commas so "Chicago, Denver" searches both cities. A
+    comma written as "\\," is part of the value. An empty filter gives [""],
+    which leaves it out of the search.
+
+    Params
+    ------
+    value: str or list
+        The filter as entered
+    split: bool
+        Whether a string may hold several values. Tour and venue names often
+        contain commas, so they are only split when given as a list.
+    """
+    if isinstance(value, (list, tuple)):
+        values = [str(item).strip() for item in value]
+    elif split:
+        values = [item.replace("\\,", ",").strip()
+                  for item in VALUE_SEPARATOR.split(str(value or ""))]
+    else:
+        values = [str(value or "").strip()]
+    values = [item for item in values if item]
+    return values or [""]
+
+
+def year_values(value):
+    """
+    Returns the years a year filter covers. Takes the same forms as
+    filter_values, plus ranges such as "2016-2019", which may be given either
+    way round.
+    """
+    years = []
+    for item in filter_values(value):
+        first, sep, last = item.partition("-")
+        if sep and first.strip().isdigit() and last.strip().isdigit():
+            first, last = sorted((int(first), int(last)))
+            years.extend(str(year) for year in range(first, last + 1))
+        else:
+            years.append(item)
+    return years
+
+
+def filter_combos(city, state_name, state_abbr, tour_name, venue_name):
+    """
+    Returns every combination of the values of the place and tour filters
+    """
+    return list(itertools.product(filter_values(city), filter_values(state_name),
+                                  filter_values(state_abbr),
+                                  filter_values(tour_name, split=False),
+                                  filter_values(venue_name, split=False)))
+
+
+class SetlistSearch:
+    """
+    The result of a setlist search
+
+    Attributes
+    ----------
+    total: int
+        the number of setlists setlist.fm reported for the query, empty ones
+        included
+    setlists: list
+        the non-empty setlists that were retrieved
+    pages: int
+        the number of pages we requested
+    """
+
+    def __init__(self, total=0, setlists=None, pages=0):
+        self.total = total
+        self.setlists = setlists if setlists is not None else []
+        self.pages = pages
+
 
 class SetlistFmWrapper:
     """
     A class to handle API requests to setlist.fm
 
+    The search_* methods only return their results, so one wrapper may be
+    shared between threads. The remaining methods keep the choices of an
+    interactive session on the instance and should not be shared.
+
     Attributes
     ----------
     api_key: str
@@ -24,32 +210,112 @@ class SetlistFmWrapper:
     possible_sets: list
         a list of potential sets for a given query to limit the number of
         requests that we send
-    set_name: str
-        the name of the tour for the set
     set_date: str
         the date the setlist was played
     set_venue: str
         the venue where the set was played
     set_loc: str
         the location of the venue
-    setlist: list
-        the songs played in the set
+    tour: str
+        the name of the tour for the set
+    setlist: dict
+        the set we picked
+    limiter: SharedTokenBucket
+        the host-wide rate limiter shared by every user of this API key
+    session: requests.Session
+        keeps connections to the API open between requests
+    artist_index: ArtistIndex
+        artists we have seen before, used to skip artist searches
+    artist_query: str
+        the name we last searched for an artist by
+    artist_from_cache: bool
+        whether the candidates of the last artist search came from the artist
+        index rather than the API, so the user should be able to look past
+        them
+    artist_picked_before: bool
+        whether the artist was settled by a pick remembered from an earlier
+        search
+    setlist_store: SetlistStore
+        recent setlists of followed artists, checked before the API
+    request_count: int
+        the number of requests this wrapper has sent
     """
-    api_key = None
     api_base_url = "https://api.setlist.fm/rest"
-    artist = ""             # store artists and setlists to reduce api calls
-    artist_info = {}
-    possible_artists = []
-    possible_sets = []
-    set_name = ""
-    set_date = ""
-    set_venue = ""
-    set_loc = ""
-    tour = ""
-    setlist = []
-
-    def __init__(self, api_key):
+    # setlist.fm allows 2 requests per second for standard keys
+    max_rate = 2
+    max_retries = 3
+    # Slow GETs are duplicated, see RequestGuard.hedged; recorded and
+    # replayed runs turn this off so each request maps to one exchange
+    hedge_requests = True
+    request_timeout = 10
+    # Sub-queries of a multi-value search run at once, see search_setlists_multi
+    search_workers = 4
+
+    def __init__(self, api_key, limiter=None, artist_index=None, setlist_store=None):
         self.api_key = api_key
+        self.artist_index = artist_index
+        self.artist_query = ""
+        self.artist_from_cache = False
+        self.artist_picked_before = False
+        self.setlist_store = setlist_store
+        self.request_count = 0
+        self.count_lock = threading.Lock()
+        # store artists and setlists to reduce api calls
+        self.artist = ""
+        self.artist_info = {}
+        self.possible_artists = []
+        self.possible_sets = []
+        self.set_date = ""
+        self.set_venue = ""
+        self.set_loc = ""
+        self.tour = ""
+        self.setlist = []
+        if limiter is None:
+            limiter = SharedTokenBucket.for_key("setlistfm", api_key, self.max_rate)
+        self.limiter = limiter
+        self.session = requests.Session()
+
+    def send_request(self, method, url, **kwargs):
+        """
+        Sends a request through the guard for its host, which hedges slow GETs
+        and fails fast (or answers from its cache) while the host is down
+        """
+        kwargs.setdefault("timeout", self.request_timeout)
+        guard = get_guard(url)
+        # Requests the API turns away with a 429 are retried once the shared
+        # rate limiter lets us
+        for _ in range(self.max_retries + 1):
+            response = guard.send(method, url,
+                                  lambda: self.send_once(method, url, **kwargs),
+                                  kwargs, self.limiter, self.hedge_requests)
+            if response.status_code != 429:
+                break
+        return response
+
+    def send_once(self, method, url, **kwargs):
+        """
+        Sends a request and reports its outcome to the shared rate limiter.
+        The caller must already have taken a token.
+        """
+        # Hedges and concurrent searches send from several threads at once
+        with self.count_lock:
+            self.request_count = self.request_count + 1
+        response = self.session.request(method, url, **kwargs)
+        self.limiter.report(response.status_code,
+                            response.headers.get("Retry-After"))
+        return response
+
+    def read_setlist_page(self, url, headers, response):
+        """
+        Decodes a setlist search response, see parse_setlist_page. A body that
+        is cut short or is not JSON counts against the host, as a failed
+        request would, and raises ValueError.
+        """
+        try:
+            return parse_setlist_page(response.json())
+        except ValueError:
+            get_guard(url).reject(url, {"headers": headers})
+            raise
 
     def get_header(self):
         """
@@ -77,49 +343,107 @@ class SetlistFmWrapper:
         """
         return f"{self.api_base_url}/1.0/search/artists"
 
-    def get_artist_by_name(self, name):
+    def search_artists(self, name):
         """
-        Searches for the artist using their name
+        Returns the artists matching a name, or None if the request failed
 
         Params
         ------
         name: str
             The artist's name for which we are searching
         """
-        # clear values before search
-        self.artist = ""
-        self.possible_artists = []
-        self.artist_info = {}
-
         try:
-            response = requests.get(f"{self.get_artist_endpoint()}" + "?" +
-                                    f"{self.get_params_artist_name(name)}",
-                                    headers=self.get_header())
+            response = self.send_request("GET", f"{self.get_artist_endpoint()}" + "?" +
+                                         f"{self.get_params_artist_name(name)}",
+                                         headers=self.get_header())
 
             # Ensure we succeed
             response.raise_for_status()
         except HTTPError as http_err:
             print(f"HTTP Error occurred: {http_err}")
-            return False
+            return None
+        except RequestException as err:
+            print(f"Request failed: {err}")
+            return None
 
         # parse response
-        resp = response.json()
+        return self.read_artists(response.json())
+
+    def read_artists(self, resp):
+        """
+        Returns the candidates of a decoded artist search, remembering them in
+        the artist index
+        """
+        # Make candidates, ignoring "features" to cut down on duplicates
+        candidates = [art for art in resp["artist"] if "feat." not in art["name"]]
 
-        # Make candidates
-        for art in resp["artist"]:
-            # Ignore "features" to cut down on duplicates
-            if "feat." not in art["name"]:
-                self.possible_artists.append(art)
+        if self.artist_index is not None and self.artist_index.add_all(candidates):
+            self.artist_index.save()
+        return candidates
+
+    def get_artist_by_name(self, name, refresh=False):
+        """
+        Searches for the artist using their name
+
+        Params
+        ------
+        name: str
+            The artist's name for which we are searching
+        refresh: bool
+            Whether to ask the API even if we know the name, forgetting the
+            artist picked for it before
+        """
+        # clear values before search
+        self.artist = ""
+        self.possible_artists = []
+        self.artist_info = {}
+        self.artist_query = name
+        self.artist_from_cache = False
+        self.artist_picked_before = False
+
+        # Only ask the API about artists we have not seen lately
+        candidates = None
+        if self.artist_index is not None:
+            if refresh:
+                self.artist_index.forget_choice(name)
+                self.artist_index.save()
+            else:
+                candidates = self.artist_index.lookup(name)
+                self.artist_from_cache = candidates is not None
+                self.artist_picked_before = self.artist_index.chosen(name) is not None
+        if candidates is None:
+            candidates = self.search_artists(name)
+        if candidates is None:
+            return False
+        self.possible_artists = candidates
 
         if len(self.possible_artists) == 1:
-            self.artist_info = {self.possible_artists[0]["name"]:
-                                self.possible_artists[0]["mbid"]}
+            self.artist_info = {
+                "name": self.possible_artists[0]["name"],
+                "mbid": self.possible_artists[0]["mbid"]
+            }
             self.artist = self.possible_artists[0]["name"]
-        else:
-            self.artist_info = {"artist_name": "artist_id"}
 
         return True
 
+    def suggest_artists(self, text, limit=5):
+        """
+        Returns the names of known artists starting with the given text, to
+        suggest when a search finds nothing
+        """
+        if self.artist_index is None:
+            return []
+        # Artists sharing a name are suggested once
+        names = dict.fromkeys(artist["name"] for artist in self.artist_index.prefix(text, limit))
+        return list(names)
+
+    def get_artist_id(self):
+        """
+        Returns the MusicBrainz id of the artist, or "" if we have not settled
+        on one
+        """
+        return self.artist_info.get("mbid", "")
+
     def get_artist_name(self):
         """
         Returns the name of the artist
@@ -164,6 +488,12 @@ class SetlistFmWrapper:
             "mbid": self.possible_artists[num - 1]["mbid"]
         }
 
+        # Skip the prompt next time we search for the same name
+        if self.artist_index is not None:
+            self.artist_index.remember_choice(self.artist_query,
+                                              self.artist_info["mbid"])
+            self.artist_index.save()
+
     def get_setlist_endpoint(self):
         """
         Returns the API endpoint to search for a setlist
@@ -176,40 +506,16 @@ class SetlistFmWrapper:
         """
         # Essential info
         artist = artist_set["artist"]["name"]
-        set_date = artist_set["eventDate"]
-        # Account for missing venues
-        if artist_set["venue"]["name"] != "":
-            set_venue = artist_set["venue"]["name"]
-        else:
-            set_venue = "Unknown Venue"
-        # See if we have a tour name
-        if "tour" in artist_set:
-            tour_name = artist_set["tour"]["name"]
-        else:
-            tour_name = "Unknown tour"
-
-        # Define location based on country to avoid wordiness
-        if artist_set["venue"]["city"]["name"] != "":
-            set_loc = artist_set["venue"]["city"]["name"] + ", "
-        else:
-            set_loc = "Unknown City, "
-
-        if artist_set["venue"]["city"]["country"]["code"] == "US":
-            set_loc = set_loc + artist_set["venue"]["city"]["state"]
-        else:
-            set_loc = set_loc + artist_set["venue"]["city"]["country"]["name"]
+        details = setlist_details(artist_set)
+        tour_name = details["tour"] or "Unknown tour"
 
         print("Setlist for " + f"{artist} on {tour_name}")
-        print(f"Set played at {set_venue} in {set_loc} on {set_date}")
+        print(f"Set played at {details['venue']} in {details['location']} " +
+              f"on {details['date']}")
 
         # Need to iterate over our setlist to account for encores
-        number = 1
-        for set_portion in artist_set["sets"]["set"]:
-            setlist = set_portion["song"]
-            for song in setlist:
-                song_name = song["name"]
-                print(f"   {number : >2}: {song_name}")
-                number = number + 1
+        for number, song_name in enumerate(setlist_songs(artist_set), start=1):
+            print(f"   {number : >2}: {song_name}")
 
     def print_setlists_sparse(self):
         """
@@ -222,39 +528,14 @@ class SetlistFmWrapper:
         artist = self.possible_sets[0]["artist"]["name"]
         print(f"Matching setlists available for {artist}:")
         for setlist in self.possible_sets:
-            # Basic info
-            set_date = setlist["eventDate"]
-            if setlist["venue"]["name"] != "":
-                set_venue = setlist["venue"]["name"]
-            else:
-                set_venue = "Unknown Venue"
-            # See if we have a tour name
-            if "tour" in setlist:
-                tour_name = setlist["tour"]["name"]
-            else:
-                tour_name = "Unknown tour"
-
-            # Define location based on country to avoid wordiness
-            if setlist["venue"]["city"]["name"] != "":
-                set_loc = setlist["venue"]["city"]["name"] + ", "
-            else:
-                set_loc = "Unknown City, "
-            # print(set["venue"])
-            if setlist["venue"]["city"]["country"]["code"] == "US":
-                set_loc = set_loc + setlist["venue"]["city"]["state"]
-            else:
-                set_loc = set_loc + setlist["venue"]["city"]["country"]["name"]
-
-            # For empty venue/location info
-            if set_venue == "":
-                set_venue = "Unknown Venue"
-            if set_loc == "":
-                set_loc = "Unknown City"
+            details = setlist_details(setlist)
+            tour_name = details["tour"] or "Unknown tour"
 
             if last_tour != tour_name:
                 print(f" On {tour_name}")
                 last_tour = tour_name
-            print(f" {num : >3}: " + f"{set_venue} in {set_loc} on {set_date}")
+            print(f" {num : >3}: " + f"{details['venue']} in {details['location']} " +
+                  f"on {details['date']}")
 
             num = num + 1
 
@@ -275,25 +556,18 @@ class SetlistFmWrapper:
         self.possible_sets = []
 
         try:
-            response = requests.get(url, headers=headers)
+            response = self.send_request("GET", url, headers=headers)
             response.raise_for_status()  # Validate response went through
+            # Empty setlists are dropped while parsing
+            res = self.read_setlist_page(url, headers, response)
         except HTTPError as err:
             print(f"HTTP Error occurred: {err}")
             return False
+        except (RequestException, ValueError) as err:
+            print(f"Request failed: {err}")
+            return False
 
-        # print(response)
-        res = response.json()
-        test_candidates = {"artist_name": "artist_id"}  # dummy entry for debugging purposes
-
-        for setlist in res["setlist"]:
-            # Avoid empty setlists so we can  filter artists with no concerts
-            if setlist["sets"]["set"]:
-                # Temporary status to store artist name, artist id
-                test_candidates[setlist["artist"]["name"]] = setlist["artist"]["mbid"]
-                #self.print_setlist_info(setlist)  # Debugging print statement
-                self.possible_sets.append(setlist)
-
-        # print(test_candidates)
+        self.possible_sets.extend(res["setlist"])
 
         return True
 
@@ -321,35 +595,23 @@ class SetlistFmWrapper:
         """
         self.setlist = self.possible_sets[num - 1]
         # Set details for printing later
-        if self.setlist["venue"]["name"] != "":
-            self.set_venue = self.setlist["venue"]["name"]
-        else:
-            self.set_venue = "Unknown Venue"
-        self.set_date = self.setlist["eventDate"]
-        # Account for missing locations and different countries
-        if self.setlist["venue"]["city"]["name"] != "":
-            self.set_loc = self.setlist["venue"]["city"]["name"] + ", "
-        else:
-            self.set_loc = "Unknown City, "
-        if self.setlist["venue"]["city"]["country"]["code"] == "US":
-            self.set_loc = self.set_loc + self.setlist["venue"]["city"]["state"]
-        else:
-            self.set_loc = self.set_loc + self.setlist["venue"]["city"]["country"]["name"]
-        # See if we have a tour name
-        if "tour" in self.setlist:
-            self.tour = self.setlist["tour"]["name"]
-        else:
-            self.tour = ""
-
+        details = setlist_details(self.setlist)
+        self.set_venue = details["venue"]
+        self.set_date = details["date"]
+        self.set_loc = details["location"]
+        self.tour = details["tour"]
 
-    def get_setlist_page(self, artist_name, artist_id, city, state_name,
-                         state_abbr, tour_name, venue_name, year, page_num):
+    def get_setlist_page_url(self, artist_name, artist_id, city, state_name,
+                             state_abbr, tour_name, venue_name, year, page_num):
         """
-        Grab a given page of 20 sets (including empty sets) for an artist
+        Returns the url of a given page of setlists matching the filters
         """
         # Build our url based on what parameters we're given
-        url = f"{self.get_setlist_endpoint()}" + "?" + \
-              f"artistName={artist_name}"
+        url = f"{self.get_setlist_endpoint()}" + "?" + f"p={page_num}"
+        if artist_name:
+            url = url + f"&artistName={artist_name}"
+        if artist_id:
+            url = url + f"&artistMbid={artist_id}"
         if city:
             url = url + f"&cityName={city}"
         if state_name:
@@ -362,34 +624,158 @@ class SetlistFmWrapper:
             url = url + f"&venueName={venue_name}"
         if year:
             url = url + f"&year={year}"
-        url = url + f"&p={page_num}"
+        return url
+
+    def fetch_setlist_page(self, artist_name, artist_id, city, state_name,
+                           state_abbr, tour_name, venue_name, year, page_num):
+        """
+        Requests a given page of 20 sets for an artist and returns the parsed
+        page, or None if the request failed
+        """
+        url = self.get_setlist_page_url(artist_name, artist_id, city, state_name,
+                                        state_abbr, tour_name, venue_name, year,
+                                        page_num)
         headers = self.get_header()
 
         try:
-            response = requests.get(url, headers=headers)
+            response = self.send_request("GET", url, headers=headers)
             response.raise_for_status()  # Validate response went through
+            # Empty setlists are dropped while parsing
+            page = self.read_setlist_page(url, headers, response)
         except HTTPError as err:
             print(f"HTTP Error occurred: {err}")
+            return None
+        except (RequestException, ValueError) as err:
+            print(f"Request failed: {err}")
+            return None
+
+        if self.artist_index is not None and \
+           self.artist_index.add_from_setlists(page["setlist"]):
+            self.artist_index.save()
+        return page
+
+    def get_setlist_page(self, artist_name, artist_id, city, state_name,
+                         state_abbr, tour_name, venue_name, year, page_num):
+        """
+        Grab a given page of 20 sets (including empty sets) for an artist
+        """
+        res = self.fetch_setlist_page(artist_name, artist_id, city, state_name,
+                                      state_abbr, tour_name, venue_name, year,
+                                      page_num)
+        if res is None:
             return 0
 
-        # print(response)
-        res = response.json()
-        test_candidates = {"artist_name": "artist_id"}  # dummy entry for debugging purposes
-
-        for setlist in res["setlist"]:
-            # Avoid empty setlists so we can  filter artists with no concerts
-            if setlist["sets"]["set"]:
-                # Temporary status to store artist name, artist id
-                test_candidates[setlist["artist"]["name"]] = setlist["artist"]["mbid"]
-                #self.print_setlist_info(setlist)  # Debugging print statement
-                self.possible_sets.append(setlist)
-        # print(test_candidates)
+        self.possible_sets.extend(res["setlist"])
         return res["total"]
 
-    def get_all_setlists(self, artist_name, artist_id, city, state_name,
-                         state_abbr, tour_name, venue_name, year):
+    def search_setlists_by_date(self, artist_name, artist_id, city, state_name,
+                                state_abbr, tour_name, venue_name, show_date):
+        """
+        Finds the sets played on a given date without walking every page
+
+        setlist.fm returns setlists newest first, so we bisect over the page
+        numbers using the first and last eventDate of each page we fetch.
+
+        Params
+        ------
+        artist_name: str
+            The name of the artist
+            REQUIRED
+        show_date: str or date
+            The date of the show, as a date or in setlist.fm's dd-mm-yyyy format
+            REQUIRED
+        The remaining filters behave as in search_setlists
+        """
+        if isinstance(show_date, str):
+            show_date = parse_event_date(show_date)
+
+        # Warmed setlists can answer unfiltered searches for followed artists
+        if self.setlist_store is not None and artist_id and \
+           not (city or state_name or state_abbr or tour_name or venue_name):
+            stored = self.setlist_store.on_date(artist_id, show_date)
+            if stored is not None:
+                return SetlistSearch(len(stored), stored, 0)
+
+        result = SetlistSearch()
+        pages = {}
+
+        def fetch(page_num):
+            if page_num not in pages:
+                pages[page_num] = self.fetch_setlist_page(
+                    artist_name, artist_id, city, state_name, state_abbr,
+                    tour_name, venue_name, show_date.year, page_num)
+                result.pages = len(pages)
+            return pages[page_num]
+
+        first_page = fetch(1)
+        if first_page is None or first_page["total"] == 0:
+            return result
+        result.total = first_page["total"]
+        per_page = first_page.get("itemsPerPage", 20) or 20
+        last_page = -(-first_page["total"] // per_page)
+        low = 1
+        high = last_page
+        found = None
+
+        while low <= high:
+            middle = (low + high) // 2
+            page = fetch(middle)
+            if page is None or not page["first_date"]:
+                return result
+            if show_date > parse_event_date(page["first_date"]):
+                high = middle - 1       # newer shows are on earlier pages
+            elif show_date < parse_event_date(page["last_date"]):
+                low = middle + 1
+            else:
+                found = middle
+                break
+
+        if found is None:
+            return result
+
+        # Shows on the same day may spill over onto the neighbouring pages
+        page_nums = [found]
+        if found > 1 and parse_event_date(pages[found]["first_date"]) == show_date:
+            page_nums.insert(0, found - 1)
+        if found < last_page and parse_event_date(pages[found]["last_date"]) == show_date:
+            page_nums.append(found + 1)
+
+        for page_num in page_nums:
+            page = fetch(page_num)
+            if page is None:
+                continue
+            for setlist in page["setlist"]:
+                if parse_event_date(setlist["eventDate"]) == show_date:
+                    result.setlists.append(setlist)
+
+        return result
+
+    def find_setlists_by_date(self, artist_name, artist_id, city, state_name,
+                              state_abbr, tour_name, venue_name, show_date):
+        """
+        Replaces our candidates with the sets played on a given date and
+        returns how many were found. See search_setlists_by_date; each filter
+        may hold several values as in search_setlists_multi.
+        """
+        artist_id = artist_id or self.get_artist_id()
+        self.possible_sets = []
+        pages = 0
+        seen = set()
+        for combo in filter_combos(city, state_name, state_abbr, tour_name, venue_name):
+            result = self.search_setlists_by_date(artist_name, artist_id, *combo,
+                                                  show_date)
+            pages = pages + result.pages
+            for found in result.setlists:
+                if found["id"] not in seen:
+                    seen.add(found["id"])
+                    self.possible_sets.append(found)
+        print(f"Searched {pages} pages for shows on that date")
+        return len(self.possible_sets)
+
+    def search_setlists(self, artist_name, artist_id, city, state_name,
+                        state_abbr, tour_name, venue_name, year, verbose=False):
         """
-        Sends requests to get all possible tours for an artist
+        Requests every page of setlists matching the given filters
 
         Params
         ------
@@ -414,47 +800,111 @@ class SetlistFmWrapper:
         year: str
             The year of the show
             optional
-        """
-
-        self.possible_sets = []     # reset setlists between searches
-        # Iterate over all pages and sleep between requests
-        total = self.get_setlist_page(artist_name, artist_id, city, state_name,
-                                      state_abbr, tour_name, venue_name, year, 1)
-        print(f"Total number of matching setlists: {total}")
+        verbose: bool
+            Whether to print our progress through the pages
+        """
+        result = SetlistSearch()
+        # Iterate over all pages, the rate limiter spaces out our requests
+        page = self.fetch_setlist_page(artist_name, artist_id, city, state_name,
+                                       state_abbr, tour_name, venue_name, year, 1)
+        if page is None:
+            return result
+        result.total = page["total"]
+        result.setlists.extend(page["setlist"])
+        result.pages = 1
+        if verbose:
+            print(f"Total number of matching setlists: {result.total}")
 
         tally = 20
         next_page = 2
 
-        while tally < total:
-            # We need to sleep between API calls so we do not exceed limit
-            sleep(0.5)
-            print(f"Grabbing page {next_page}...")
-            self.get_setlist_page(artist_name, artist_id, city, state_name,
-                                  state_abbr, tour_name, venue_name, year,
-                                  next_page)
+        while tally < result.total:
+            if verbose:
+                print(f"Grabbing page {next_page}...")
+            page = self.fetch_setlist_page(artist_name, artist_id, city, state_name,
+                                           state_abbr, tour_name, venue_name, year,
+                                           next_page)
+            if page is not None:
+                result.setlists.extend(page["setlist"])
+            result.pages = result.pages + 1
             #increment
             tally = tally + 20
             next_page = next_page + 1
 
+        return result
+
+    def search_setlists_multi(self, artist_name, artist_id, city, state_name,
+                              state_abbr, tour_name, venue_name, year, verbose=False):
+        """
+        Requests every setlist matching any combination of the given filters
+
+        Each filter may hold several values (see filter_values) and the year
+        may also be a range (see year_values). Every combination is searched
+        on its own thread, then the setlists are merged, duplicates dropped
+        and the rest put newest first, as setlist.fm orders them.
+
+        Params
+        ------
+        The filters behave as in search_setlists, except that each may hold
+        several values
+        verbose: bool
+            Whether to print our progress through the pages
+        """
+        combos = [combo + (year_value,)
+                  for combo in filter_combos(city, state_name, state_abbr,
+                                             tour_name, venue_name)
+                  for year_value in year_values(year)]
+        if len(combos) == 1:
+            return self.search_setlists(artist_name, artist_id, *combos[0],
+                                        verbose=verbose)
+
+        if verbose:
+            print(f"Running {len(combos)} searches...")
+        # The shared rate limiter still spaces out the requests of every thread
+        with ThreadPoolExecutor(max_workers=self.search_workers) as executor:
+            searches = list(executor.map(
+                lambda combo: self.search_setlists(artist_name, artist_id, *combo),
+                combos))
+
+        result = SetlistSearch()
+        seen = set()
+        for search in searches:
+            result.total = result.total + search.total
+            result.pages = result.pages + search.pages
+            for setlist in search.setlists:
+                if setlist["id"] not in seen:
+                    seen.add(setlist["id"])
+                    result.setlists.append(setlist)
+        result.setlists.sort(key=lambda setlist: parse_event_date(setlist["eventDate"]),
+                             reverse=True)
+        if verbose:
+            print(f"Total number of matching setlists: {result.total}")
+        return result
+
+    def get_all_setlists(self, artist_name, artist_id, city, state_name,
+                         state_abbr, tour_name, venue_name, year):
+        """
+        Sends requests to get all possible tours for an artist and keeps them as
+        our candidates. Takes the same filters as search_setlists_multi.
+        """
+        result = self.search_setlists_multi(artist_name, artist_id, city, state_name,
+                                            state_abbr, tour_name, venue_name, year,
+                                            verbose=True)
+        self.possible_sets = result.setlists
+
         print(f"Total number of retrieved candidates: {len(self.possible_sets)}")
 
     def get_setlist_songs(self):
         """
         Gets all song names from a set
         """
-        songs = [] # reset songs
-
-        for portion in self.setlist["sets"]["set"]:
-            for song in portion["song"]:
-                songs.append(song["name"])
-
-        return songs
+        return setlist_songs(self.setlist)
 
     def setlist_name_to_string(self):
         """
         Returns a string formatted to represent a playlist title
         """
-        return f"{self.artist} Live @ {self.set_venue}"
+        return playlist_name(self.artist, self.setlist)
 
     def print_setlist(self):
         """
@@ -466,14 +916,7 @@ class SetlistFmWrapper:
         """
         Returns a string that describes the setlist information
         """
-        desc = f"Setlist for {self.artist}"
-        if self.tour != "":
-            desc = desc + f" on {self.tour}. "
-        else:
-            desc = desc + ". "
-        desc = desc + f"They played at {self.set_venue} in {self.set_loc}. "\
-               + f"Performed on {self.set_date}."
-        return desc
+        return playlist_description(self.artist, self.setlist)
 
 
 def main():
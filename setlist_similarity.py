@@ -0,0 +1,102 @@
+"""
+    Finding a show from a few of the songs that were played
+"""
+import math
+import heapq
+import difflib
+from collections import defaultdict
+
+from setlist_fm_wrapper import setlist_songs
+from song_titles import normalize_title
+
+
+class SetlistSimilarityIndex:
+    """
+    An inverted index from normalized song names to the setlists they were
+    played in, used to rank setlists by how well they cover a partial song
+    list
+
+    Attributes
+    ----------
+    setlists: list
+        the indexed setlists, in the order they were added
+    song_sets: list
+        the normalized songs of each setlist
+    postings: dict
+        maps each normalized song to the positions of the setlists with it
+    """
+    close_match_cutoff = 0.8
+
+    def __init__(self, setlists=None):
+        self.setlists = []
+        self.song_sets = []
+        self.postings = defaultdict(list)
+        if setlists:
+            self.add(setlists)
+
+    def add(self, setlists):
+        """
+        Adds setlists to the index
+        """
+        for setlist in setlists:
+            position = len(self.setlists)
+            songs = {normalize_title(song) for song in setlist_songs(setlist)}
+            songs.discard("")
+            self.setlists.append(setlist)
+            self.song_sets.append(songs)
+            for song in songs:
+                self.postings[song].append(position)
+
+    def match_song(self, name):
+        """
+        Returns the indexed song a remembered name refers to, allowing for
+        small typos, or None if nothing is close
+        """
+        song = normalize_title(name)
+        if song in self.postings:
+            return song
+        close = difflib.get_close_matches(song, self.postings.keys(), n=1,
+                                          cutoff=self.close_match_cutoff)
+        return close[0] if close else None
+
+    def weight(self, song):
+        """
+        Returns how telling it is that a song was played; songs played at
+        every show say little about which show it was
+        """
+        return math.log(1 + len(self.setlists) / len(self.postings[song]))
+
+    def query(self, songs, top_k=5):
+        """
+        Returns up to top_k (score, position) pairs for the setlists that best
+        match a partial song list, best first. The score is the weighted share
+        of the remembered songs that the setlist contains, between 0 and 1.
+
+        Params
+        ------
+        songs: list
+            The names of the songs the user remembers
+        top_k: int
+            The number of setlists to return
+        """
+        remembered = {normalize_title(song) for song in songs}
+        remembered.discard("")
+        matches = [self.match_song(song) for song in remembered]
+        # A typo and the exact title of one song count once
+        matched = {song for song in matches if song is not None}
+        if not matched:
+            return []
+
+        # Unknown songs still count against every setlist
+        unknown = matches.count(None)
+        total = sum(self.weight(song) for song in matched) + unknown
+        scores = defaultdict(float)
+        for song in matched:
+            song_weight = self.weight(song)
+            for position in self.postings[song]:
+                scores[position] = scores[position] + song_weight
+
+        # Prefer shorter sets when the coverage is equal
+        ranked = heapq.nsmallest(top_k, scores.items(),
+                                 key=lambda item: (-item[1], len(self.song_sets[item[0]])))
+        return [(score / total, position) for position, score in ranked]
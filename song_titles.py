@@ -0,0 +1,16 @@
+"""
+    Comparing song and artist names across setlist.fm and Spotify
+"""
+import re
+
+
+def normalize_title(title):
+    """
+    Returns a song or artist name reduced to the part that identifies it, so
+    "Song (Live) - 2011 Remaster" and "song" compare equal
+    """
+    title = title.lower().replace("&", "and")
+    title = re.sub(r"\(.*?\)|\[.*?\]", " ", title)
+    title = title.split(" - ")[0]
+    title = re.sub(r"[^\w\s]", "", title)
+    return " ".join(title.split())
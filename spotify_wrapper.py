@@ -1,17 +1,170 @@
 """
     Spotify Wrapper
 """
+import re
 import json
 import base64
 import datetime
-import operator
+import functools
+import threading
 from urllib.parse import urlencode, urlsplit, parse_qs
 import requests
+from requests.exceptions import RequestException
+
+from rate_limiter import SharedTokenBucket
+from request_guard import get_guard
+from song_titles import normalize_title
+
+
+# Live recordings are flagged in the track title, e.g. "Song - Live" or
+# "Song (Live at Wembley)", or by albums such as "Live in Chicago"
+LIVE_TRACK = re.compile(r"[(\[-]\s*live\b", re.IGNORECASE)
+LIVE_ALBUM = re.compile(r"[(\[-]\s*live\b|^live (at|in|from)\b", re.IGNORECASE)
+REMASTER = re.compile(r"\bremaster", re.IGNORECASE)
+DATE_PRECISION = {"year": 0, "month": 1, "day": 2}
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_release_date(release_date):
+    """
+    Returns a Spotify release date of any precision ("2011", "2011-05" or
+    "2011-05-17") as a (year, month, day) tuple, with 0 for missing parts.
+    The same albums come up again and again, so results are cached.
+    """
+    parts = [int(part) for part in release_date.split("-")[:3] if part.isdigit()]
+    return tuple(parts + [0] * (3 - len(parts)))
+
+
+class TrackRanker:
+    """
+    Scores tracks from search results against the song we want, keeping the
+    best so far so pages of results can be fed in as they arrive
+
+    Tracks by other artists are skipped. Tracks whose title matches are
+    ranked by, in order: whether the artist is the main one on the track,
+    whether it is a studio recording, whether it is a remaster (preferred for
+    the newest versions, avoided otherwise), the release date (newest or
+    oldest first, as preferred) and how precise that date is. Tracks that
+    only match the artist are ranked the same way as a fallback.
+
+    Attributes
+    ----------
+    title: str
+        the normalized title we are looking for
+    artist: str
+        the normalized artist name we are looking for
+    newest: bool
+        whether to prefer the newest release of the song
+    best: dict
+        the best track whose title matches, or None
+    best_key: tuple
+        the ranking key of best
+    loose: dict
+        the best track that only matches the artist, or None
+    loose_key: tuple
+        the ranking key of loose
+    contested: bool
+        whether the last page held another version of the song that only
+        the release date ranks below best
+    """
+
+    def __init__(self, song_name, artist_name, newest):
+        self.title = normalize_title(song_name)
+        self.artist = normalize_title(artist_name)
+        self.newest = newest
+        self.best = None
+        self.best_key = None
+        self.loose = None
+        self.loose_key = None
+        self.contested = False
+
+    def track_key(self, track):
+        """
+        Returns the key a track is ranked by, higher being better, or None if
+        it is not by our artist
+        """
+        artists = [normalize_title(art["name"]) for art in track["artists"]]
+        if self.artist not in artists:
+            return None
+
+        album = track["album"]
+        live = LIVE_TRACK.search(track["name"]) or LIVE_ALBUM.search(album["name"])
+        remaster = bool(REMASTER.search(track["name"]) or REMASTER.search(album["name"]))
+        date = parse_release_date(album["release_date"])
+        if not self.newest:
+            date = tuple(-part for part in date)
+        return (artists[0] == self.artist, not live, remaster == self.newest, date,
+                DATE_PRECISION.get(album["release_date_precision"], 0))
+
+    def add(self, tracks):
+        """
+        Scores a page of tracks
+        """
+        matches = []
+        for track in tracks:
+            if not track:
+                continue
+            key = self.track_key(track)
+            if key is None:
+                continue
+            if normalize_title(track["name"]) == self.title:
+                matches.append((track, key))
+                if self.best_key is None or key > self.best_key:
+                    self.best, self.best_key = track, key
+            elif self.loose_key is None or key > self.loose_key:
+                self.loose, self.loose_key = track, key
+
+        self.contested = any(track is not self.best and key[:3] == self.best_key[:3]
+                             for track, key in matches)
+
+    def decided(self):
+        """
+        Returns True once the best track is a studio recording by the artist
+        themselves and the last page held no rival version that only the
+        release date ranks below it. Search results are not ordered by date,
+        so while rivals keep turning up a later page may hold a newer (or
+        older, as preferred) one, or a remaster when we want the newest.
+        """
+        return self.best_key is not None and self.best_key[0] and \
+            self.best_key[1] and not self.contested
+
+    def found_artist(self):
+        """
+        Returns True if any track so far was by our artist
+        """
+        return self.best is not None or self.loose is not None
+
+
+class SongResolution:
+    """
+    The result of searching Spotify for every song in a setlist
+
+    Attributes
+    ----------
+    song_ids: list
+        the uris of the tracks we found, in setlist order
+    missing: int
+        the number of songs we could not find
+    match_tiers: dict
+        the search tier that resolved each song, None for missing songs
+    """
+
+    def __init__(self):
+        self.song_ids = []
+        self.missing = 0
+        self.match_tiers = {}
+
 
 class SpotifyWrapper():
     """
     A class to handle all Spotify API requests for our playlist generation
 
+    resolve_song, resolve_songs and create_playlist with explicit song ids only
+    return their results and take the version preference and market as
+    arguments, so one wrapper may be shared between threads. A created
+    playlist's id is returned to the caller and passed back in to add songs.
+    The access token is refreshed under a lock.
+
     Attributes
     ----------
     access_token: str
@@ -25,36 +178,116 @@ class SpotifyWrapper():
     access_token_is_expired: bool
         a boolean to keep track of if we have an expired access token and need
         to re-authenticate
+    user_authorized: bool
+        whether the access token was granted by the user, and so can make
+        playlists, rather than through client credentials
     client_id: str
         a string containing the id given to a Spotify application
     client_secret: str
         a string containing the client secret given to the Spotify application
     token_url: str
         the base url for submitting api requests for an auth token
+    limiter: SharedTokenBucket
+        the host-wide rate limiter shared by every user of this application
+    session: requests.Session
+        keeps connections to the API open between requests
+    market: str
+        an ISO country code (or "from_token") to limit searches to tracks
+        playable in that market
+    match_tiers: dict
+        the search tier that resolved each song in the last find_songs call
+    song_ids: list
+        the uris found by the last find_songs call
+    choose_new_version: bool
+        whether to prefer the newest release of a song, used when a call does
+        not say
+    song_cache: SongCache
+        songs we have already resolved, checked before searching
+    request_count: int
+        the number of requests this wrapper has sent
     """
 
-    # Member variables we need to send requests
-    access_token = None
-    access_token_expiration = datetime.datetime.now()
-    access_token_is_expired = True
-    client_id = None
-    client_secret = None
     # for getting auth token
     token_url = "https://accounts.spotify.com/api/token"
     auth_flow_url = "https://accounts.spotify.com/authorize"
 
-    # for keeping track of songs
-    song_ids = []
-
-    # for keeping track of playlist
-    playlist_id = None
-
-    # for choosing song version (e.g. rerelease)
-    choose_new_version = False
-
-    def __init__(self, client_id, client_secret):
+    # Spotify does not publish its limit, stay well under the rolling window
+    max_rate = 10
+    max_retries = 3
+    # Slow GETs are duplicated, see RequestGuard.hedged; recorded and
+    # replayed runs turn this off so each request maps to one exchange
+    hedge_requests = True
+    request_timeout = 10
+
+    # Search queries from most to least precise, see get_search_params
+    search_tiers = ("fielded", "artist_field", "free_text")
+    search_limit = 50
+    # Further pages are only requested while the artist shows up without a
+    # clear match for the version preference, see TrackRanker.decided
+    search_pages = 3
+    # Spotify adds at most 100 songs to a playlist per request
+    playlist_chunk_size = 100
+    # and looks up at most 50 tracks per request
+    tracks_batch_size = 50
+
+    def __init__(self, client_id, client_secret, limiter=None, market=None,
+                 song_cache=None):
         self.client_id = client_id
         self.client_secret = client_secret
+        self.market = market
+        self.song_cache = song_cache
+        self.request_count = 0
+        self.count_lock = threading.Lock()
+
+        # Member variables we need to send requests
+        self.access_token = None
+        self.access_token_expiration = datetime.datetime.now()
+        self.access_token_is_expired = True
+        self.user_authorized = False
+        self.token_lock = threading.Lock()
+
+        # for keeping track of songs
+        self.song_ids = []
+        self.match_tiers = {}
+
+        # for choosing song version (e.g. rerelease)
+        self.choose_new_version = False
+
+        if limiter is None:
+            limiter = SharedTokenBucket.for_key("spotify", client_id, self.max_rate,
+                                                capacity=self.max_rate)
+        self.limiter = limiter
+        self.session = requests.Session()
+
+    def send_request(self, method, url, **kwargs):
+        """
+        Sends a request through the guard for its host, which hedges slow GETs
+        and fails fast (or answers from its cache) while the host is down
+        """
+        kwargs.setdefault("timeout", self.request_timeout)
+        guard = get_guard(url)
+        # Requests the API turns away with a 429 are retried once the shared
+        # rate limiter lets us
+        for _ in range(self.max_retries + 1):
+            response = guard.send(method, url,
+                                  lambda: self.send_once(method, url, **kwargs),
+                                  kwargs, self.limiter, self.hedge_requests)
+            if response.status_code != 429:
+                break
+        return response
+
+    def send_once(self, method, url, **kwargs):
+        """
+        Sends a request and reports its outcome to the shared rate limiter.
+        The caller must already have taken a token.
+        """
+        # Hedges and concurrent searches send from several threads at once
+        with self.count_lock:
+            self.request_count = self.request_count + 1
+        response = self.session.request(method, url, **kwargs)
+        self.limiter.report(response.status_code,
+                            response.headers.get("Retry-After"))
+        return response
 
     def get_client_creds(self):
         """
@@ -95,25 +328,37 @@ class SpotifyWrapper():
         """
         Generates an oauth token that lasts an hour so we can make our requests
         """
-        req = requests.post(self.token_url, data=self.get_token_params(),
-                            headers=self.get_token_header())
+        req = self.send_request("POST", self.token_url, data=self.get_token_params(),
+                                headers=self.get_token_header())
 
         # Check we got a valid response
         if req.status_code in range(200, 299):
-            token_response = req.json()
-            # Figure out expiration time
-            now = datetime.datetime.now()
-            expires_time = token_response['expires_in']  # expiration time in seconds
-            expiration = now + datetime.timedelta(seconds=expires_time)
-            self.access_token_expiration = expiration
-            self.access_token_is_expired = False
-            # Update access token
-            self.access_token = token_response['access_token']
-
+            self.set_token(req.json(), False)
             return True
 
         return False
 
+    def set_token(self, token_response, user_authorized):
+        """
+        Keeps the access token from a token response
+
+        Params
+        ------
+        token_response: dict
+            The decoded response of the token endpoint
+        user_authorized: bool
+            Whether the user granted the token
+        """
+        # Figure out expiration time
+        now = datetime.datetime.now()
+        expires_time = token_response['expires_in']  # expiration time in seconds
+        expiration = now + datetime.timedelta(seconds=expires_time)
+        self.access_token_expiration = expiration
+        self.access_token_is_expired = False
+        # Update access token
+        self.access_token = token_response['access_token']
+        self.user_authorized = user_authorized
+
     def get_login_params(self):
         """
         Returns the request body for application auth workflow
@@ -149,26 +394,32 @@ class SpotifyWrapper():
         query = parse_qs(urlsplit(redirect_url).query)
         code = query['code'][0]
         # request access token
-        token = requests.post(url=self.token_url,
-                              data=self.get_auth_params(code),
-                              headers=self.get_token_header())
+        token = self.send_request("POST", self.token_url,
+                                  data=self.get_auth_params(code),
+                                  headers=self.get_token_header())
 
         # Check we got a valid response
         if token.status_code in range(200, 299):
-            token_response = token.json()
-            # Figure out expiration time
-            now = datetime.datetime.now()
-            expires_time = token_response['expires_in']  # expiration time in seconds
-            expiration = now + datetime.timedelta(seconds=expires_time)
-            self.access_token_expiration = expiration
-            self.access_token_is_expired = False
-            # Update access token
-            self.access_token = token_response['access_token']
+            self.set_token(token.json(), True)
             return True
 
         token.raise_for_status()
         return False
 
+    def authorize_user(self):
+        """
+        Asks the user to authorize us unless they already have and their token
+        is still valid. Returns True once we may make playlists.
+        """
+        if self.user_authorized and \
+           datetime.datetime.now() < self.access_token_expiration:
+            return True
+        try:
+            return self.gen_auth_token()
+        except (RequestException, KeyError) as err:
+            print(f"Could not authorize with Spotify: {err}")
+            return False
+
     def get_search_header(self):
         """
         Returns the header field for search endpoints
@@ -177,7 +428,8 @@ class SpotifyWrapper():
             "Authorization": f"Bearer {self.access_token}"
         }
 
-    def get_search_params(self, song_name, artist_name):
+    def get_search_params(self, song_name, artist_name, tier="free_text", offset=0,
+                          market=None):
         """
         Returns the search body for a song name and artist name
 
@@ -187,11 +439,35 @@ class SpotifyWrapper():
             The name of the song
         artist_name: str
             The name of the artist
-        """
-        return {
-            "q": f"{artist_name} {song_name}",
-            "type": "track"
+        tier: str
+            How precise the query should be, one of search_tiers
+        offset: int
+            The index of the first result to return, for paging
+        market: str
+            The market to limit results to, defaults to ours
+        """
+        # Quotes would end the field filters early
+        song = song_name.replace('"', "")
+        artist = artist_name.replace('"', "")
+
+        if tier == "fielded":
+            query = f'track:"{song}" artist:"{artist}"'
+        elif tier == "artist_field":
+            query = f'{song} artist:"{artist}"'
+        else:
+            query = f"{artist_name} {song_name}"
+
+        params = {
+            "q": query,
+            "type": "track",
+            "limit": self.search_limit
         }
+        if offset:
+            params["offset"] = offset
+        market = market or self.market
+        if market:
+            params["market"] = market
+        return params
 
     def set_version_choice(self, choice):
         """
@@ -207,9 +483,67 @@ class SpotifyWrapper():
         log_file.write(json.dumps(res, indent=2, sort_keys=True))
         log_file.close()
 
-    def find_song(self, song_name, artist_name):
+    def search_tracks(self, song_name, artist_name, tier, offset=0, market=None):
+        """
+        Runs one search query and returns the matching tracks, or None if the
+        request failed
         """
-        Searches for a specified song in the spotify API
+        search_url = "https://api.spotify.com/v1/search"
+        try:
+            response = self.send_request("GET", search_url,
+                                         params=self.get_search_params(song_name,
+                                                                       artist_name, tier,
+                                                                       offset, market),
+                                         headers=self.get_search_header())
+        except RequestException as err:
+            print(f"Search for {song_name} by {artist_name} failed: {err}")
+            return None
+
+        # Validate response
+        status = response.status_code
+        if status not in range(200, 299):
+            print(f"Error {status}. Search for {song_name} by {artist_name} "
+                  + "unsuccessful.")
+            return None
+
+        return response.json()
+
+    def token_expired(self):
+        """
+        Returns whether we need a new access token
+        """
+        return self.access_token_is_expired or \
+            datetime.datetime.now() >= self.access_token_expiration
+
+    def ensure_token(self):
+        """
+        Gets a client credentials token if we have no valid token, making sure
+        concurrent callers only request one
+        """
+        with self.token_lock:
+            if self.token_expired():
+                self.gen_cc_access_token()
+
+    def prefetch_token(self):
+        """
+        Starts getting a client credentials token in the background so it is
+        ready by our first search. ensure_token waits for it.
+        """
+        def fetch():
+            try:
+                self.ensure_token()
+            except RequestException:
+                # ensure_token tries again, and reports the error, when needed
+                pass
+
+        thread = threading.Thread(target=fetch, daemon=True)
+        thread.start()
+        return thread
+
+    def resolve_song(self, song_name, artist_name, newest=None, market=None):
+        """
+        Returns the uri of a song and the tier that found it, or (None, None)
+        if there is no match. Songs in our song cache are not searched again.
 
         Params
         ------
@@ -217,60 +551,151 @@ class SpotifyWrapper():
             The name of the song
         artist_name: str
             The name of the artist
+        newest: bool
+            Whether to prefer the newest release, defaults to
+            choose_new_version
+        market: str
+            The market to search in, defaults to ours
         """
-        if self.access_token_is_expired:
-            self.gen_cc_access_token()
+        return self.try_resolve_song(song_name, artist_name, newest, market) or \
+            (None, None)
 
-        search_url = "https://api.spotify.com/v1/search"
-        response = requests.get(url=search_url,
-                                params=self.get_search_params(song_name, artist_name),
-                                headers=self.get_search_header())
+    def try_resolve_song(self, song_name, artist_name, newest=None, market=None):
+        """
+        Like resolve_song, but returns None if a request failed so callers can
+        tell a song that is missing from Spotify from one we could not search
+        """
+        if newest is None:
+            newest = self.choose_new_version
+        market = market or self.market
 
-        # Validate response
-        status = response.status_code
-        if status not in range(200, 299):
-            print(f"Error {status}. Search for {song_name} by {artist_name} "
-                  + "unsuccessful.")
-            return False
+        if self.song_cache is not None:
+            cached = self.song_cache.get(artist_name, song_name, market, newest)
+            if cached is not None:
+                return cached
 
-        # Pull needed data from response
-        res = response.json()
+        found = self.search_song(song_name, artist_name, newest, market)
+        if found is None:
+            return None
 
-        if res["tracks"]["total"] < 1:
-            print(f"No result found for {song_name}")
-            return False
+        if self.song_cache is not None:
+            self.song_cache.put(artist_name, song_name, market, newest, *found)
+        return found
 
-        # Just get first match for now
-        song_versions = []
-        for track in res["tracks"]["items"]:
-            if track["artists"][0]["name"] == artist_name:
-                uri = track["uri"]
-                # grab release date
-                date_formatted = track["album"]["release_date"]
-                # and format
-                if track["album"]["release_date_precision"] == "year":
-                    release_date = datetime.datetime.strptime(date_formatted, "%Y").date()
-                elif track["album"]["release_date_precision"] == "month":
-                    release_date = datetime.datetime.strptime(date_formatted, "%Y-%m").date()
-                else:
-                    release_date = datetime.datetime.strptime(date_formatted, "%Y-%m-%d").date()
-                # add to dict
-                song_versions.append({"uri": uri, "date": release_date})
-
-        # find newest version
-        song_versions.sort(key=operator.itemgetter("date"), reverse=True)
-        if len(song_versions) > 0:
-            self.song_ids.append(song_versions[0]["uri"])
-            return True
+    def search_song(self, song_name, artist_name, newest=None, market=None):
+        """
+        Searches for a specified song in the spotify API and returns its uri
+        and the tier that found it, (None, None) if there is no match, or None
+        if a request failed
 
+        Queries go from most to least precise and we stop as soon as one finds
+        a track whose title and artist both match. Tracks that only match the
+        artist are kept as a fallback in case no query does better. Results
+        are ranked by TrackRanker; further pages of a query are requested only
+        while the artist shows up without a clear winner for the version
+        preference.
+
+        Params
+        ------
+        song_name: str
+            The name of the song
+        artist_name: str
+            The name of the artist
+        newest: bool
+            Whether to prefer the newest release, defaults to
+            choose_new_version
+        market: str
+            The market to search in, defaults to ours
+        """
+        if newest is None:
+            newest = self.choose_new_version
+        try:
+            self.ensure_token()
+        except RequestException as err:
+            print(f"Could not get a Spotify token: {err}")
+            return None
+
+        fallback = None
+        fallback_tier = None
+        res = None
+
+        for tier in self.search_tiers:
+            ranker = TrackRanker(song_name, artist_name, newest)
+            for page_num in range(self.search_pages):
+                res = self.search_tracks(song_name, artist_name, tier,
+                                         page_num * self.search_limit, market)
+                if res is None:
+                    return None
+                ranker.add(res["tracks"]["items"])
+                if ranker.decided() or not ranker.found_artist() or \
+                   not res["tracks"].get("next"):
+                    break
+
+            if ranker.best is not None:
+                return ranker.best["uri"], tier
+
+            if ranker.loose is not None and fallback is None:
+                fallback = ranker.loose["uri"]
+                fallback_tier = f"{tier} (artist only)"
+
+        if fallback is not None:
+            return fallback, fallback_tier
 
-        # print(self.get_search_params(song_name, artist_name))
         # make log file
-        self.log_json(song_name, artist_name, response.json())
+        self.log_json(song_name, artist_name, res)
 
         print(f"Could not find {song_name} by {artist_name}. " +
               "It may be missing from Spotify")
-        return False
+        return None, None
+
+    def find_song(self, song_name, artist_name):
+        """
+        Searches for a specified song and adds it to our songs if found. The
+        tier that resolved the song is recorded in match_tiers.
+
+        Params
+        ------
+        song_name: str
+            The name of the song
+        artist_name: str
+            The name of the artist
+        """
+        uri, tier = self.resolve_song(song_name, artist_name)
+        self.match_tiers[song_name] = tier
+        if uri is None:
+            return False
+
+        self.song_ids.append(uri)
+        return True
+
+    def resolve_songs(self, artist_name, song_list, newest=None, market=None):
+        """
+        Searches for all given songs and returns a SongResolution
+
+        Params
+        ------
+        artist_name: str
+            The name of the artist
+        song_list: list
+            A list of the songs we are searching for
+        newest: bool
+            Whether to prefer the newest releases, defaults to
+            choose_new_version
+        market: str
+            The market to search in, defaults to ours
+        """
+        result = SongResolution()
+        for song in song_list:
+            uri, tier = self.resolve_song(song, artist_name, newest, market)
+            result.match_tiers[song] = tier
+            if uri is None:
+                result.missing = result.missing + 1
+            else:
+                result.song_ids.append(uri)
+
+        if self.song_cache is not None:
+            self.song_cache.save()
+        return result
 
     def find_songs(self, artist_name, song_list):
         """
@@ -283,16 +708,11 @@ class SpotifyWrapper():
         song_list: list
             A list of the songs we are searching for
         """
-        # clear song list
-        self.song_ids = []
+        result = self.resolve_songs(artist_name, song_list)
+        self.song_ids = result.song_ids
+        self.match_tiers = result.match_tiers
 
-        missing = 0
-        for song in song_list:
-            result = self.find_song(song, artist_name)
-            if not result:
-                missing = missing + 1
-
-        return missing
+        return result.missing
 
     def get_user_headers(self):
         """
@@ -309,7 +729,7 @@ class SpotifyWrapper():
         Gets the users id
         """
         me_url = "https://api.spotify.com/v1/me"
-        response = requests.get(url=me_url, headers=self.get_user_headers())
+        response = self.send_request("GET", me_url, headers=self.get_user_headers())
 
         status = response.status_code
         if status not in range(200, 299):
@@ -339,19 +759,113 @@ class SpotifyWrapper():
             "Content-Type": "application/json"
         }
 
-    def get_populate_header(self):
+    def get_populate_header(self, playlist_id):
         """
         Returns the request headers for adding items to a playlist in json format
         """
         return {
             "Authorization": f"Bearer {self.access_token}",
             "Content-Type": "application/json",
-            "playlist_id": f"{self.playlist_id}"
+            "playlist_id": f"{playlist_id}"
         }
 
-    def create_playlist(self, name, desc):
-        """
-        Creates a new playlist on Spotify
+    def get_tracks_params(self, batch):
+        """
+        Returns the query for looking up a batch of track uris
+        """
+        market = self.market or ("from_token" if self.user_authorized else None)
+        params = {"ids": ",".join(uri.rsplit(":", 1)[-1] for uri in batch)}
+        if market:
+            params["market"] = market
+        return params
+
+    def fetch_tracks(self, song_ids):
+        """
+        Returns the track objects for the given uris, in order, or None if a
+        request failed. Tracks are looked up tracks_batch_size at a time.
+
+        With a market, Spotify replaces tracks that cannot be played there
+        with a playable release of the same recording where it has one, and
+        flags the rest with is_playable.
+        """
+        tracks_url = "https://api.spotify.com/v1/tracks"
+        tracks = []
+        for start in range(0, len(song_ids), self.tracks_batch_size):
+            batch = song_ids[start:start + self.tracks_batch_size]
+            try:
+                response = self.send_request("GET", tracks_url,
+                                             params=self.get_tracks_params(batch),
+                                             headers=self.get_search_header())
+            except RequestException as err:
+                print(f"Could not check songs: {err}")
+                return None
+
+            status = response.status_code
+            if status not in range(200, 299):
+                print(f"Error {status}. Could not check songs.")
+                return None
+            tracks.extend(response.json()["tracks"])
+        return tracks
+
+    def validate_tracks(self, song_ids, song_names=None):
+        """
+        Returns the given uris with unplayable tracks swapped for playable
+        releases, or dropped if there are none. A recording (by ISRC) that
+        two different songs of the setlist resolved to is kept only for the
+        first, as the other match is wrong; a song played twice, such as a
+        reprise, keeps both. If the tracks cannot be looked up, the uris are
+        returned unchanged.
+
+        Params
+        ------
+        song_ids: list
+            The uris of the tracks, in playlist order
+        song_names: list
+            The setlist song each uri was found for. Without them, repeats of
+            the same uri count as the same song and only different uris of
+            one recording are dropped.
+        """
+        tracks = self.fetch_tracks(song_ids)
+        if tracks is None:
+            return song_ids
+        return self.filter_tracks(tracks, song_ids, song_names)
+
+    def filter_tracks(self, tracks, song_ids, song_names=None):
+        """
+        Returns the playable uris of looked up tracks, see validate_tracks
+        """
+        if song_names is None:
+            songs = song_ids
+        else:
+            songs = [normalize_title(name) for name in song_names]
+
+        valid = []
+        recordings = {}
+        unplayable = 0
+        duplicates = 0
+        for track, song in zip(tracks, songs):
+            # Unknown ids come back as null
+            if not track or not track.get("is_playable", True):
+                unplayable = unplayable + 1
+                continue
+            recording = track.get("external_ids", {}).get("isrc") or track["uri"]
+            if recordings.setdefault(recording, song) != song:
+                duplicates = duplicates + 1
+                continue
+            # Relinked tracks carry the uri of the playable release
+            valid.append(track["uri"])
+
+        if unplayable > 0:
+            print(f"Skipping {unplayable} songs that cannot be played in your market.")
+        if duplicates > 0:
+            print(f"Skipping {duplicates} songs that matched the same recording as " +
+                  "another song.")
+        return valid
+
+    def create_empty_playlist(self, name, desc):
+        """
+        Creates a new, empty playlist on Spotify and returns its id and url, or
+        None if it could not be made
 
         Params
         ------
@@ -360,40 +874,86 @@ class SpotifyWrapper():
         desc: str
             The description for the playlist
         """
-        # Avoid empty playlists
-        if len(self.song_ids) < 1:
-            print("Setlist is empty.")
-            return False
-
-        # Create playlist
-        create_url = f"https://api.spotify.com/v1/users/{self.get_user_id()}/playlists"
-        response = requests.post(url=create_url,
-                                 data=json.dumps(self.get_creation_body(name, desc)),
-                                 headers=self.get_creation_header())
+        try:
+            create_url = f"https://api.spotify.com/v1/users/{self.get_user_id()}/playlists"
+            response = self.send_request("POST", create_url,
+                                         data=json.dumps(self.get_creation_body(name, desc)),
+                                         headers=self.get_creation_header())
+        except RequestException as err:
+            print(f"Could not make playlist: {err}")
+            return None
 
         # Validate creation
         status = response.status_code
         if status not in range(200, 299):
             print("Could not make playlist")
-            return False
+            return None
 
         res = response.json()
-        self.playlist_id = res["id"]
+        return res["id"], res['external_urls']['spotify']
+
+    def add_playlist_tracks(self, playlist_id, song_ids):
+        """
+        Adds up to playlist_chunk_size songs to a playlist. Returns True on
+        success.
+        """
+        update_url = f"https://api.spotify.com/v1/playlists/{playlist_id}/tracks"
+        try:
+            response = self.send_request("POST", update_url,
+                                         data=json.dumps(song_ids),
+                                         headers=self.get_populate_header(playlist_id))
+        except RequestException as err:
+            print(f"Could not add songs to the playlist: {err}")
+            return False
+        return response.status_code in range(200, 299)
+
+    def chunk_songs(self, song_ids):
+        """
+        Splits songs into the batches Spotify accepts in one request
+        """
+        size = self.playlist_chunk_size
+        return [song_ids[start:start + size] for start in range(0, len(song_ids), size)]
+
+    def create_playlist(self, name, desc, song_ids=None):
+        """
+        Creates a new playlist on Spotify
+
+        Params
+        ------
+        name: str
+            The name for the playlist
+        desc: str
+            The description for the playlist
+        song_ids: list
+            The uris to add, defaults to those found by the last find_songs call
+        """
+        if song_ids is None:
+            song_ids = self.song_ids
+
+        # Avoid empty playlists, checking first which songs can be played
+        if song_ids:
+            song_ids = self.validate_tracks(song_ids)
+        if len(song_ids) < 1:
+            print("Setlist is empty.")
+            return False
+
+        # Create playlist
+        created = self.create_empty_playlist(name, desc)
+        if created is None:
+            return False
+        playlist_id, playlist_url = created
 
         # Populate playlist
-        update_url = f"https://api.spotify.com/v1/playlists/{self.playlist_id}/tracks"
-        requests.post(url=update_url,
-                      data=json.dumps(self.song_ids),
-                      headers=self.get_populate_header())
+        for chunk in self.chunk_songs(song_ids):
+            if not self.add_playlist_tracks(playlist_id, chunk):
+                print("Could not add every song to the playlist")
+                break
 
         # Give url
-        playlist_url = res['external_urls']['spotify']
         print(f"Playlist created! Available at: {playlist_url}")
         return True
 
 
-
-
 def main():
     """
     False main to clarify accidental calls
@@ -0,0 +1,23 @@
+"""
+    Makes the modules at the top of the repo importable from the tests, and
+    gives every test fresh request guards
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import request_guard  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def fresh_guards():
+    """
+    Drops the guards, and so the circuit breakers and response caches, that
+    earlier tests left behind
+    """
+    with request_guard.guards_lock:
+        request_guard.guards.clear()
+    yield
@@ -0,0 +1,200 @@
+"""
+    Stand-ins for the HTTP sessions the wrappers send requests through, and
+    a local server for the async session
+"""
+import json
+import asyncio
+import threading
+from urllib.parse import urlsplit, parse_qs
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+def make_response(status=200, body=None, headers=None, url=""):
+    """
+    Returns a requests.Response with the given status and JSON (or bytes) body
+    """
+    response = requests.Response()
+    response.status_code = status
+    response.headers = CaseInsensitiveDict(headers or {})
+    response.url = url
+    if isinstance(body, bytes):
+        response._content = body
+    else:
+        response._content = json.dumps(body if body is not None else {}).encode("utf-8")
+    response._content_consumed = True
+    return response
+
+
+class FakeSession:
+    """
+    Answers requests with handlers looked up by method and url path
+
+    A handler takes the url, the query parameters and the request's keyword
+    arguments and returns a Response, a (status, body) tuple, or a body for a
+    200. It may also raise a RequestException.
+
+    Attributes
+    ----------
+    routes: dict
+        maps (method, path) to a handler
+    requests: list
+        every (method, url, kwargs) sent, in order
+    """
+
+    def __init__(self, routes):
+        self.routes = routes
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def request(self, method, url, **kwargs):
+        handler, params = self.route(method, url, kwargs)
+        return self.to_response(handler(url, params, kwargs), url)
+
+    def route(self, method, url, kwargs):
+        """
+        Records a request and returns its handler and query parameters
+        """
+        with self.lock:
+            self.requests.append((method, url, kwargs))
+        parts = urlsplit(url)
+        params = {key: values[0] for key, values in parse_qs(parts.query).items()}
+        params.update(kwargs.get("params") or {})
+        return self.routes[(method, parts.path)], params
+
+    def to_response(self, result, url):
+        """
+        Returns the Response for what a handler returned
+        """
+        if isinstance(result, requests.Response):
+            return result
+        if isinstance(result, tuple):
+            return make_response(result[0], result[1], url=url)
+        return make_response(200, result, url=url)
+
+    def count(self, method, path):
+        """
+        Returns how many requests were sent to a path
+        """
+        with self.lock:
+            return sum(1 for sent, url, _ in self.requests
+                       if sent == method and urlsplit(url).path == path)
+
+    def mount(self, prefix, adapter):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeAsyncSession(FakeSession):
+    """
+    A FakeSession for the async clients. Handlers are called as for
+    FakeSession, and may instead be coroutine functions.
+
+    Attributes
+    ----------
+    in_flight: int
+        the number of requests being answered
+    most_in_flight: int
+        the highest in_flight reached
+    delay: float
+        the seconds every request takes
+    """
+
+    def __init__(self, routes, delay=0.0):
+        super().__init__(routes)
+        self.in_flight = 0
+        self.most_in_flight = 0
+        self.delay = delay
+
+    async def request(self, method, url, **kwargs):
+        self.in_flight = self.in_flight + 1
+        self.most_in_flight = max(self.most_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            handler, params = self.route(method, url, kwargs)
+            result = handler(url, params, kwargs)
+            if asyncio.iscoroutine(result):
+                result = await result
+            return self.to_response(result, url)
+        finally:
+            self.in_flight = self.in_flight - 1
+
+    async def close(self):
+        pass
+
+
+class LocalServer:
+    """
+    An HTTP/1.1 server on localhost for testing the async session. Start it
+    with "async with" from the event loop under test.
+
+    A handler takes the method, the request target, the headers and the body
+    and returns (status, headers, body). Returning None closes the connection
+    without answering.
+
+    Attributes
+    ----------
+    handler: callable
+        answers every request
+    connections: int
+        the number of connections accepted
+    requests: list
+        every (method, target, headers, body) received
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.connections = 0
+        self.requests = []
+        self.server = None
+        self.url = ""
+
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self.serve, "127.0.0.1", 0)
+        self.url = f"http://127.0.0.1:{self.server.sockets[0].getsockname()[1]}"
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def serve(self, reader, writer):
+        self.connections = self.connections + 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = CaseInsensitiveDict()
+                line = await reader.readline()
+                while line.strip():
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name] = value.strip()
+                    line = await reader.readline()
+                body = await reader.readexactly(int(headers.get("Content-Length", 0)))
+                self.requests.append((method, target, headers, body))
+
+                answer = self.handler(method, target, headers, body)
+                if asyncio.iscoroutine(answer):
+                    answer = await answer
+                if answer is None:
+                    break
+                status, response_headers, response_body = answer
+                response_headers = dict(response_headers)
+                if "Transfer-Encoding" not in response_headers:
+                    response_headers["Content-Length"] = str(len(response_body))
+                lines = [f"HTTP/1.1 {status} OK"]
+                lines.extend(f"{name}: {value}" for name, value in response_headers.items())
+                writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") +
+                             response_body)
+                await writer.drain()
+                if response_headers.get("Connection") == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
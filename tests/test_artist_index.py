@@ -0,0 +1,145 @@
+"""
+    Tests for the local artist index and settling on an artist from it
+"""
+import time
+
+import playlist_gen
+from artist_index import ArtistIndex
+from setlist_fm_wrapper import SetlistFmWrapper
+from transport import NoLimit
+
+LOW_US = {"name": "Low", "mbid": "low-us", "disambiguation": "US band"}
+LOW_UK = {"name": "Low", "mbid": "low-uk", "disambiguation": "UK band"}
+
+
+def test_exact_and_prefix_lookups_ignore_case():
+    index = ArtistIndex()
+    index.add_all([LOW_US, {"name": "Lower Than Atlantis", "mbid": "lta"},
+                   {"name": "Radiohead", "mbid": "rh"}])
+
+    assert [artist["mbid"] for artist in index.lookup("  LOW ")] == ["low-us"]
+    assert [artist["name"] for artist in index.prefix("lo")] == ["Low", "Lower Than Atlantis"]
+    assert index.lookup("Lo") is None
+
+
+def test_setlist_payload_keeps_disambiguation_from_search():
+    index = ArtistIndex()
+    index.add(LOW_US)
+
+    assert not index.add({"name": "Low", "mbid": "low-us"})
+    assert index.lookup("low")[0]["disambiguation"] == "US band"
+
+
+def test_artists_expire():
+    index = ArtistIndex(ttl=60)
+    index.add(LOW_US, seen=time.time() - 120)
+
+    assert index.lookup("low") is None
+    # Seeing the artist again refreshes it
+    assert index.add(LOW_US)
+    assert index.lookup("low") is not None
+
+
+def test_picks_are_remembered_forgotten_and_expire(tmp_path):
+    path = str(tmp_path / "artists.json")
+    index = ArtistIndex(path)
+    index.add_all([LOW_US, LOW_UK])
+    assert len(index.lookup("low")) == 2
+
+    index.remember_choice("Low", "low-uk")
+    index.save()
+    assert [artist["mbid"] for artist in ArtistIndex(path).lookup("low")] == ["low-uk"]
+
+    index.forget_choice("low")
+    assert len(index.lookup("low")) == 2
+
+    index.choices["low"] = {"mbid": "low-uk", "at": time.time() - 120}
+    index.ttl = 60
+    assert index.chosen("low") is None
+
+
+def test_untimed_picks_from_old_files_are_ignored(tmp_path):
+    path = tmp_path / "artists.json"
+    path.write_text('{"artists": [{"name": "Low", "mbid": "low-us"}], '
+                    '"choices": {"low": "low-us"}}')
+
+    assert ArtistIndex(str(path)).chosen("low") is None
+
+
+def make_setlist_fm(index, api_artists):
+    """
+    Returns a wrapper over index whose artist searches return api_artists
+    """
+    setlist = SetlistFmWrapper("key", limiter=NoLimit(), artist_index=index)
+    setlist.searches = []
+
+    def search_artists(name):
+        setlist.searches.append(name)
+        index.add_all(api_artists)
+        return list(api_artists)
+    setlist.search_artists = search_artists
+    return setlist
+
+
+def answer(monkeypatch, *replies):
+    """
+    Makes input() return the given replies in turn
+    """
+    replies = iter(replies)
+    monkeypatch.setattr("builtins.input", lambda prompt="": next(replies))
+
+
+def test_only_known_artist_can_be_changed(monkeypatch):
+    # Learned from a setlist payload, never confirmed by the user
+    index = ArtistIndex()
+    index.add({"name": "Low", "mbid": "low-us"})
+    setlist = make_setlist_fm(index, [LOW_US, LOW_UK])
+
+    answer(monkeypatch, "")
+    assert playlist_gen.find_artist(setlist, "Low")
+    assert setlist.get_artist_id() == "low-us" and setlist.searches == []
+
+    answer(monkeypatch, "c", "2")
+    assert playlist_gen.find_artist(setlist, "Low")
+    assert setlist.get_artist_id() == "low-uk" and setlist.searches == ["Low"]
+
+
+def test_none_of_these_searches_the_api(monkeypatch):
+    index = ArtistIndex()
+    index.add_all([LOW_US, {"name": "Low", "mbid": "low-old"}])
+    setlist = make_setlist_fm(index, [LOW_US, LOW_UK])
+
+    answer(monkeypatch, "0", "2")
+    assert playlist_gen.find_artist(setlist, "low")
+    assert setlist.get_artist_id() == "low-uk"
+    assert setlist.searches == ["low"]
+
+    # The pick is used next time, and can still be changed
+    answer(monkeypatch, "")
+    assert playlist_gen.find_artist(setlist, "low")
+    assert setlist.get_artist_id() == "low-uk" and setlist.artist_picked_before
+
+
+def test_api_candidates_have_no_none_option(monkeypatch):
+    setlist = make_setlist_fm(ArtistIndex(), [LOW_US, LOW_UK])
+    prompts = []
+    replies = iter(["0", "1"])
+
+    def fake_input(prompt=""):
+        prompts.append(prompt)
+        return next(replies)
+    monkeypatch.setattr("builtins.input", fake_input)
+
+    assert playlist_gen.find_artist(setlist, "low")
+    assert setlist.get_artist_id() == "low-us"
+    assert all("0 -" not in prompt for prompt in prompts)
+
+
+def test_unknown_artist_suggests_known_names(monkeypatch, capsys):
+    index = ArtistIndex()
+    index.add_all([LOW_US, LOW_UK])
+    setlist = make_setlist_fm(index, [])
+    setlist.search_artists = lambda name: None
+
+    assert not playlist_gen.find_artist(setlist, "lo")
+    assert "Artists you have searched for before: Low" in capsys.readouterr().out
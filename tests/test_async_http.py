@@ -0,0 +1,143 @@
+"""
+    Tests for the asyncio HTTP session behind the async clients
+"""
+import gzip
+import json
+import asyncio
+
+import pytest
+from requests.exceptions import ConnectionError, ReadTimeout
+
+from async_http import AsyncSession
+from fakes import LocalServer
+
+
+def echo(method, target, headers, body):
+    """
+    Answers with what was asked, as JSON
+    """
+    return 200, {"Content-Type": "application/json"}, json.dumps({
+        "method": method, "target": target, "body": body.decode()}).encode()
+
+
+def run(scenario):
+    """
+    Runs a scenario coroutine with a fresh session
+    """
+    async def main():
+        session = AsyncSession(pool_size=2)
+        try:
+            return await scenario(session)
+        finally:
+            await session.close()
+    return asyncio.run(main())
+
+
+def test_requests_reuse_one_connection():
+    async def scenario(session):
+        async with LocalServer(echo) as server:
+            answers = []
+            for num in range(3):
+                response = await session.request("GET", f"{server.url}/search",
+                                                 params={"q": f"a b {num}"}, timeout=5)
+                answers.append(response.json()["target"])
+            form = await session.request("POST", f"{server.url}/token",
+                                         data={"grant_type": "client_credentials"},
+                                         timeout=5)
+            return server.connections, answers, form.json()["body"]
+
+    connections, answers, body = run(scenario)
+    assert connections == 1
+    assert answers == [f"/search?q=a+b+{num}" for num in range(3)]
+    assert body == "grant_type=client_credentials"
+
+
+def test_concurrent_requests_use_their_own_connections():
+    async def slow(method, target, headers, body):
+        await asyncio.sleep(0.05)
+        return echo(method, target, headers, body)
+
+    async def scenario(session):
+        async with LocalServer(slow) as server:
+            await asyncio.gather(*[session.request("GET", f"{server.url}/{num}", timeout=5)
+                                   for num in range(4)])
+            idle = sum(len(pool) for pool in session.idle.values())
+            await session.request("GET", f"{server.url}/again", timeout=5)
+            return server.connections, idle
+
+    connections, idle = run(scenario)
+    assert connections == 4
+    # Only pool_size connections are kept for later requests
+    assert idle == 2
+
+
+def test_chunked_and_gzipped_bodies():
+    payload = json.dumps({"setlist": ["x" * 100] * 50}).encode()
+    packed = gzip.compress(payload)
+    chunked = b"".join(b"%x\r\n%s\r\n" % (len(packed[start:start + 300]),
+                                          packed[start:start + 300])
+                       for start in range(0, len(packed), 300)) + b"0\r\n\r\n"
+
+    def answer(method, target, headers, body):
+        assert "gzip" in headers["Accept-Encoding"]
+        return 200, {"Transfer-Encoding": "chunked", "Content-Encoding": "gzip"}, chunked
+
+    async def scenario(session):
+        async with LocalServer(answer) as server:
+            first = await session.request("GET", f"{server.url}/page", timeout=5)
+            second = await session.request("GET", f"{server.url}/page", timeout=5)
+            return first.content, second.content, server.connections
+
+    first, second, connections = run(scenario)
+    assert first == second == payload
+    assert connections == 1
+
+
+def test_stale_connection_is_replaced_for_gets_only():
+    answered = []
+
+    def hang_up_after_first(method, target, headers, body):
+        # The server drops a kept-alive connection as the next request arrives
+        if answered:
+            answered.clear()
+            return None
+        answered.append(target)
+        return echo(method, target, headers, body)
+
+    async def scenario(session):
+        async with LocalServer(hang_up_after_first) as server:
+            await session.request("GET", f"{server.url}/one", timeout=5)
+            retried = await session.request("GET", f"{server.url}/two", timeout=5)
+            await session.request("GET", f"{server.url}/three", timeout=5)
+            with pytest.raises(ConnectionError):
+                await session.request("POST", f"{server.url}/four", data="{}", timeout=5)
+            return retried.json()["target"], [sent[1] for sent in server.requests]
+
+    target, sent = run(scenario)
+    assert target == "/two"
+    # The POST is not sent again, it may have been acted on
+    assert sent == ["/one", "/two", "/two", "/three", "/three", "/four"]
+
+
+def test_slow_response_times_out():
+    async def stall(method, target, headers, body):
+        await asyncio.sleep(1)
+        return echo(method, target, headers, body)
+
+    async def scenario(session):
+        async with LocalServer(stall) as server:
+            with pytest.raises(ReadTimeout):
+                await session.request("GET", f"{server.url}/slow", timeout=0.1)
+            return session.idle
+
+    assert not any(run(scenario).values())
+
+
+def test_refused_connection():
+    async def scenario(session):
+        async with LocalServer(echo) as server:
+            url = server.url
+        with pytest.raises(ConnectionError):
+            await session.request("GET", f"{url}/gone", timeout=5)
+
+    run(scenario)
@@ -0,0 +1,154 @@
+"""
+    Tests for the asyncio clients
+"""
+import json
+import time
+import asyncio
+
+from async_wrappers import AsyncSetlistFmWrapper, AsyncSpotifyWrapper
+from fakes import FakeAsyncSession, LocalServer
+from request_guard import get_guard
+from transport import NoLimit
+
+
+def setlist_page(page_num, total=55):
+    """
+    Returns a search page of 20 setlists, the last one shorter
+    """
+    count = min(20, total - (page_num - 1) * 20)
+    return {"type": "setlists", "itemsPerPage": 20, "page": page_num, "total": total,
+            "setlist": [{"id": f"{page_num}-{num}", "eventDate": "01-01-2019",
+                         "artist": {"name": "Band", "mbid": "mbid"},
+                         "sets": {"set": [{"song": [{"name": "Song"}]}]}}
+                        for num in range(count)]}
+
+
+def test_setlist_pages_share_pooled_connections():
+    async def answer(method, target, headers, body):
+        assert headers["x-api-key"] == "key"
+        await asyncio.sleep(0.02)
+        page_num = int(target.split("p=")[1].split("&")[0])
+        return 200, {"Content-Type": "application/json"}, \
+            json.dumps(setlist_page(page_num)).encode()
+
+    async def scenario():
+        async with LocalServer(answer) as server:
+            async with AsyncSetlistFmWrapper("key", concurrency=2,
+                                             limiter=NoLimit()) as setlist:
+                setlist.client.api_base_url = f"{server.url}/rest"
+                first = await setlist.search_setlists("Band", "", "", "", "", "", "", "2019")
+                second = await setlist.search_setlists("Band", "", "", "", "", "", "", "2018")
+                return first, second, server.connections, setlist.client.request_count
+
+    first, second, connections, sent = asyncio.run(scenario())
+    assert first.total == 55 and first.pages == 3
+    assert [setlist["id"] for setlist in first.setlists][::20] == ["1-0", "2-0", "3-0"]
+    assert len(second.setlists) == 55
+    assert sent == 6
+    # Pages 2 and 3 run at once, then every request reuses those connections
+    assert connections == 2
+
+
+def make_spotify(routes, concurrency=3, delay=0.01):
+    """
+    Returns an async client that sends through a fake session
+    """
+    spotify = AsyncSpotifyWrapper("client", "secret", concurrency=concurrency,
+                                  limiter=NoLimit())
+    spotify.session = FakeAsyncSession(routes, delay)
+    return spotify
+
+
+def search_routes():
+    """
+    Returns routes for a token and searches that find every song except
+    "Missing"
+    """
+    def search(url, params, kwargs):
+        if "Missing" in params["q"]:
+            return {"tracks": {"items": [], "next": None}}
+        song = params["q"].split('"')[1]
+        return {"tracks": {"items": [{
+            "name": song, "uri": f"spotify:track:{song}",
+            "artists": [{"name": "Band"}],
+            "album": {"name": "Album", "release_date": "2001",
+                      "release_date_precision": "year"}}], "next": None}}
+
+    return {
+        ("POST", "/api/token"): lambda url, params, kwargs: {"access_token": "cc",
+                                                             "expires_in": 3600},
+        ("GET", "/v1/search"): search
+    }
+
+
+def test_resolve_songs_runs_searches_concurrently(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "logs").mkdir()
+    spotify = make_spotify(search_routes())
+    songs = [f"Song {num}" for num in range(8)] + ["Missing"]
+
+    result = asyncio.run(spotify.resolve_songs("Band", songs))
+
+    assert result.song_ids == [f"spotify:track:Song {num}" for num in range(8)]
+    assert result.missing == 1
+    assert result.match_tiers["Song 3"] == "fielded"
+    # One token for every search, and never more than concurrency at once
+    assert spotify.session.count("POST", "/api/token") == 1
+    assert spotify.session.most_in_flight == 3
+
+
+def test_create_playlist_validates_then_adds_in_order():
+    added = []
+
+    def tracks(url, params, kwargs):
+        return {"tracks": [{"uri": f"spotify:track:{track_id}", "is_playable": True}
+                           for track_id in params["ids"].split(",")]}
+
+    def add(url, params, kwargs):
+        added.append(json.loads(kwargs["data"]))
+        return 201, {"snapshot_id": "s"}
+
+    spotify = make_spotify({
+        ("GET", "/v1/me"): lambda url, params, kwargs: {"id": "user"},
+        ("GET", "/v1/tracks"): tracks,
+        ("POST", "/v1/users/user/playlists"): lambda url, params, kwargs: {
+            "id": "list", "external_urls": {"spotify": "https://open.spotify.com/list"}},
+        ("POST", "/v1/playlists/list/tracks"): add
+    })
+    spotify.client.access_token = "user-token"
+    song_ids = [f"spotify:track:{num}" for num in range(120)]
+
+    assert asyncio.run(spotify.create_playlist("Show", "", song_ids))
+    assert spotify.session.count("GET", "/v1/tracks") == 3
+    assert added == [song_ids[:100], song_ids[100:]]
+
+
+def test_slow_get_is_hedged_and_the_straggler_cancelled():
+    calls = []
+    cancelled = []
+
+    async def artists(url, params, kwargs):
+        calls.append(url)
+        if len(calls) == 1:
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(url)
+                raise
+        return {"artist": [{"name": "Band", "mbid": "mbid"}]}
+
+    setlist = AsyncSetlistFmWrapper("key", limiter=NoLimit())
+    setlist.session = FakeAsyncSession({("GET", "/rest/1.0/search/artists"): artists})
+    get_guard(setlist.client.api_base_url).default_hedge_delay = 0.05
+
+    async def scenario():
+        start = time.monotonic()
+        found = await setlist.search_artists("Band")
+        # Let the cancellation reach the straggler
+        await asyncio.sleep(0)
+        return found, time.monotonic() - start
+
+    found, elapsed = asyncio.run(scenario())
+    assert found == [{"name": "Band", "mbid": "mbid"}]
+    assert elapsed < 1
+    assert len(calls) == 2 and len(cancelled) == 1
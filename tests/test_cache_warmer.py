@@ -0,0 +1,122 @@
+"""
+    Tests for warming the caches of followed artists
+"""
+import datetime
+
+import pytest
+
+from cache_warmer import CacheWarmer
+from caches import SongCache, SetlistStore
+from fakes import FakeSession
+from setlist_fm_wrapper import SetlistFmWrapper
+from spotify_wrapper import SpotifyWrapper
+from transport import NoLimit
+
+SETLIST_PATH = "/rest/1.0/search/setlists"
+SEARCH_PATH = "/v1/search"
+TODAY = datetime.date.today()
+
+
+def show(num):
+    """
+    Returns the setlist of the show num days ago
+    """
+    event_date = (TODAY - datetime.timedelta(days=num)).strftime("%d-%m-%Y")
+    return {"id": f"show-{num}", "eventDate": event_date,
+            "artist": {"name": "Band", "mbid": "mbid"},
+            "venue": {"name": "The Hall", "city": {
+                "name": "Chicago", "state": "Illinois",
+                "country": {"code": "US", "name": "United States"}}},
+            "sets": {"set": [{"song": [{"name": f"Song {num % 4}"},
+                                       {"name": "Hit"}]}]}}
+
+
+def setlist_pages(total):
+    """
+    Returns a handler serving total shows, one a day, newest first
+    """
+    def answer(url, params, kwargs):
+        assert params["artistMbid"] == "mbid"
+        page_num = int(params["p"])
+        first = (page_num - 1) * 20
+        return {"itemsPerPage": 20, "page": page_num, "total": total,
+                "setlist": [show(num) for num in range(first, min(first + 20, total))]}
+    return answer
+
+
+def search(url, params, kwargs):
+    """
+    Finds every song on its first search
+    """
+    song = params["q"].split('"')[1]
+    return {"tracks": {"items": [{
+        "name": song, "uri": f"spotify:track:{song}", "artists": [{"name": "Band"}],
+        "album": {"name": "Album", "release_date": "2001",
+                  "release_date_precision": "year"}}], "next": None}}
+
+
+@pytest.fixture
+def make_warmer(tmp_path):
+    """
+    Returns a function building a warmer over fake APIs serving total shows
+    """
+    def make(total, budget):
+        setlist = SetlistFmWrapper("key", limiter=NoLimit(),
+                                   setlist_store=SetlistStore(str(tmp_path / "setlists")))
+        setlist.session = FakeSession({("GET", SETLIST_PATH): setlist_pages(total)})
+        spotify = SpotifyWrapper("client", "secret", limiter=NoLimit(),
+                                 song_cache=SongCache(str(tmp_path / "songs.json")))
+        spotify.session = FakeSession({("GET", SEARCH_PATH): search})
+        spotify.access_token = "token"
+        spotify.access_token_expiration = datetime.datetime.now() + \
+            datetime.timedelta(hours=1)
+        spotify.access_token_is_expired = False
+        return CacheWarmer(setlist, spotify, ["mbid"], budget=budget)
+    return make
+
+
+def test_warm_run_serves_last_nights_show(make_warmer):
+    warmer = make_warmer(total=30, budget=100)
+    warmer.run_once()
+
+    data = warmer.setlist.setlist_store.load("mbid")
+    assert len(data["setlists"]) == 30 and data["covered_since"]
+    # Every distinct song was resolved once
+    assert warmer.spotify.session.count("GET", SEARCH_PATH) == 5
+    assert warmer.spotify.song_cache.get("Band", "Song 1", None, False) == \
+        ("spotify:track:Song 1", "fielded")
+
+    # Last night's show now needs neither API
+    setlist, spotify = warmer.setlist, warmer.spotify
+    before = setlist.request_count + spotify.request_count
+    found = setlist.search_setlists_by_date("Band", "mbid", "", "", "", "", "",
+                                            TODAY - datetime.timedelta(days=1))
+    resolved = spotify.resolve_songs("Band", [song["name"] for song in
+                                              found.setlists[0]["sets"]["set"][0]["song"]])
+    assert [setlist["id"] for setlist in found.setlists] == ["show-1"]
+    assert resolved.missing == 0
+    assert setlist.request_count + spotify.request_count == before
+
+
+def test_run_stays_inside_the_budget(make_warmer):
+    warmer = make_warmer(total=100, budget=2)
+    warmer.run_once()
+
+    assert warmer.spent() == 2
+    data = warmer.setlist.setlist_store.load("mbid")
+    assert len(data["setlists"]) == 40
+    # An unfinished first sync vouches for no dates
+    assert data["covered_since"] == "" and data["synced_on"] == ""
+    assert warmer.spotify.request_count == 0
+
+
+def test_later_syncs_stop_at_the_lookback(make_warmer):
+    warmer = make_warmer(total=100, budget=100)
+    warmer.run_once()
+    first_sync = warmer.setlist.session.count("GET", SETLIST_PATH)
+    assert first_sync == warmer.first_sync_pages
+
+    new = warmer.sync_artist("mbid")
+    # The first page already reaches back past the last sync less a week
+    assert warmer.setlist.session.count("GET", SETLIST_PATH) == first_sync + 1
+    assert new == []
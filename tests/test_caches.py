@@ -0,0 +1,91 @@
+"""
+    Tests for the song cache and the setlist store
+"""
+import os
+import time
+import datetime
+
+from caches import SongCache, SetlistStore
+
+
+def test_song_cache_keys_and_saves(tmp_path):
+    path = str(tmp_path / "songs.json")
+    cache = SongCache(path)
+    cache.put("Band", "Song", "US", False, "spotify:track:old", "fielded")
+    cache.put("Band", "Song", "US", True, "spotify:track:new", "fielded")
+
+    assert cache.get("BAND", "song", "US", False) == ("spotify:track:old", "fielded")
+    assert cache.get("Band", "Song", "US", True) == ("spotify:track:new", "fielded")
+    assert cache.get("Band", "Song", "DE", False) is None
+
+    cache.save()
+    assert SongCache(path).get("Band", "Song", "US", True) == \
+        ("spotify:track:new", "fielded")
+
+
+def test_song_cache_forgets_misses_after_miss_ttl():
+    cache = SongCache()
+    cache.put("Band", "Gone", None, False, None, None)
+    cache.put("Band", "Song", None, False, "spotify:track:a", "fielded")
+    assert cache.get("Band", "Gone", None, False) == (None, None)
+
+    # Age both entries past the miss TTL
+    for entry in cache.entries.values():
+        entry["time"] = time.time() - cache.miss_ttl - 1
+    assert cache.get("Band", "Gone", None, False) is None
+    assert cache.get("Band", "Song", None, False) == ("spotify:track:a", "fielded")
+
+
+def make_setlist(setlist_id, event_date, names):
+    """
+    Returns a setlist played on event_date
+    """
+    return {"id": setlist_id, "eventDate": event_date,
+            "artist": {"name": "Band", "mbid": "band-mbid"},
+            "venue": {"name": "The Hall", "city": {
+                "name": "Chicago", "state": "Illinois",
+                "country": {"code": "US", "name": "United States"}}},
+            "sets": {"set": [{"song": [{"name": name} for name in names]},
+                             {"encore": 1, "song": [{"name": "Encore"}]}]}}
+
+
+def store_with(tmp_path, covered_since="01-06-2019"):
+    """
+    Returns a store holding two shows on one night and one a week later
+    """
+    store = SetlistStore(str(tmp_path))
+    store.save("band-mbid", {
+        "setlists": {"early": make_setlist("early", "12-07-2019", ["A", "B"]),
+                     "late": make_setlist("late", "12-07-2019", ["C"]),
+                     "next": make_setlist("next", "19-07-2019", ["A"])},
+        "covered_since": covered_since,
+        "synced_on": "20-07-2019"})
+    return store
+
+
+def test_on_date_reads_the_corpus(tmp_path):
+    store = store_with(tmp_path)
+    assert os.path.exists(store.corpus_path("band-mbid"))
+    # The lookup must not need the JSON file
+    os.remove(store.path("band-mbid"))
+
+    shows = store.on_date("band-mbid", datetime.date(2019, 7, 12))
+    assert [setlist["id"] for setlist in shows] == ["early", "late"]
+    assert shows[0] == make_setlist("early", "12-07-2019", ["A", "B"])
+
+
+def test_on_date_asks_the_api_outside_coverage(tmp_path):
+    store = store_with(tmp_path)
+    assert store.on_date("band-mbid", datetime.date(2019, 7, 13)) is None
+    assert store.on_date("band-mbid", datetime.date(2019, 5, 1)) is None
+    assert store.on_date("other-mbid", datetime.date(2019, 7, 12)) is None
+
+    store = store_with(tmp_path, covered_since="")
+    assert store.on_date("band-mbid", datetime.date(2019, 7, 12)) is None
+
+
+def test_on_date_reads_stores_saved_without_a_corpus(tmp_path):
+    store = store_with(tmp_path)
+    os.remove(store.corpus_path("band-mbid"))
+    shows = store.on_date("band-mbid", datetime.date(2019, 7, 19))
+    assert [setlist["id"] for setlist in shows] == ["next"]
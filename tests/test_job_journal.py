@@ -0,0 +1,153 @@
+"""
+    Tests for resumable playlist jobs
+"""
+import json
+import datetime
+
+from fakes import FakeSession
+from job_journal import JobJournal, PlaylistJob, run_job
+from spotify_wrapper import SpotifyWrapper
+from transport import NoLimit
+
+SONGS = ["One", "Two", "Three", "Four", "Five"]
+
+
+def start_job(tmp_path):
+    """
+    Returns a new job for SONGS
+    """
+    return JobJournal(str(tmp_path / "jobs")).start("Band", SONGS, "Band Live", "desc",
+                                                    False)
+
+
+def test_journal_replays_into_the_same_state(tmp_path):
+    job = start_job(tmp_path)
+    job.record("song", index=0, name="One", uri="spotify:track:1", tier="fielded")
+    job.record("song", index=1, name="Two", uri=None, tier=None)
+    job.record("playlist", id="list", url="https://open.spotify.com/list")
+    job.record("chunk", index=0)
+
+    again = PlaylistJob(job.path)
+    assert again.setlist["songs"] == SONGS and again.setlist["newest"] is False
+    assert again.songs == {0: ("spotify:track:1", "fielded"), 1: (None, None)}
+    assert again.playlist["id"] == "list" and again.chunks == {0}
+    assert again.describe() == "Band Live (1 chunks added)"
+
+
+def test_torn_last_line_is_ignored(tmp_path):
+    job = start_job(tmp_path)
+    job.record("song", index=0, name="One", uri="spotify:track:1", tier="fielded")
+    with open(job.path, "a", encoding="utf-8") as journal:
+        journal.write('{"stage": "song", "index": 1, "na')
+
+    again = PlaylistJob(job.path)
+    assert again.songs == {0: ("spotify:track:1", "fielded")}
+    assert not again.done
+
+
+def test_unfinished_skips_done_and_abandoned_jobs(tmp_path):
+    journal = JobJournal(str(tmp_path / "jobs"))
+    assert journal.unfinished() == []
+    running = start_job(tmp_path)
+    start_job(tmp_path).record("done")
+    start_job(tmp_path).record("abandoned")
+    assert [job.path for job in journal.unfinished()] == [running.path]
+
+
+class FlakySpotify:
+    """
+    Spotify routes where chosen requests fail once
+
+    Attributes
+    ----------
+    fail_search: str
+        the song whose first search fails
+    fail_chunk: int
+        the number of the add request that fails, counting from 1
+    adds: int
+        the number of add requests so far
+    added: list
+        the songs of every successful add request
+    """
+
+    def __init__(self, fail_search=None, fail_chunk=None):
+        self.fail_search = fail_search
+        self.fail_chunk = fail_chunk
+        self.adds = 0
+        self.added = []
+
+    def search(self, url, params, kwargs):
+        song = params["q"].split('"')[1]
+        if song == self.fail_search:
+            self.fail_search = None
+            return 404, {}
+        return {"tracks": {"items": [{
+            "name": song, "uri": f"spotify:track:{song}", "artists": [{"name": "Band"}],
+            "album": {"name": "Album", "release_date": "2001",
+                      "release_date_precision": "year"}}], "next": None}}
+
+    def tracks(self, url, params, kwargs):
+        return {"tracks": [{"uri": f"spotify:track:{track_id}", "is_playable": True}
+                           for track_id in params["ids"].split(",")]}
+
+    def add(self, url, params, kwargs):
+        self.adds = self.adds + 1
+        if self.adds == self.fail_chunk:
+            return 502, {}
+        self.added.append(json.loads(kwargs["data"]))
+        return 201, {"snapshot_id": "s"}
+
+    def make_wrapper(self):
+        """
+        Returns an authorized wrapper answered by these routes
+        """
+        spotify = SpotifyWrapper("client", "secret", limiter=NoLimit())
+        spotify.session = FakeSession({
+            ("GET", "/v1/search"): self.search,
+            ("GET", "/v1/tracks"): self.tracks,
+            ("GET", "/v1/me"): lambda url, params, kwargs: {"id": "user"},
+            ("POST", "/v1/users/user/playlists"): lambda url, params, kwargs: {
+                "id": "list", "external_urls": {"spotify": "https://open.spotify.com/list"}},
+            ("POST", "/v1/playlists/list/tracks"): self.add
+        })
+        spotify.access_token = "token"
+        spotify.access_token_expiration = datetime.datetime.now() + \
+            datetime.timedelta(hours=1)
+        spotify.access_token_is_expired = False
+        spotify.user_authorized = True
+        spotify.playlist_chunk_size = 2
+        return spotify
+
+
+def searched(spotify):
+    """
+    Returns the songs a wrapper searched for
+    """
+    return [kwargs["params"]["q"].split('"')[1]
+            for _, url, kwargs in spotify.session.requests if url.endswith("/v1/search")]
+
+
+def test_resumed_job_repeats_no_completed_request(tmp_path):
+    routes = FlakySpotify(fail_search="Three", fail_chunk=2)
+    job = start_job(tmp_path)
+
+    spotify = routes.make_wrapper()
+    assert run_job(job, spotify) is False
+    assert sorted(job.songs) == [0, 1]
+    assert searched(spotify) == ["One", "Two", "Three"]
+
+    spotify = routes.make_wrapper()
+    assert run_job(PlaylistJob(job.path), spotify) is False
+    assert searched(spotify) == ["Three", "Four", "Five"]
+    assert routes.added == [["spotify:track:One", "spotify:track:Two"]]
+
+    spotify = routes.make_wrapper()
+    resumed = PlaylistJob(job.path)
+    assert run_job(resumed, spotify) is True
+    # Only the chunks that were not added are sent, to the same playlist
+    assert spotify.session.count("GET", "/v1/search") == 0
+    assert spotify.session.count("POST", "/v1/users/user/playlists") == 0
+    assert routes.added == [["spotify:track:One", "spotify:track:Two"],
+                            ["spotify:track:Three", "spotify:track:Four"],
+                            ["spotify:track:Five"]]
+    assert PlaylistJob(job.path).done
@@ -0,0 +1,75 @@
+"""
+    Tests for searches with several values per filter
+"""
+import time
+import threading
+
+from fakes import FakeSession
+from setlist_fm_wrapper import SetlistFmWrapper, filter_values, year_values, filter_combos
+from transport import NoLimit
+
+
+def test_filter_values():
+    assert filter_values("Chicago, Denver") == ["Chicago", "Denver"]
+    assert filter_values(r"Washington\, D.C., Boston") == ["Washington, D.C.", "Boston"]
+    assert filter_values(" , ") == [""]
+    assert filter_values(None) == [""]
+    assert filter_values(["Chicago, IL", " Denver "]) == ["Chicago, IL", "Denver"]
+    assert filter_values("Tour, Part 2", split=False) == ["Tour, Part 2"]
+
+
+def test_year_values():
+    assert year_values("2016-2018") == ["2016", "2017", "2018"]
+    assert year_values("2019 - 2018, 2010") == ["2018", "2019", "2010"]
+    assert year_values("") == [""]
+
+
+def test_filter_combos():
+    combos = filter_combos("Chicago, Denver", "", "", "Tour, Part 2", "")
+    assert combos == [("Chicago", "", "", "Tour, Part 2", ""),
+                      ("Denver", "", "", "Tour, Part 2", "")]
+
+
+def test_combinations_run_at_once_and_merge_newest_first():
+    shows = {
+        ("Chicago", "2018"): [("a", "01-06-2018")],
+        ("Chicago", "2019"): [("b", "01-06-2019"), ("c", "02-03-2019")],
+        ("Denver", "2018"): [("d", "05-06-2018")],
+        # The same show may come back from two queries
+        ("Denver", "2019"): [("b", "01-06-2019")],
+    }
+    lock = threading.Lock()
+    running = [0, 0]
+
+    def answer(url, params, kwargs):
+        with lock:
+            running[0] = running[0] + 1
+            running[1] = max(running)
+        time.sleep(0.05)
+        with lock:
+            running[0] = running[0] - 1
+        found = shows[(params["cityName"], params["year"])]
+        return {"itemsPerPage": 20, "page": 1, "total": len(found),
+                "setlist": [{"id": show_id, "eventDate": event_date,
+                             "sets": {"set": [{"song": [{"name": "Song"}]}]}}
+                            for show_id, event_date in found]}
+
+    setlist = SetlistFmWrapper("key", limiter=NoLimit())
+    setlist.session = FakeSession({("GET", "/rest/1.0/search/setlists"): answer})
+    result = setlist.search_setlists_multi("Band", "", "Chicago, Denver", "", "", "", "",
+                                           "2018-2019")
+
+    assert [show["id"] for show in result.setlists] == ["b", "c", "d", "a"]
+    assert result.total == 5 and result.pages == 4
+    assert running[1] > 1
+
+
+def test_single_combination_is_a_plain_search():
+    def answer(url, params, kwargs):
+        return {"total": 0, "setlist": []}
+
+    setlist = SetlistFmWrapper("key", limiter=NoLimit())
+    setlist.session = FakeSession({("GET", "/rest/1.0/search/setlists"): answer})
+    result = setlist.search_setlists_multi("Band", "", "Chicago", "", "", "", "", "2019")
+    assert result.setlists == [] and result.pages == 1
+    assert setlist.session.count("GET", "/rest/1.0/search/setlists") == 1
@@ -0,0 +1,91 @@
+"""
+    Tests for the host-wide rate limiter
+"""
+import time
+from email.utils import formatdate
+
+from rate_limiter import SharedTokenBucket, parse_retry_after
+
+
+def make_bucket(tmp_path, **kwargs):
+    """
+    Returns a bucket keeping its state in tmp_path
+    """
+    kwargs.setdefault("capacity", 2)
+    return SharedTokenBucket("test", 10, state_dir=str(tmp_path), **kwargs)
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("-1") == 0.0
+    assert parse_retry_after(None) == 0.0
+    assert parse_retry_after("soon") == 0.0
+    assert 58 <= parse_retry_after(formatdate(time.time() + 60, usegmt=True)) <= 60
+
+
+def test_capacity_then_waits_for_the_rate(tmp_path):
+    bucket = make_bucket(tmp_path)
+    assert bucket.try_acquire()
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire()
+
+    start = time.monotonic()
+    bucket.acquire()
+    # One token comes back every tenth of a second
+    assert 0.05 <= time.monotonic() - start < 0.5
+
+
+def test_instances_share_one_budget(tmp_path):
+    first = make_bucket(tmp_path)
+    second = make_bucket(tmp_path)
+    assert first.try_acquire()
+    assert second.try_acquire()
+    assert not first.try_acquire()
+    assert not second.try_acquire()
+
+
+def test_429_cuts_the_rate_and_blocks_for_retry_after(tmp_path):
+    bucket = make_bucket(tmp_path)
+    other = make_bucket(tmp_path)
+    bucket.report(429, "0.3")
+
+    assert other.get_rate() == 7.0
+    assert not other.try_acquire()
+    start = time.monotonic()
+    other.acquire()
+    assert time.monotonic() - start >= 0.25
+
+
+def test_rate_never_drops_below_min_rate(tmp_path):
+    bucket = make_bucket(tmp_path, min_rate=5)
+    for _ in range(5):
+        bucket.report(429, "0")
+    assert bucket.get_rate() == 5.0
+
+
+def test_success_streaks_recover_the_rate(tmp_path):
+    bucket = make_bucket(tmp_path)
+    bucket.report(429, "0")
+    for _ in range(bucket.recovery_streak - 1):
+        bucket.report(200)
+    assert bucket.get_rate() == 7.0
+
+    bucket.report(200)
+    assert bucket.get_rate() == 7.5
+    # Other statuses neither cut nor recover the rate
+    for _ in range(bucket.recovery_streak):
+        bucket.report(404)
+    assert bucket.get_rate() == 7.5
+
+    for _ in range(bucket.recovery_streak * 20):
+        bucket.report(200)
+    assert bucket.get_rate() == 10.0
+
+
+def test_for_key_hides_the_key(tmp_path):
+    bucket = SharedTokenBucket.for_key("spotify", "secret-client-id", 10,
+                                       state_dir=str(tmp_path))
+    assert "secret" not in bucket.state_path
+    assert bucket.name.startswith("spotify-")
+    assert SharedTokenBucket.for_key("spotify", "secret-client-id", 10,
+                                     state_dir=str(tmp_path)).state_path == bucket.state_path
@@ -0,0 +1,137 @@
+"""
+    Tests for hedging, circuit breaking and the fallback cache
+"""
+import time
+import threading
+
+import pytest
+from requests.exceptions import ConnectionError
+
+from fakes import make_response
+from request_guard import CircuitBreaker, CircuitOpenError, RequestGuard
+from transport import NoLimit
+
+URL = "https://api.example.com/v1/search"
+
+
+class NoSpareTokens(NoLimit):
+    """
+    A limiter that never has a token free for a hedge
+    """
+
+    def try_acquire(self):
+        return False
+
+
+def test_breaker_opens_lets_one_trial_through_and_closes():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.is_open() and not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    # Only one trial at a time
+    assert not breaker.allow()
+    breaker.record_success()
+    assert not breaker.is_open() and breaker.allow()
+
+
+def test_failed_trial_opens_the_breaker_again():
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=0.05)
+    for _ in range(5):
+        breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+
+
+def failing():
+    """
+    Returns a send that fails to connect
+    """
+    def send():
+        raise ConnectionError("down")
+    return send
+
+
+def test_open_breaker_answers_from_cache_for_the_same_token():
+    guard = RequestGuard("api.example.com", failure_threshold=2, reset_timeout=30)
+    mine = {"headers": {"Authorization": "Bearer mine"}, "params": {"q": "song"}}
+    theirs = {"headers": {"Authorization": "Bearer theirs"}, "params": {"q": "song"}}
+    fresh = make_response(200, {"tracks": []})
+    assert guard.send("GET", URL, lambda: fresh, mine, hedge=False) is fresh
+
+    # Failures are answered from the cache while it has the request
+    assert guard.send("GET", URL, failing(), mine, hedge=False) is fresh
+    with pytest.raises(ConnectionError):
+        guard.send("GET", URL, failing(), theirs, hedge=False)
+    assert guard.breaker.is_open()
+
+    sent = []
+    assert guard.send("GET", URL, lambda: sent.append(1), mine, hedge=False) is fresh
+    with pytest.raises(CircuitOpenError):
+        guard.send("GET", URL, lambda: sent.append(1), theirs, hedge=False)
+    with pytest.raises(CircuitOpenError):
+        guard.send("POST", URL, lambda: sent.append(1), mine, hedge=False)
+    assert sent == []
+
+
+def test_server_errors_count_as_failures():
+    guard = RequestGuard("api.example.com", failure_threshold=2)
+    kwargs = {"params": {"q": "song"}}
+    fresh = make_response(200, {"tracks": []})
+    guard.send("GET", URL, lambda: fresh, kwargs, hedge=False)
+    assert guard.send("GET", URL, lambda: make_response(503), kwargs, hedge=False) is fresh
+    assert guard.send("GET", URL, lambda: make_response(502), {}, hedge=False).status_code == 502
+    assert guard.breaker.is_open()
+
+
+def slow_then_fast(calls):
+    """
+    Returns a send whose first call is slow
+    """
+    lock = threading.Lock()
+
+    def send():
+        with lock:
+            calls.append(len(calls))
+            number = len(calls)
+        if number == 1:
+            time.sleep(0.5)
+            return make_response(200, {"which": "slow"})
+        return make_response(200, {"which": "fast"})
+    return send
+
+
+def test_slow_get_is_hedged_when_a_token_is_free():
+    guard = RequestGuard("api.example.com")
+    guard.default_hedge_delay = 0.05
+    calls = []
+    start = time.monotonic()
+    response = guard.send("GET", URL, slow_then_fast(calls), {}, NoLimit())
+    assert response.json() == {"which": "fast"}
+    assert time.monotonic() - start < 0.4
+    assert len(calls) == 2
+
+
+def test_no_hedge_without_a_spare_token_or_for_posts():
+    guard = RequestGuard("api.example.com")
+    guard.default_hedge_delay = 0.05
+    calls = []
+    response = guard.send("GET", URL, slow_then_fast(calls), {}, NoSpareTokens())
+    assert response.json() == {"which": "slow"} and len(calls) == 1
+
+    calls = []
+    guard.send("POST", URL, slow_then_fast(calls), {}, NoLimit())
+    assert len(calls) == 1
+
+
+def test_hedge_delay_follows_recent_latencies():
+    guard = RequestGuard("api.example.com")
+    assert guard.get_hedge_delay() == guard.default_hedge_delay
+    for num in range(100):
+        guard.latency.record(num / 100)
+    assert guard.get_hedge_delay() == pytest.approx(0.95)
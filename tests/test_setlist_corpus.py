@@ -0,0 +1,105 @@
+"""
+    Tests for the memory-mapped setlist corpus
+"""
+import datetime
+
+import pytest
+
+from setlist_corpus import write_corpus, SetlistCorpus
+
+
+def make_setlist(setlist_id, event_date, sets, city="Chicago", tour=None,
+                 state="Illinois"):
+    """
+    Returns a setlist in the layout the setlist.fm wrapper fetches
+    """
+    city_data = {"name": city, "country": {"code": "US", "name": "United States"}}
+    if state is not None:
+        city_data["state"] = state
+    setlist = {"id": setlist_id, "eventDate": event_date,
+               "artist": {"name": "Band", "mbid": "band-mbid"},
+               "venue": {"name": "The Hall", "city": city_data},
+               "sets": {"set": sets}}
+    if tour is not None:
+        setlist["tour"] = {"name": tour}
+    return setlist
+
+
+def songs(*names):
+    """
+    Returns the song list of a set
+    """
+    return [{"name": name} for name in names]
+
+
+ENCORES = make_setlist("a1", "12-07-2019", [
+    {"song": songs("Intro", "Hit")},
+    {"name": "Acoustic", "song": songs("Ballad")},
+    {"encore": 1, "song": songs("Hit (Reprise)")},
+    {"encore": 2, "name": "Second Encore", "song": songs("Closer", "Intro")}
+], tour="Summer Tour")
+PLAIN = make_setlist("b2", "03-08-2019", [{"song": songs("Hit", "Closer")}],
+                     city="Denver", state="Colorado")
+OLDER = make_setlist("c3", "20-05-2018", [{"song": songs("Ballad")}], state=None)
+
+
+@pytest.fixture
+def corpus_path(tmp_path):
+    path = str(tmp_path / "band.corpus")
+    write_corpus(path, [ENCORES, PLAIN, OLDER, dict(PLAIN)], covered_since="01-01-2018")
+    return path
+
+
+def test_setlists_round_trip(corpus_path):
+    with SetlistCorpus(corpus_path) as corpus:
+        assert len(corpus) == 3
+        assert corpus.setlist(0) == ENCORES
+        assert corpus.setlist(1) == PLAIN
+        assert list(corpus.setlists()) == [ENCORES, PLAIN, OLDER]
+
+
+def test_each_encore_keeps_its_own_set(corpus_path):
+    with SetlistCorpus(corpus_path) as corpus:
+        sets = corpus.setlist(0)["sets"]["set"]
+    assert [portion.get("encore") for portion in sets] == [None, None, 1, 2]
+    assert [portion.get("name") for portion in sets] == \
+        [None, "Acoustic", None, "Second Encore"]
+
+
+def test_songs_are_interned(corpus_path):
+    with SetlistCorpus(corpus_path) as corpus:
+        intro, hit = list(corpus.song_ids(0))[:2]
+        assert list(corpus.song_ids(0))[-1] == intro
+        assert list(corpus.song_ids(1)) == [hit, list(corpus.song_ids(0))[-2]]
+        assert corpus.num_songs == 5
+        assert corpus.song_name(hit) == "Hit"
+
+
+def test_find_filters(corpus_path):
+    with SetlistCorpus(corpus_path) as corpus:
+        assert corpus.find() == [0, 1, 2]
+        assert corpus.find(year=2019) == [0, 1]
+        assert corpus.find(city="Chicago") == [0, 2]
+        assert corpus.find(city="Chicago", year=2018) == [2]
+        assert corpus.find(tour="Summer Tour") == [0]
+        assert corpus.find(date=datetime.date(2019, 8, 3)) == [1]
+        assert corpus.find(city="Boston") == []
+        # A prefix of a stored name is not a match
+        assert corpus.find(city="Chic") == []
+
+
+def test_covered_since(tmp_path, corpus_path):
+    with SetlistCorpus(corpus_path) as corpus:
+        assert corpus.covered_since == "01-01-2018"
+
+    path = str(tmp_path / "partial.corpus")
+    write_corpus(path, [PLAIN])
+    with SetlistCorpus(path) as corpus:
+        assert corpus.covered_since is None
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "other.corpus"
+    path.write_bytes(b"not a corpus" + b"\0" * 128)
+    with pytest.raises(ValueError):
+        SetlistCorpus(str(path))
@@ -0,0 +1,93 @@
+"""
+    Tests for reading setlist.fm search pages
+"""
+from requests.exceptions import ChunkedEncodingError, ReadTimeout
+
+from fakes import FakeSession, make_response
+from request_guard import get_guard
+from setlist_fm_wrapper import SetlistFmWrapper, parse_setlist_page
+from transport import NoLimit
+
+SEARCH_PATH = "/rest/1.0/search/setlists"
+
+
+def make_setlist(num, songs):
+    """
+    Returns a setlist with the given song names
+    """
+    return {"id": f"id-{num}", "eventDate": f"{28 - num:02d}-06-2019",
+            "artist": {"name": "Band", "mbid": "mbid"},
+            "sets": {"set": [{"song": [{"name": name} for name in songs]}] if songs else []}}
+
+
+PAGE = {"type": "setlists", "itemsPerPage": 20, "page": 1, "total": 4,
+        "setlist": [make_setlist(1, ["A", "B"]), make_setlist(2, []),
+                    make_setlist(3, ["C"]), make_setlist(4, [])]}
+
+
+def make_setlist_fm(handler):
+    """
+    Returns a wrapper whose searches are answered by handler
+    """
+    setlist = SetlistFmWrapper("key", limiter=NoLimit())
+    setlist.session = FakeSession({("GET", SEARCH_PATH): handler})
+    return setlist
+
+
+def fetch(setlist):
+    """
+    Fetches the first page of an unfiltered search
+    """
+    return setlist.fetch_setlist_page("Band", "", "", "", "", "", "", "", 1)
+
+
+def test_empty_setlists_are_dropped_but_bound_the_page():
+    page = parse_setlist_page(PAGE)
+
+    assert [setlist["id"] for setlist in page["setlist"]] == ["id-1", "id-3"]
+    assert page["total"] == 4 and page["itemsPerPage"] == 20
+    assert page["first_date"] == "27-06-2019"
+    assert page["last_date"] == "24-06-2019"
+
+
+def test_page_without_setlists():
+    page = parse_setlist_page({"total": 0})
+
+    assert page["setlist"] == []
+    assert page["first_date"] == "" and page["last_date"] == ""
+
+
+def test_fetch_returns_parsed_page():
+    page = fetch(make_setlist_fm(lambda url, params, kwargs: PAGE))
+
+    assert [setlist["id"] for setlist in page["setlist"]] == ["id-1", "id-3"]
+
+
+def test_truncated_body_counts_as_failure():
+    def truncated(url, params, kwargs):
+        return make_response(200, b'{"total": 4, "setlist": [{"id"', url=url)
+    setlist = make_setlist_fm(truncated)
+
+    assert fetch(setlist) is None
+    guard = get_guard(setlist.get_setlist_endpoint())
+    assert guard.breaker.failures == 1
+    # The broken body is not kept to answer from while the host is down
+    assert not guard.cache
+
+
+def test_body_read_errors_return_none():
+    for error in (ChunkedEncodingError("connection broken"), ReadTimeout("slow")):
+        def broken(url, params, kwargs):
+            raise error
+        setlist = make_setlist_fm(broken)
+
+        assert fetch(setlist) is None
+        assert not setlist.get_setlists_by_artist_name("Band")
+
+
+def test_repeated_broken_bodies_open_the_circuit():
+    setlist = make_setlist_fm(lambda url, params, kwargs: make_response(200, b"<html>"))
+
+    for _ in range(5):
+        assert fetch(setlist) is None
+    assert get_guard(setlist.get_setlist_endpoint()).breaker.is_open()
@@ -0,0 +1,113 @@
+"""
+    Tests for finding setlists by date without walking every page
+"""
+import datetime
+
+import pytest
+
+from setlist_fm_wrapper import SetlistFmWrapper
+from transport import NoLimit
+
+PER_PAGE = 3
+
+
+class FakeSetlistFm:
+    """
+    Serves pages of setlists played on the given dates, newest first, the
+    way fetch_setlist_page returns them
+    """
+
+    def __init__(self, dates, empty=()):
+        self.dates = sorted(dates, reverse=True)
+        self.empty = set(empty)
+        self.fetched = []
+
+    def fetch_setlist_page(self, artist_name, artist_id, city, state_name,
+                           state_abbr, tour_name, venue_name, year, page_num):
+        self.fetched.append(page_num)
+        start = (page_num - 1) * PER_PAGE
+        dates = self.dates[start:start + PER_PAGE]
+        setlists = [{"id": f"{start + num}", "eventDate": date.strftime("%d-%m-%Y")}
+                    for num, date in enumerate(dates) if start + num not in self.empty]
+        return {
+            "total": len(self.dates),
+            "itemsPerPage": PER_PAGE,
+            "setlist": setlists,
+            "first_date": dates[0].strftime("%d-%m-%Y") if dates else "",
+            "last_date": dates[-1].strftime("%d-%m-%Y") if dates else ""
+        }
+
+
+def day(num):
+    """
+    Returns the date num days into 2019
+    """
+    return datetime.date(2019, 1, 1) + datetime.timedelta(days=num)
+
+
+def search(fake, show_date):
+    """
+    Runs a date search against a fake setlist.fm and returns the ids found
+    """
+    wrapper = SetlistFmWrapper("key", limiter=NoLimit())
+    wrapper.fetch_setlist_page = fake.fetch_setlist_page
+    result = wrapper.search_setlists_by_date("Band", "", "", "", "", "", "", show_date)
+    return sorted(setlist["id"] for setlist in result.setlists)
+
+
+# Thirty shows two days apart, on pages of three: page 1 holds days 58, 56
+# and 54, page 2 days 52, 50 and 48, and so on down to day 0 on page 10
+SHOWS = [day(num * 2) for num in range(30)]
+
+
+@pytest.mark.parametrize("num, page", [(58, 1), (54, 1), (52, 2), (30, 5), (0, 10)])
+def test_finds_show_on_its_page(num, page):
+    fake = FakeSetlistFm(SHOWS)
+
+    found = search(fake, day(num))
+
+    assert found == [str(29 - num // 2)]
+    assert page in fake.fetched
+    assert len(set(fake.fetched)) <= 5
+
+
+@pytest.mark.parametrize("num", [31, 1, 60, -1])
+def test_date_between_shows_finds_nothing(num):
+    assert search(FakeSetlistFm(SHOWS), day(num)) == []
+
+
+def test_date_between_two_pages_finds_nothing():
+    # Day 53 falls after page 1 ends (day 54) and before page 2 starts
+    fake = FakeSetlistFm(SHOWS)
+
+    assert search(fake, day(53)) == []
+
+
+def test_shows_on_one_day_spanning_two_pages():
+    # Days 10, 10, 10, 10 fill the end of page 2 and the start of page 3
+    dates = [day(20), day(18), day(16), day(14), day(10), day(10), day(10), day(10),
+             day(8), day(4), day(2)]
+    fake = FakeSetlistFm(dates)
+
+    assert search(fake, day(10)) == ["4", "5", "6", "7"]
+
+
+@pytest.mark.parametrize("before, after", [
+    (2, 8),     # pages 1 and 2, bisection lands on page 2 first
+    (5, 8),     # pages 2 and 3, bisection lands on page 3 first
+    (5, 3)      # pages 2 and 3, bisection lands on page 2 first
+])
+def test_show_on_page_boundary(before, after):
+    dates = [day(20 + num) for num in range(before)] + [day(10), day(10)] + \
+        [day(num) for num in range(after)]
+    fake = FakeSetlistFm(dates)
+
+    assert search(fake, day(10)) == [str(before), str(before + 1)]
+
+
+def test_empty_setlists_still_bound_their_page():
+    # The last show of page 1 has no songs, so only its date marks the page
+    fake = FakeSetlistFm(SHOWS, empty={2})
+
+    assert search(fake, day(54)) == []
+    assert search(fake, day(52)) == ["3"]
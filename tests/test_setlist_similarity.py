@@ -0,0 +1,80 @@
+"""
+    Tests for finding a show from a partial list of songs
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+from setlist_similarity import SetlistSimilarityIndex
+
+
+def show(num, songs):
+    """
+    Returns a setlist with the given songs
+    """
+    return {"id": f"show-{num}", "sets": {"set": [{"song": [{"name": name} for name in songs]}]}}
+
+
+SHOWS = [
+    show(0, ["Airbag", "Paranoid Android", "Karma Police", "Creep"]),
+    show(1, ["Airbag", "Let Down", "Karma Police", "No Surprises", "Creep"]),
+    show(2, ["Airbag", "Lucky", "Exit Music (For a Film)"]),
+]
+
+
+def test_best_covering_show_ranks_first():
+    index = SetlistSimilarityIndex(SHOWS)
+
+    results = index.query(["let down", "No Surprises"])
+
+    assert results[0] == (pytest.approx(1.0), 1)
+    assert [position for _, position in results] == [1]
+
+
+def test_rare_songs_weigh_more_than_common_ones():
+    index = SetlistSimilarityIndex(SHOWS)
+
+    # Airbag was played at every show, Lucky only at one
+    results = dict((position, score) for score, position in index.query(["Airbag", "Lucky"]))
+
+    assert max(results, key=results.get) == 2
+    assert results[0] == results[1] < results[2]
+
+
+def test_typos_match_close_titles():
+    index = SetlistSimilarityIndex(SHOWS)
+
+    assert index.match_song("Paranoid Andriod") == "paranoid android"
+    assert index.match_song("Exit Music") == "exit music"
+    assert index.match_song("Bohemian Rhapsody") is None
+
+
+def test_typo_and_exact_title_of_one_song_count_once():
+    index = SetlistSimilarityIndex(SHOWS)
+
+    exact = index.query(["Paranoid Android"])
+    both = index.query(["Paranoid Android", "Paranoid Andriod"])
+
+    assert both == exact
+    assert both[0][0] == pytest.approx(1.0)
+
+
+def test_unknown_songs_lower_every_score():
+    index = SetlistSimilarityIndex(SHOWS)
+
+    known = index.query(["Lucky"])[0][0]
+    with_unknown = index.query(["Lucky", "Bohemian Rhapsody"])[0][0]
+
+    assert with_unknown < known
+    assert index.query(["Bohemian Rhapsody"]) == []
+
+
+def test_index_does_not_load_the_spotify_client():
+    code = "import sys, setlist_similarity; print('spotify_wrapper' in sys.modules)"
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            check=True).stdout
+
+    assert output.strip() == "False"
@@ -0,0 +1,78 @@
+"""
+    Tests for sharing one wrapper between threads, and keeping state per
+    wrapper
+"""
+import time
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from fakes import FakeSession
+from setlist_fm_wrapper import SetlistFmWrapper
+from spotify_wrapper import SpotifyWrapper
+from transport import NoLimit
+
+
+def release(name, year, uri):
+    """
+    Returns a studio release of a song
+    """
+    return {"name": name, "uri": uri, "artists": [{"name": "Band"}],
+            "album": {"name": "Album", "release_date": str(year),
+                      "release_date_precision": "year"}}
+
+
+def search(url, params, kwargs):
+    """
+    Answers every search with the original and the re-recorded version, slowly
+    enough for the threads to overlap
+    """
+    time.sleep(0.01)
+    song = params["q"].split('"')[1]
+    return {"tracks": {"items": [release(song, 1990, f"old:{song}"),
+                                 release(song, 2020, f"new:{song}")], "next": None}}
+
+
+def make_spotify():
+    """
+    Returns a wrapper with a valid token that sends through a fake session
+    """
+    spotify = SpotifyWrapper("client", "secret", limiter=NoLimit())
+    spotify.session = FakeSession({("GET", "/v1/search"): search})
+    spotify.access_token = "token"
+    spotify.access_token_expiration = datetime.datetime.now() + datetime.timedelta(hours=1)
+    spotify.access_token_is_expired = False
+    return spotify
+
+
+def test_concurrent_jobs_keep_their_own_version_preference():
+    spotify = make_spotify()
+    songs = [f"Song {num}" for num in range(10)]
+    jobs = [(newest, songs) for newest in (True, False, True, False)]
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(
+            lambda job: spotify.resolve_songs("Band", job[1], newest=job[0]), jobs))
+
+    for (newest, _), result in zip(jobs, results):
+        prefix = "new" if newest else "old"
+        assert result.song_ids == [f"{prefix}:{song}" for song in songs]
+        assert result.missing == 0
+    # The preference of a call never leaks into the wrapper
+    assert spotify.choose_new_version is False
+    assert spotify.song_ids == []
+    assert spotify.request_count == 40
+
+
+def test_wrappers_do_not_share_state():
+    first = SetlistFmWrapper("key", limiter=NoLimit())
+    second = SetlistFmWrapper("key", limiter=NoLimit())
+    first.possible_artists.append({"name": "Band", "mbid": "mbid"})
+    first.pick_artist(1)
+    first.possible_sets.append({"id": "set"})
+
+    assert second.possible_artists == [] and second.possible_sets == []
+    assert second.artist_info == {} and second.get_artist_id() == ""
+
+    spotify = SpotifyWrapper("client", "secret", limiter=NoLimit())
+    spotify.song_ids.append("spotify:track:a")
+    assert SpotifyWrapper("client", "secret", limiter=NoLimit()).song_ids == []
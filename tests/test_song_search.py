@@ -0,0 +1,104 @@
+"""
+    Tests for the tiered Spotify song search
+"""
+import datetime
+
+import pytest
+
+from fakes import FakeSession
+from spotify_wrapper import SpotifyWrapper
+from transport import NoLimit
+
+SEARCH_PATH = "/v1/search"
+
+
+def make_spotify(search, market=None):
+    """
+    Returns a wrapper with a valid token whose searches are answered by search
+    """
+    spotify = SpotifyWrapper("client", "secret", limiter=NoLimit(), market=market)
+    spotify.session = FakeSession({("GET", SEARCH_PATH): search})
+    spotify.access_token = "token"
+    spotify.access_token_expiration = datetime.datetime.now() + datetime.timedelta(hours=1)
+    spotify.access_token_is_expired = False
+    return spotify
+
+
+def track(name, artist="Band", uri=None):
+    """
+    Returns a search result track
+    """
+    return {"name": name, "uri": uri or f"spotify:track:{name}",
+            "artists": [{"name": artist}],
+            "album": {"name": "Album", "release_date": "2001",
+                      "release_date_precision": "year"}}
+
+
+def answers(by_tier):
+    """
+    Returns a search handler answering each tier's query with its tracks
+    """
+    def search(url, params, kwargs):
+        query = params["q"]
+        if query.startswith("track:"):
+            tier = "fielded"
+        elif 'artist:"' in query:
+            tier = "artist_field"
+        else:
+            tier = "free_text"
+        return {"tracks": {"items": by_tier.get(tier, []), "next": None}}
+    return search
+
+
+@pytest.fixture
+def in_tmp(monkeypatch, tmp_path):
+    """
+    Runs the test in a directory with a logs folder for unmatched searches
+    """
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "logs").mkdir()
+    return tmp_path
+
+
+def test_search_params_per_tier():
+    spotify = make_spotify(None, market="DE")
+    fielded = spotify.get_search_params('Say "Hi"', "Band", "fielded")
+    assert fielded == {"q": 'track:"Say Hi" artist:"Band"', "type": "track",
+                       "limit": 50, "market": "DE"}
+    assert spotify.get_search_params("Song", "Band", "artist_field")["q"] == \
+        'Song artist:"Band"'
+    free = spotify.get_search_params("Song", "Band", offset=50, market="US")
+    assert free["q"] == "Band Song"
+    assert free["offset"] == 50 and free["market"] == "US"
+
+
+def test_precise_match_takes_one_request():
+    spotify = make_spotify(answers({"fielded": [track("Song")]}))
+    assert spotify.search_song("Song", "Band") == ("spotify:track:Song", "fielded")
+    assert spotify.session.count("GET", SEARCH_PATH) == 1
+
+
+def test_looser_tiers_only_when_needed():
+    spotify = make_spotify(answers({"free_text": [track("Song (Live)", uri="live"),
+                                                  track("Song")]}))
+    assert spotify.search_song("Song", "Band") == ("spotify:track:Song", "free_text")
+    assert spotify.session.count("GET", SEARCH_PATH) == 3
+
+
+def test_artist_only_match_is_a_fallback(in_tmp):
+    spotify = make_spotify(answers({"artist_field": [track("Other Song")],
+                                    "free_text": [track("Song", artist="Cover Band")]}))
+    assert spotify.search_song("Song", "Band") == \
+        ("spotify:track:Other Song", "artist_field (artist only)")
+
+
+def test_missing_song_is_logged(in_tmp):
+    spotify = make_spotify(answers({}))
+    assert spotify.search_song("Song", "Band") == (None, None)
+    assert (in_tmp / "logs" / "Band-Song.json").exists()
+
+
+def test_failed_search_is_not_a_miss():
+    spotify = make_spotify(lambda url, params, kwargs: (404, {}))
+    assert spotify.search_song("Song", "Band") is None
+    assert spotify.resolve_song("Song", "Band") == (None, None)
@@ -0,0 +1,154 @@
+"""
+    Tests for making playlists with a shared Spotify wrapper
+"""
+import json
+import datetime
+import itertools
+import threading
+import time
+
+from fakes import FakeSession
+from spotify_wrapper import SpotifyWrapper
+from transport import NoLimit
+
+
+def make_spotify(routes):
+    """
+    Returns a wrapper with a valid user token that sends through a fake session
+    """
+    spotify = SpotifyWrapper("client", "secret", limiter=NoLimit())
+    spotify.session = FakeSession(routes)
+    spotify.access_token = "token"
+    spotify.access_token_expiration = datetime.datetime.now() + datetime.timedelta(hours=1)
+    spotify.access_token_is_expired = False
+    spotify.user_authorized = True
+    return spotify
+
+
+def track(uri, isrc=None, playable=True):
+    """
+    Returns a track object as /v1/tracks sends it
+    """
+    return {"uri": uri, "is_playable": playable,
+            "external_ids": {"isrc": isrc or f"isrc-{uri}"}}
+
+
+def playlist_routes(added):
+    """
+    Returns routes for making playlists, recording the songs added to each
+    """
+    ids = itertools.count(1)
+
+    def create(url, params, kwargs):
+        # Let the other thread create its playlist in between
+        time.sleep(0.05)
+        playlist_id = f"list-{next(ids)}"
+        return {"id": playlist_id,
+                "external_urls": {"spotify": f"https://open.spotify.com/{playlist_id}"}}
+
+    def add(url, params, kwargs):
+        playlist_id = url.split("/")[-2]
+        added.setdefault(playlist_id, []).extend(json.loads(kwargs["data"]))
+        return 201, {"snapshot_id": "s"}
+
+    def tracks(url, params, kwargs):
+        return {"tracks": [track(f"spotify:track:{track_id}")
+                           for track_id in params["ids"].split(",")]}
+
+    routes = {
+        ("GET", "/v1/me"): lambda url, params, kwargs: {"id": "user"},
+        ("POST", "/v1/users/user/playlists"): create,
+        ("GET", "/v1/tracks"): tracks
+    }
+    for number in (1, 2):
+        routes[("POST", f"/v1/playlists/list-{number}/tracks")] = add
+    return routes
+
+
+def test_concurrent_playlists_get_their_own_songs():
+    added = {}
+    spotify = make_spotify(playlist_routes(added))
+    songs = {"first": ["spotify:track:a", "spotify:track:b"],
+             "second": ["spotify:track:c"]}
+
+    threads = [threading.Thread(target=spotify.create_playlist, args=(name, "", uris))
+               for name, uris in songs.items()]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(added.values()) == sorted(songs.values())
+
+
+def test_created_playlist_id_is_returned_not_stored():
+    spotify = make_spotify(playlist_routes({}))
+
+    playlist_id, url = spotify.create_empty_playlist("name", "desc")
+
+    assert playlist_id == "list-1"
+    assert url.endswith("list-1")
+    assert not hasattr(spotify, "playlist_id")
+
+
+def tracks_route(catalog):
+    """
+    Returns a /v1/tracks handler answering from a dict of track id to track,
+    or None for ids Spotify does not know
+    """
+    def tracks(url, params, kwargs):
+        return {"tracks": [catalog.get(track_id) for track_id in params["ids"].split(",")]}
+    return tracks
+
+
+CATALOG = {
+    "a": track("spotify:track:a", "AAA"),
+    "b": track("spotify:track:b", "BBB"),
+    "b2": track("spotify:track:b2", "BBB"),
+    "c": track("spotify:track:c", "CCC"),
+    "gone": track("spotify:track:gone", "GGG", playable=False)
+}
+
+
+def test_song_played_twice_is_kept():
+    spotify = make_spotify({("GET", "/v1/tracks"): tracks_route(CATALOG)})
+    uris = ["spotify:track:a", "spotify:track:bad", "spotify:track:a", "spotify:track:c"]
+
+    assert spotify.validate_tracks(uris) == \
+        ["spotify:track:a", "spotify:track:a", "spotify:track:c"]
+    assert spotify.validate_tracks(uris, ["Intro", "Missing", "Intro (Reprise)", "Song"]) == \
+        ["spotify:track:a", "spotify:track:a", "spotify:track:c"]
+
+
+def test_different_songs_matched_to_one_recording_keep_the_first():
+    spotify = make_spotify({("GET", "/v1/tracks"): tracks_route(CATALOG)})
+
+    # Two uris of the same recording
+    assert spotify.validate_tracks(["spotify:track:b", "spotify:track:b2"]) == \
+        ["spotify:track:b"]
+    # One uri found for two different songs
+    assert spotify.validate_tracks(["spotify:track:a", "spotify:track:a"],
+                                   ["First Song", "Other Song"]) == ["spotify:track:a"]
+
+
+def test_unplayable_tracks_are_dropped():
+    spotify = make_spotify({("GET", "/v1/tracks"): tracks_route(CATALOG)})
+
+    assert spotify.validate_tracks(["spotify:track:gone", "spotify:track:c"]) == \
+        ["spotify:track:c"]
+
+
+def test_tracks_are_checked_in_batches():
+    catalog = {f"t{num}": track(f"spotify:track:t{num}") for num in range(120)}
+    spotify = make_spotify({("GET", "/v1/tracks"): tracks_route(catalog)})
+    uris = [f"spotify:track:t{num}" for num in range(120)]
+
+    assert spotify.validate_tracks(uris) == uris
+    assert spotify.session.count("GET", "/v1/tracks") == 3
+
+
+def test_failed_lookup_keeps_songs():
+    spotify = make_spotify({("GET", "/v1/tracks"): lambda url, params, kwargs: (404, {})})
+    uris = ["spotify:track:a", "spotify:track:a"]
+
+    assert spotify.validate_tracks(uris) == uris
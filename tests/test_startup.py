@@ -0,0 +1,81 @@
+"""
+    Tests for overlapping startup work with the first prompts
+"""
+import os
+import sys
+import time
+import subprocess
+
+from requests.exceptions import ConnectionError
+
+import playlist_gen
+from fakes import FakeSession
+from spotify_wrapper import SpotifyWrapper
+from transport import NoLimit
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOKEN_PATH = "/api/token"
+
+
+def test_first_prompt_needs_no_http_stack():
+    script = ("import sys, playlist_gen; "
+              "print(sorted({'requests', 'spotify_wrapper', 'setlist_fm_wrapper'} "
+              "& set(sys.modules)))")
+    output = subprocess.run([sys.executable, "-c", script], cwd=REPO,
+                            capture_output=True, text=True, check=True).stdout
+    assert output.strip() == "[]"
+
+
+def make_spotify(token):
+    """
+    Returns a wrapper whose token requests are answered by token
+    """
+    spotify = SpotifyWrapper("client", "secret", limiter=NoLimit())
+    spotify.session = FakeSession({("POST", TOKEN_PATH): token})
+    return spotify
+
+
+def test_prefetched_token_is_awaited_not_requested_again():
+    def token(url, params, kwargs):
+        time.sleep(0.2)
+        return {"access_token": "cc", "expires_in": 3600}
+
+    spotify = make_spotify(token)
+    start = time.monotonic()
+    thread = spotify.prefetch_token()
+    assert time.monotonic() - start < 0.1
+
+    spotify.ensure_token()
+    assert spotify.access_token == "cc"
+    assert spotify.session.count("POST", TOKEN_PATH) == 1
+    thread.join()
+
+
+def test_failed_prefetch_is_retried_when_needed():
+    answers = []
+
+    def token(url, params, kwargs):
+        answers.append(url)
+        if len(answers) == 1:
+            raise ConnectionError("offline")
+        return {"access_token": "cc", "expires_in": 3600}
+
+    spotify = make_spotify(token)
+    spotify.prefetch_token().join()
+    assert spotify.access_token is None
+
+    spotify.ensure_token()
+    assert spotify.access_token == "cc"
+
+
+def test_make_clients_loads_caches_and_starts_the_token(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    started = []
+    monkeypatch.setattr(SpotifyWrapper, "prefetch_token",
+                        lambda self: started.append(self))
+
+    setlist, spotify = playlist_gen.make_clients("key", "client", "secret", "DE", None)
+    assert started == [spotify]
+    assert spotify.market == "DE" and spotify.song_cache.path == "cache/songs.json"
+    assert setlist.setlist_store.directory == "cache/setlists"
+    assert setlist.artist_index is not None
@@ -0,0 +1,127 @@
+"""
+    Tests for choosing between versions of a song
+"""
+import datetime
+
+from fakes import FakeSession
+from spotify_wrapper import SpotifyWrapper, TrackRanker, parse_release_date
+from transport import NoLimit
+
+SEARCH_PATH = "/v1/search"
+
+
+def track(uri, name="Song", album="Album", release_date="2001-05-17",
+          artists=("Band",)):
+    """
+    Returns a search result track
+    """
+    precision = {1: "year", 2: "month", 3: "day"}[len(release_date.split("-"))]
+    return {"uri": uri, "name": name, "artists": [{"name": art} for art in artists],
+            "album": {"name": album, "release_date": release_date,
+                      "release_date_precision": precision}}
+
+
+def best(tracks, newest):
+    """
+    Returns the uri of the track a ranker picks from one page
+    """
+    ranker = TrackRanker("Song", "Band", newest)
+    ranker.add(tracks)
+    return ranker.best["uri"]
+
+
+def test_parse_release_date():
+    assert parse_release_date("2011") == (2011, 0, 0)
+    assert parse_release_date("2011-05") == (2011, 5, 0)
+    assert parse_release_date("2011-05-17") == (2011, 5, 17)
+
+
+def test_main_artist_and_studio_versions_win():
+    featured = track("featured", artists=("Guest", "Band"))
+    live = track("live", name="Song - Live")
+    live_album = track("live-album", album="Live in Chicago")
+    studio = track("studio", release_date="1990")
+    for newest in (True, False):
+        assert best([featured, live, live_album, studio], newest) == "studio"
+    assert best([featured, live], True) == "live"
+
+
+def test_remasters_and_dates_follow_the_preference():
+    first = track("first", release_date="1990")
+    later = track("later", release_date="2005")
+    remaster = track("remaster", name="Song - 2015 Remaster", release_date="2015")
+    assert best([first, later, remaster], newest=True) == "remaster"
+    assert best([first, later, remaster], newest=False) == "first"
+    assert best([first, later], newest=True) == "later"
+
+
+def test_more_precise_dates_break_ties():
+    # Both dates parse to (2001, 0, 0)
+    vague = track("vague", release_date="2001")
+    exact = track("exact", release_date="2001-00-00")
+    assert best([vague, exact], newest=True) == "exact"
+    assert best([vague, exact], newest=False) == "exact"
+
+
+def test_rival_versions_keep_the_ranker_undecided():
+    ranker = TrackRanker("Song", "Band", True)
+    ranker.add([track("other", name="Other Song")])
+    assert ranker.found_artist() and not ranker.decided()
+
+    ranker.add([track("live", name="Song (Live)")])
+    assert not ranker.decided()
+
+    ranker.add([track("one", release_date="1990"), track("two", release_date="2005")])
+    assert ranker.contested and not ranker.decided()
+
+    ranker.add([track("cover", artists=("Someone",))])
+    assert ranker.best["uri"] == "two" and ranker.decided()
+
+
+def make_spotify(pages):
+    """
+    Returns a wrapper whose searches page through pages
+    """
+    def search(url, params, kwargs):
+        page_num = params.get("offset", 0) // 50
+        return {"tracks": {"items": pages[page_num],
+                           "next": "more" if page_num + 1 < len(pages) else None}}
+
+    spotify = SpotifyWrapper("client", "secret", limiter=NoLimit())
+    spotify.session = FakeSession({("GET", SEARCH_PATH): search})
+    spotify.access_token = "token"
+    spotify.access_token_expiration = datetime.datetime.now() + datetime.timedelta(hours=1)
+    spotify.access_token_is_expired = False
+    return spotify
+
+
+def offsets(spotify):
+    """
+    Returns the offsets of every search a wrapper sent
+    """
+    return [kwargs["params"].get("offset", 0) for _, url, kwargs in spotify.session.requests
+            if url.endswith(SEARCH_PATH)]
+
+
+def test_search_stops_once_decided():
+    spotify = make_spotify([[track("only")], [track("newer", release_date="2020")]])
+    assert spotify.search_song("Song", "Band", newest=True) == ("only", "fielded")
+    assert offsets(spotify) == [0]
+
+
+def test_search_pages_while_contested():
+    spotify = make_spotify([
+        [track("one", release_date="1990"), track("two", release_date="2000")],
+        [track("three", release_date="2010"), track("four", release_date="2005")],
+        [track("five", release_date="2020"), track("six", release_date="1980")],
+        [track("seven", release_date="2030")]])
+    assert spotify.search_song("Song", "Band", newest=True) == ("five", "fielded")
+    # The last page is never asked for as search_pages is reached
+    assert offsets(spotify) == [0, 50, 100]
+
+
+def test_search_stops_when_results_run_out():
+    spotify = make_spotify([[track("one", release_date="1990"),
+                             track("two", release_date="2000")]])
+    assert spotify.search_song("Song", "Band", newest=False) == ("one", "fielded")
+    assert offsets(spotify) == [0]
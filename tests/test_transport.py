@@ -0,0 +1,108 @@
+"""
+    Tests for recording and replaying runs
+"""
+import gzip
+import json
+import itertools
+
+import pytest
+from requests.exceptions import ConnectionError as RequestsConnectionError
+
+import transport
+from fakes import FakeSession
+from request_guard import RequestGuard
+from setlist_fm_wrapper import SetlistFmWrapper
+from spotify_wrapper import SpotifyWrapper
+
+SEARCH_URL = "https://api.setlist.fm/rest/1.0/search/artists"
+
+
+def test_token_and_profile_bodies_are_redacted():
+    token = json.dumps({"access_token": "secret", "refresh_token": "also secret",
+                        "expires_in": 3600}).encode()
+    profile = json.dumps({"id": "user", "email": "me@example.com",
+                          "display_name": "Me", "country": "US"}).encode()
+    search = b'{"tracks": {"items": []}}'
+
+    assert json.loads(transport.redact_body("https://accounts.spotify.com/api/token", token)) \
+        == {"access_token": "redacted", "refresh_token": "redacted", "expires_in": 3600}
+    assert json.loads(transport.redact_body("https://api.spotify.com/v1/me", profile)) \
+        == {"id": "user"}
+    assert transport.redact_body("https://api.spotify.com/v1/search", search) == search
+    assert transport.redact_body("https://api.spotify.com/v1/me", b"not json") == b"not json"
+
+
+def record(path, routes, calls):
+    """
+    Records calls(wrapper) against a fake API into a cassette
+    """
+    setlist = SetlistFmWrapper("key", limiter=transport.NoLimit())
+    setlist.session = FakeSession(routes)
+    transport.install([setlist], "record", str(path))
+    return calls(setlist)
+
+
+def replay(path, calls):
+    """
+    Replays calls(wrapper) from a cassette
+    """
+    setlist = SetlistFmWrapper("key")
+    transport.install([setlist], "replay", str(path))
+    return calls(setlist)
+
+
+def artist_searches(setlist):
+    """
+    Searches the same name three times and another name once
+    """
+    names = ["Low", "Low", "Low", "Radiohead"]
+    return [setlist.send_request("GET", SEARCH_URL, params={"artistName": name}).json()
+            for name in names]
+
+
+def test_replay_returns_recorded_responses_in_order(tmp_path):
+    path = tmp_path / "run.jsonl.gz"
+    counter = itertools.count()
+    routes = {("GET", "/rest/1.0/search/artists"):
+              lambda url, params, kwargs: {"name": params["artistName"], "n": next(counter)}}
+
+    recorded = record(path, routes, artist_searches)
+    replayed = replay(path, artist_searches)
+
+    assert replayed == recorded
+    with gzip.open(path, "rt") as cassette:
+        assert len(cassette.readlines()) == 4
+    # Once a request's entries run out, its last response is reused
+    assert replay(path, lambda setlist: setlist.send_request(
+        "GET", SEARCH_URL, params={"artistName": "Radiohead"}).json()) == recorded[3]
+
+
+def test_unrecorded_request_fails_like_a_network_error(tmp_path):
+    path = tmp_path / "run.jsonl.gz"
+    record(path, {("GET", "/rest/1.0/search/artists"): lambda url, params, kwargs: {}},
+           lambda setlist: setlist.send_request("GET", SEARCH_URL, params={"artistName": "A"}))
+
+    with pytest.raises(RequestsConnectionError):
+        replay(path, lambda setlist: setlist.send_request("GET", SEARCH_URL,
+                                                          params={"artistName": "B"}))
+
+
+def test_recorded_and_replayed_runs_never_hedge(tmp_path, monkeypatch):
+    def no_hedging(self, send, limiter=None):
+        raise AssertionError("request was hedged")
+    monkeypatch.setattr(RequestGuard, "hedged", no_hedging)
+    path = tmp_path / "run.jsonl.gz"
+    routes = {("GET", "/rest/1.0/search/artists"): lambda url, params, kwargs: {"ok": True}}
+
+    record(path, routes, artist_searches)
+    replay(path, artist_searches)
+
+    wrappers = [SetlistFmWrapper("key"), SpotifyWrapper("id", "secret")]
+    transport.install(wrappers, "replay", str(path))
+    assert not any(wrapper.hedge_requests for wrapper in wrappers)
+    assert SetlistFmWrapper.hedge_requests
+
+
+def test_unknown_mode_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        transport.install([SetlistFmWrapper("key")], "rewind", str(tmp_path / "x"))
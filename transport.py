@@ -0,0 +1,289 @@
+"""
+    Recording and replaying HTTP exchanges for offline runs
+"""
+import gzip
+import json
+import time
+import base64
+import threading
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+def request_key(method, url, params=None):
+    """
+    Returns the key an exchange is recorded under: the method and the full
+    url with its query parameters. Headers and bodies are left out so no
+    credentials end up in the cassette.
+    """
+    prepared = requests.Request(method, url, params=params).prepare()
+    return f"{method.upper()} {prepared.url}"
+
+
+class Cassette:
+    """
+    A gzip file of recorded exchanges, one JSON object per line
+
+    Attributes
+    ----------
+    path: str
+        the cassette file
+    entries: dict
+        the recorded exchanges for each request key, in recorded order
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = defaultdict(list)
+        self.lock = threading.Lock()
+
+    def load(self):
+        """
+        Reads every exchange in the cassette
+        """
+        with gzip.open(self.path, "rt", encoding="utf-8") as cassette_file:
+            for line in cassette_file:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.entries[entry["key"]].append(entry)
+        return self
+
+    def append(self, entry):
+        """
+        Adds an exchange, writing it to the end of the cassette right away so
+        a crashed run keeps what it recorded
+        """
+        with self.lock:
+            self.entries[entry["key"]].append(entry)
+            # Every append adds a gzip member, which readers treat as one stream
+            with gzip.open(self.path, "at", encoding="utf-8") as cassette_file:
+                cassette_file.write(json.dumps(entry) + "\n")
+
+
+# Response fields that hold secrets or personal data, by url path. Tokens are
+# replaced with a placeholder and other fields dropped; anything not listed
+# here, such as search results, is recorded as is.
+TOKEN_FIELDS = ("access_token", "refresh_token")
+REDACTED_PATHS = {
+    "/api/token": {"replace": TOKEN_FIELDS},
+    "/v1/me": {"keep": ("id", "type", "uri")}
+}
+
+
+def redact_body(url, content):
+    """
+    Returns a response body with secrets and personal data removed, so they
+    never reach the cassette
+    """
+    rules = REDACTED_PATHS.get(urlsplit(url).path)
+    if rules is None:
+        return content
+    try:
+        body = json.loads(content)
+    except ValueError:
+        return content
+    if not isinstance(body, dict):
+        return content
+
+    if "keep" in rules:
+        body = {field: value for field, value in body.items() if field in rules["keep"]}
+    for field in rules.get("replace", ()):
+        if field in body:
+            body[field] = "redacted"
+    return json.dumps(body).encode("utf-8")
+
+
+def encode_body(content):
+    """
+    Returns a response body in a form that fits in JSON
+    """
+    try:
+        return {"text": content.decode("utf-8")}
+    except UnicodeDecodeError:
+        return {"base64": base64.b64encode(content).decode("ascii")}
+
+
+def decode_body(body):
+    """
+    Returns the bytes of a body stored by encode_body
+    """
+    if "base64" in body:
+        return base64.b64decode(body["base64"])
+    return body["text"].encode("utf-8")
+
+
+class RecordingSession:
+    """
+    Wraps a requests.Session, writing every exchange to a cassette
+
+    Attributes
+    ----------
+    session: requests.Session
+        the session that sends the requests
+    cassette: Cassette
+        where exchanges are recorded
+    """
+
+    def __init__(self, session, cassette):
+        self.session = session
+        self.cassette = cassette
+
+    def request(self, method, url, **kwargs):
+        """
+        Sends a request and records the response
+        """
+        response = self.session.request(method, url, **kwargs)
+        # Reading the body keeps it available to streaming callers
+        content = response.content
+        self.cassette.append({
+            "key": request_key(method, url, kwargs.get("params")),
+            "url": response.url,
+            "status": response.status_code,
+            "reason": response.reason,
+            "headers": dict(response.headers),
+            "body": encode_body(redact_body(url, content)),
+            "elapsed": response.elapsed.total_seconds()
+        })
+        return response
+
+    def mount(self, prefix, adapter):
+        """
+        Mounts a connection adapter on the wrapped session
+        """
+        self.session.mount(prefix, adapter)
+
+    def close(self):
+        """
+        Closes the wrapped session
+        """
+        self.session.close()
+
+
+class ReplaySession:
+    """
+    Answers requests from a cassette instead of the network
+
+    Repeated requests get the recorded responses in order; once only the last
+    one is left it is reused, so extra retries still get an answer. install
+    turns hedging off, so every request takes exactly one entry.
+
+    Attributes
+    ----------
+    cassette: Cassette
+        the recorded exchanges
+    latency: float or str
+        seconds to wait before each response, or "recorded" to wait as long as
+        the original request took
+    """
+
+    def __init__(self, cassette, latency=0.0):
+        self.cassette = cassette
+        self.latency = latency
+        self.lock = threading.Lock()
+
+    def next_entry(self, key):
+        """
+        Returns the next recorded exchange for a request key
+        """
+        with self.lock:
+            queue = self.cassette.entries.get(key)
+            if not queue:
+                raise requests.exceptions.ConnectionError(
+                    f"No recorded response for {key}")
+            if len(queue) > 1:
+                return queue.pop(0)
+            return queue[0]
+
+    def request(self, method, url, **kwargs):
+        """
+        Returns the recorded response for a request
+        """
+        entry = self.next_entry(request_key(method, url, kwargs.get("params")))
+
+        delay = entry["elapsed"] if self.latency == "recorded" else self.latency
+        if delay:
+            time.sleep(delay)
+
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.reason = entry["reason"]
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        response.url = entry["url"]
+        response._content = decode_body(entry["body"])
+        response._content_consumed = True
+        return response
+
+    def mount(self, prefix, adapter):
+        """
+        Replays need no connections
+        """
+
+    def close(self):
+        """
+        Replays need no connections
+        """
+
+
+class NoLimit:
+    """
+    A stand-in for SharedTokenBucket that never waits, used when replaying
+    """
+
+    def acquire(self):
+        """
+        Returns immediately
+        """
+
+    async def acquire_async(self):
+        """
+        Returns immediately
+        """
+
+    def try_acquire(self):
+        """
+        Always lets a request through
+        """
+        return True
+
+    def report(self, status, retry_after=None):
+        """
+        Ignores the outcome of a request
+        """
+
+
+def install(wrappers, mode, path, latency=0.0):
+    """
+    Switches wrappers to recording or replaying a cassette
+
+    Params
+    ------
+    wrappers: list
+        SetlistFmWrapper and SpotifyWrapper instances
+    mode: str
+        "record" to save every exchange, "replay" to answer from the cassette
+        without touching the network
+    path: str
+        The cassette file
+    latency: float or str
+        For replays, the delay added to each response, or "recorded"
+    """
+    if mode == "record":
+        cassette = Cassette(path)
+        for wrapper in wrappers:
+            wrapper.session = RecordingSession(wrapper.session, cassette)
+    elif mode == "replay":
+        cassette = Cassette(path).load()
+        session = ReplaySession(cassette, latency)
+        for wrapper in wrappers:
+            wrapper.session = session
+            wrapper.limiter = NoLimit()
+    else:
+        raise ValueError(f"Unknown transport mode: {mode}")
+
+    # A hedged duplicate would record a second exchange for one request, or
+    # race the first for the next recorded response, so neither mode hedges
+    for wrapper in wrappers:
+        wrapper.hedge_requests = False